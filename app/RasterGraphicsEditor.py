@@ -1,54 +1,3683 @@
 import tkinter as tk
-from tkinter import messagebox, filedialog, colorchooser
-from tkinter.ttk import Scale, Combobox
-from PIL import Image, ImageTk, ImageGrab
-import random
+from tkinter import messagebox
+from tkinter.ttk import Scale, Combobox, Progressbar
+from PIL import Image, ImageDraw, ImageFont, ImageColor
+import numpy as np
+from collections import OrderedDict, deque
+import argparse
+import bisect
+import concurrent.futures
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+import csv
+import functools
+import importlib.util
+import io
+import itertools
+import json
+import math
+import mmap
+import os
+import queue
+import struct
+import sys
+import tempfile
+import threading
+import time
+import traceback
+import types
+import zlib
+
+try:
+    import resource
+except ImportError:
+    # Модуль resource є лише на Unix; без нього статистика не показує пам'ять процесу
+    resource = None
+
+
+# Функція для відкладеного імпорту модуля: модуль виконується під час першого звернення до його атрибута.
+# Батьківський пакет модуля імпортується одразу, тож відкладати варто лише модулі вже завантажених пакетів
+def lazy_import(name):
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+    spec = importlib.util.find_spec(name)
+    spec.loader = importlib.util.LazyLoader(spec.loader)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+# Модулі, потрібні лише окремим діям: діалоги та показ кадрів. Ними користується лише головний потік Tk,
+# бо LazyLoader у Python 3.11 не захищений від першого звернення до модуля з кількох потоків.
+# Пули процесів створює process_pool, який імпортує multiprocessing звичайним імпортом під час першого виклику
+filedialog = lazy_import("tkinter.filedialog")
+colorchooser = lazy_import("tkinter.colorchooser")
+ImageTk = lazy_import("PIL.ImageTk")
 
 # Цей код реалізує растровий графічний редактор за допомогою бібліотеки Tkinter на мові програмування Python.
 
+# Інструменти, які малюють фігуру перетягуванням від точки натискання до точки відпускання
+SHAPE_TOOLS = ("line", "dashed_line", "rectangle", "triangle", "oval")
+# Довжина штриха та проміжку пунктирної лінії у пікселях
+DASH_PATTERN = (5, 5)
+# Розмір квадратної плитки растрового буфера, якими оперує історія змін
+TILE_SIZE = 64
+# Мінімальний проміжок між кадрами у мілісекундах: зміни буфера переносяться на екран не частіше за 60 Гц
+FRAME_INTERVAL = 16
+# Розширення файлів, у які можна зберегти зображення
+SAVE_FORMATS = ("png", "jpg", "jpeg", "tiff", "gif")
+# Режими накладання шарів та їх назви в інтерфейсі
+BLEND_MODES = {"normal": "Звичайний", "multiply": "Множення", "screen": "Освітлення", "overlay": "Перекриття"}
+
+
+# Функція для обчислення цілочисельного прямокутника навколо точок [x0, y0, x1, y1, ...] з відступом pad
+def bounding_box(points, pad=0):
+    xs = points[0::2]
+    ys = points[1::2]
+    return (math.floor(min(xs) - pad), math.floor(min(ys) - pad),
+            math.ceil(max(xs) + pad) + 1, math.ceil(max(ys) + pad) + 1)
+
+
+# Функція для точок фігури tool, намальованої перетягуванням від (x0, y0) до (x1, y1):
+# для трикутника - три вершини, для решти фігур - початок і кінець перетягування
+def shape_points(tool, x0, y0, x1, y1):
+    if tool == "triangle":
+        return (x0 + x1) / 2, y0, x1, y1, x0, y1
+    return x0, y0, x1, y1
+
+
+# Функція для проріджування точок штриха алгоритмом Рамера-Дугласа-Пекера.
+# Точки передаються плоским списком [x0, y0, x1, y1, ...], tolerance - допустиме відхилення у пікселях.
+def simplify_stroke(points, tolerance):
+    xy = np.asarray(points, dtype=float).reshape(-1, 2)
+    if len(xy) < 3 or tolerance <= 0:
+        return list(points)
+    keep = np.zeros(len(xy), dtype=bool)
+    keep[0] = keep[-1] = True
+    # Стек замість рекурсії, щоб довгі штрихи не впирались у глибину рекурсії
+    stack = [(0, len(xy) - 1)]
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+        start = xy[first]
+        dx, dy = xy[last] - start
+        inner = xy[first + 1:last] - start
+        length = np.hypot(dx, dy)
+        if length:
+            distances = np.abs(dx * inner[:, 1] - dy * inner[:, 0]) / length
+        else:
+            distances = np.hypot(inner[:, 0], inner[:, 1])
+        index = int(distances.argmax())
+        if distances[index] > tolerance:
+            index += first + 1
+            keep[index] = True
+            stack.append((first, index))
+            stack.append((index, last))
+    return xy[keep].ravel().tolist()
+
+
+# Клас FloodFillEngine відповідає за заливку замкненої області растрового буфера.
+# Область шукається по рядкових відрізках (спанах): маска схожих пікселів розбивається на відрізки,
+# сусідні відрізки з'єднуються, а компоненти зв'язності знаходяться векторно через NumPy.
+
+
+class FloodFillEngine:
+    # Кількість вікон, у яких шукається область, перш ніж шукати її на всьому зображенні
+    max_windows = 3
+
+    def __init__(self, tolerance=0, connectivity=4):
+        # Допустима різниця кожного каналу кольору та зв'язність (4 або 8 сусідів)
+        self.tolerance = tolerance
+        self.connectivity = connectivity
+
+    # Метод для заливки області, що містить точку (x, y); повертає змінений прямокутник або None.
+    # before_change викликається з прямокутником області до того, як пікселі будуть змінені;
+    # windows - прямокутники навколо точки (наприклад, межі замкнених фігур), де область шукається спершу
+    def fill(self, image, x, y, color, before_change=None, windows=()):
+        pixels = np.asarray(image)
+        color = ImageColor.getcolor(color, image.mode)
+        if (pixels[y, x] == color).all():
+            return None
+        box, mask = self.bounded_region(pixels, x, y, windows)
+        if before_change:
+            before_change(box)
+        image.paste(color, box, None if mask.all() else Image.fromarray(mask.astype(np.uint8) * 255))
+        return box
+
+    # Метод для пошуку області: повертає прямокутник області та маску пікселів у ньому
+    def region(self, pixels, x, y):
+        height, width = pixels.shape[:2]
+        # Маска схожих пікселів рахується поканально: так NumPy не створює проміжних копій усього буфера
+        similar = np.ones((height, width), dtype=bool)
+        for channel, value in enumerate(pixels[y, x].tolist()):
+            plane = pixels[..., channel]
+            if self.tolerance:
+                similar &= plane >= max(0, value - self.tolerance)
+                similar &= plane <= min(255, value + self.tolerance)
+            else:
+                similar &= plane == value
+        rows, starts, ends = self.spans(similar)
+        labels = self.components(rows, starts, ends, width)
+        seed_span = np.flatnonzero((rows == y) & (starts <= x) & (ends > x))[0]
+        selected = labels == labels[seed_span]
+        rows, starts, ends = rows[selected], starts[selected], ends[selected]
+        x0, y0, x1, y1 = int(starts.min()), int(rows.min()), int(ends.max()), int(rows.max()) + 1
+        # Маска області будується з відрізків через накопичувальну суму міток початку і кінця
+        marks = np.zeros((y1 - y0, x1 - x0 + 1), dtype=np.int8)
+        marks[rows - y0, starts - x0] = 1
+        marks[rows - y0, ends - x0] = -1
+        mask = marks.cumsum(axis=1, dtype=np.int8)[:, :-1] > 0
+        return (x0, y0, x1, y1), mask
+
+    # Метод для пошуку області спершу у вікнах windows. Область, яка не дістає до країв вікна всередині зображення,
+    # збігається з областю на всьому зображенні; інакше береться наступне вікно, а далі все зображення
+    def bounded_region(self, pixels, x, y, windows=()):
+        height, width = pixels.shape[:2]
+        for window in itertools.islice(windows, self.max_windows):
+            x0, y0 = max(0, math.floor(window[0])), max(0, math.floor(window[1]))
+            x1, y1 = min(width, math.ceil(window[2]) + 1), min(height, math.ceil(window[3]) + 1)
+            if (x0, y0, x1, y1) == (0, 0, width, height):
+                break
+            if not (x0 <= x < x1 and y0 <= y < y1):
+                continue
+            (bx0, by0, bx1, by1), mask = self.region(pixels[y0:y1, x0:x1], x - x0, y - y0)
+            if ((bx0 > 0 or x0 == 0) and (by0 > 0 or y0 == 0)
+                    and (bx1 < x1 - x0 or x1 == width) and (by1 < y1 - y0 or y1 == height)):
+                return (bx0 + x0, by0 + y0, bx1 + x0, by1 + y0), mask
+        return self.region(pixels, x, y)
+
+    # Метод для розбиття маски на горизонтальні відрізки [start, end) у кожному рядку
+    @staticmethod
+    def spans(mask):
+        padded = np.zeros((mask.shape[0], mask.shape[1] + 2), dtype=np.int8)
+        padded[:, 1:-1] = mask
+        edges = np.diff(padded, axis=1)
+        rows, starts = np.nonzero(edges == 1)
+        _, ends = np.nonzero(edges == -1)
+        return rows, starts, ends
+
+    # Метод для знаходження компонент зв'язності відрізків; повертає мітку компоненти для кожного відрізка
+    def components(self, rows, starts, ends, width):
+        # Відрізки впорядковані за рядком і початком, тому сусіди відрізка у наступному рядку
+        # утворюють неперервний діапазон, який знаходиться бінарним пошуком
+        stride = width + 2
+        diagonal = 1 if self.connectivity == 8 else 0
+        start_keys = rows * stride + starts
+        end_keys = rows * stride + ends
+        first = np.searchsorted(end_keys, (rows + 1) * stride + starts - diagonal, side="right")
+        last = np.searchsorted(start_keys, (rows + 1) * stride + ends + diagonal, side="left")
+        counts = np.maximum(last - first, 0)
+        upper = np.repeat(np.arange(len(rows)), counts)
+        lower = np.repeat(first - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+        # Об'єднання компонент: корені чіпляються до меншого сусіднього кореня, потім дерева стискаються
+        parent = np.arange(len(rows))
+        while True:
+            a, b = parent[upper], parent[lower]
+            changed = a != b
+            if not changed.any():
+                return parent
+            np.minimum.at(parent, np.maximum(a, b)[changed], np.minimum(a, b)[changed])
+            while True:
+                grandparent = parent[parent]
+                if (grandparent == parent).all():
+                    break
+                parent = grandparent
+
+
+# Клас SprayEngine відповідає за розпилювач: кожна порція крапель генерується одним пакетом NumPy.
+
+
+class SprayEngine:
+    def __init__(self, density=30, gaussian=False, seed=None):
+        # Кількість крапель за одну подію руху та розподіл крапель (рівномірний у колі або нормальний)
+        self.density = density
+        self.gaussian = gaussian
+        self.rng = np.random.default_rng(seed)
+
+    # Метод для генерування порції крапель навколо (x, y); повертає масив цілих координат розміром density x 2
+    def burst(self, x, y, radius):
+        if self.gaussian:
+            offsets = self.rng.normal(0, radius / 2, size=(self.density, 2))
+        else:
+            angles = self.rng.uniform(0, 2 * np.pi, self.density)
+            distances = radius * np.sqrt(self.rng.random(self.density))
+            offsets = np.column_stack((np.cos(angles), np.sin(angles))) * distances[:, None]
+        return np.rint(offsets + (x, y)).astype(np.intp)
+
+
+# Клас BrushEngine відповідає за растровий пензель олівця та гумки. Уздовж штриха з кроком, пропорційним розміру,
+# ставляться відбитки зі згладженою маскою; маски обчислюються наперед і кешуються за розміром, жорсткістю
+# та зсувом центру всередині пікселя, а всі відбитки одного відрізка змішуються лише в їхню спільну область.
+
+
+class BrushEngine:
+    # Кількість відбитків відрізка, з якої їх дешевше змішати одним проходом NumPy, ніж по одному
+    vector_dabs = 16
+
+    def __init__(self, hardness=1.0, spacing=0.25, subpixel=4, cache_size=64):
+        # Жорсткість краю (1 - згладжування лише на піксель, 0 - м'який край на весь радіус),
+        # крок між відбитками у частках розміру та кількість положень центру відбитка всередині пікселя
+        self.hardness = hardness
+        self.spacing = spacing
+        self.subpixel = subpixel
+        # Кеш масок за розміром і жорсткістю: маски всіх зсувів центру разом із частками, що лишаються під ними.
+        # Найдавніше використані витісняються
+        self.masks = OrderedDict()
+        self.cache_size = cache_size
+        # Кінець попереднього відрізка штриха та шлях, пройдений після останнього відбитка
+        self.last = None
+        self.carry = 0.0
+
+    # Метод для половини сторони маски: відбиток з будь-яким зсувом центру вміщується у квадрат 2 * half + 1
+    @staticmethod
+    def half(size):
+        return int(size) // 2 + 2
+
+    # Метод для отримання масок відбитка для всіх зсувів центру: покриття (від 0 до 1), частка старого кольору,
+    # що лишається, та її мінус-логарифм; усі масиви мають форму subpixel x subpixel x (2 * half + 1) x (2 * half + 1)
+    def masks_for(self, size, hardness):
+        key = (size, hardness)
+        masks = self.masks.get(key)
+        if masks is not None:
+            self.masks.move_to_end(key)
+            return masks
+        half = self.half(size)
+        offsets = np.arange(-half, half + 1, dtype=np.float32)
+        shifts = np.arange(self.subpixel, dtype=np.float32) / self.subpixel
+        dx = offsets[None, None, None, :] - shifts[None, :, None, None]
+        dy = offsets[None, None, :, None] - shifts[:, None, None, None]
+        radius = size / 2
+        coverage = np.clip((radius + 0.5 - np.hypot(dx, dy)) / (1 + (1 - hardness) * radius), 0, 1)
+        keep = 1 - coverage
+        masks = (coverage.astype(np.float32), keep.astype(np.float32),
+                 -np.log(np.maximum(keep, 1e-6)).astype(np.float32))
+        for array in masks:
+            array.flags.writeable = False
+        self.masks[key] = masks
+        if len(self.masks) > self.cache_size:
+            self.masks.popitem(last=False)
+        return masks
+
+    # Метод для обчислення центрів відбитків уздовж ламаної points; повертає список пар (x, y).
+    # Новий штрих починається відбитком у першій точці, продовження - з кроком від останнього відбитка
+    def dabs(self, points, size, start=False):
+        step = max(0.5, self.spacing * size)
+        # Подія руху зазвичай дає один короткий відрізок, тож звичайна арифметика тут дешевша за NumPy
+        x0, y0 = float(points[0]), float(points[1])
+        if start or (x0, y0) != self.last:
+            positions = [(x0, y0)]
+            carry = 0.0
+        else:
+            positions = []
+            carry = self.carry
+        for i in range(2, len(points) - 1, 2):
+            x1, y1 = float(points[i]), float(points[i + 1])
+            length = math.hypot(x1 - x0, y1 - y0)
+            if length:
+                dx, dy = (x1 - x0) / length, (y1 - y0) / length
+                distance = step - carry
+                while distance <= length + 1e-9:
+                    positions.append((x0 + dx * distance, y0 + dy * distance))
+                    distance += step
+                carry = length - (distance - step)
+            x0, y0 = x1, y1
+        self.last = (x0, y0)
+        self.carry = carry
+        return positions
+
+    # Метод для нанесення відрізків штриха на буфер; color - колір RGBA, прозорий колір стирає до прозорості.
+    # Повертає змінений прямокутник або None; before_change викликається з прямокутником до зміни пікселів
+    def stroke(self, image, points, color, size, start=False, before_change=None):
+        positions = self.dabs(points, size, start)
+        if not positions:
+            return None
+        half = self.half(size)
+        side = 2 * half + 1
+        # Центр кожного відбитка - ціла точка та зсув у частках пікселя
+        dabs = [divmod(round(x * self.subpixel), self.subpixel) + divmod(round(y * self.subpixel), self.subpixel)
+                for x, y in positions]
+        x0 = max(min(dab[0] for dab in dabs) - half, 0)
+        y0 = max(min(dab[2] for dab in dabs) - half, 0)
+        x1 = min(max(dab[0] for dab in dabs) + half + 1, image.width)
+        y1 = min(max(dab[2] for dab in dabs) + half + 1, image.height)
+        if x0 >= x1 or y0 >= y1:
+            return None
+        # Частка старого кольору, що лишається під відбитками: накладання однакового кольору зводиться до добутку
+        box = (x0, y0, x1, y1)
+        masks = self.masks_for(size, self.hardness)
+        if len(dabs) >= self.vector_dabs:
+            remaining = self.accumulate(dabs, masks[2], half, box)
+        else:
+            keep = masks[1]
+            remaining = np.ones((y1 - y0, x1 - x0), dtype=np.float32)
+            for x, fx, y, fy in dabs:
+                left, top = x - half - x0, y - half - y0
+                a, b = max(left, 0), max(top, 0)
+                c, d = min(left + side, x1 - x0), min(top + side, y1 - y0)
+                if a < c and b < d:
+                    remaining[b:d, a:c] *= keep[fy, fx, b - top:d - top, a - left:c - left]
+        if before_change:
+            before_change(box)
+        self.blend(image, box, remaining, color)
+        return box
+
+    # Метод для частки, що лишається під багатьма відбитками dabs (x, fx, y, fy) в області box: замість добутку
+    # сумуються логарифми depth усіх відбитків одним bincount, порціями, щоб індекси не займали забагато пам'яті
+    @staticmethod
+    def accumulate(dabs, depth, half, box):
+        side = 2 * half + 1
+        cells = np.array(dabs)
+        corners = cells[:, [0, 2]] - half
+        left, top = corners.min(axis=0).tolist()
+        corners -= (left, top)
+        width = int(corners[:, 0].max()) + side
+        height = int(corners[:, 1].max()) + side
+        total = np.zeros(width * height)
+        group = max(1, 2 ** 18 // (side * side))
+        for i in range(0, len(cells), group):
+            rows = corners[i:i + group, 1, None] + np.arange(side)
+            columns = corners[i:i + group, 0, None] + np.arange(side)
+            indices = (rows[:, :, None] * width + columns[:, None, :]).ravel()
+            weights = depth[cells[i:i + group, 3], cells[i:i + group, 1]].ravel()
+            total += np.bincount(indices, weights=weights, minlength=total.size)
+        x0, y0, x1, y1 = box
+        return np.exp(-total.reshape(height, width)[y0 - top:y1 - top, x0 - left:x1 - left]).astype(np.float32)
+
+    # Метод для змішування кольору з областю box буфера за часткою remaining старого кольору
+    @staticmethod
+    def blend(image, box, remaining, color):
+        if image.mode == "RGBA" and not color[3]:
+            # Прозорий колір стирає: непрозорість множиться на частку, що лишається
+            region = np.array(image.crop(box))
+            region[..., 3] = np.rint(region[..., 3] * remaining)
+            image.paste(Image.fromarray(region, "RGBA"), box[:2])
+            return
+        mask = Image.frombytes("L", remaining.shape[::-1], np.rint((1 - remaining) * color[3]).astype(np.uint8))
+        if image.mode == "RGBA":
+            # Накладання поверх прозорого шару рахує PIL: колір з непрозорістю маски кладеться зверху
+            layer = Image.new("RGBA", mask.size, color)
+            layer.putalpha(mask)
+            image.alpha_composite(layer, box[:2])
+        else:
+            image.paste(color[:3], box, mask)
+
+
+# Клас HandlerStats накопичує вимірювання одного обробника: кількість викликів, сумарний та найбільший час
+# і гістограму затримок з логарифмічними кошиками, тож пам'ять не залежить від кількості викликів.
+
+
+class HandlerStats:
+    # Кошики гістограми: вісім на кожне подвоєння затримки, від 1 мкс до ~16 с
+    per_octave = 8
+    size = 8 * 24
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.histogram = [0] * self.size
+        # Кількість викликів на початку поточного вікна частоти
+        self.window_count = 0
+
+    # Метод для додавання одного вимірювання у секундах
+    def record(self, seconds):
+        micros = seconds * 1e6
+        index = 0 if micros <= 1 else min(self.size - 1, int(math.log2(micros) * self.per_octave) + 1)
+        self.histogram[index] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    # Метод для верхньої межі кошика index у мікросекундах
+    def bound(self, index):
+        return 2 ** (index / self.per_octave)
+
+    # Метод для оцінки перцентиля q (від 0 до 100) у секундах за гістограмою
+    def percentile(self, q):
+        if not self.count:
+            return 0.0
+        rank = q / 100 * self.count
+        seen = 0
+        for index, count in enumerate(self.histogram):
+            seen += count
+            if count and seen >= rank:
+                return min(self.bound(index) / 1e6, self.max)
+        return self.max
+
+    # Метод для підсумку обробника; rate - частота викликів за останнє вікно
+    def summary(self, rate):
+        return {"count": self.count, "rate": round(rate, 1),
+                "mean_us": round(self.total / self.count * 1e6, 1) if self.count else 0.0,
+                "p50_us": round(self.percentile(50) * 1e6, 1), "p95_us": round(self.percentile(95) * 1e6, 1),
+                "p99_us": round(self.percentile(99) * 1e6, 1), "max_us": round(self.max * 1e6, 1),
+                "histogram": [[round(self.bound(index), 2), count] for index, count in enumerate(self.histogram)
+                              if count]}
+
+
+# Клас Profiler збирає вимірювання гарячих шляхів редактора. Обробники позначаються декоратором profiled;
+# поки збирання вимкнене, обгортка лише перевіряє прапорець, тож накладні витрати майже нульові.
+
+
+class Profiler:
+    def __init__(self):
+        self.enabled = False
+        # Вимірювання можуть надходити з фонових потоків відкриття та збереження
+        self.lock = threading.Lock()
+        self.handlers = {}
+        # Час увімкнення збирання та початку поточного вікна частоти викликів
+        self.started = None
+        self.window_start = None
+
+    # Метод для увімкнення чи вимкнення збирання; накопичені вимірювання зберігаються
+    def set_enabled(self, enabled):
+        if enabled and not self.enabled:
+            self.started = self.window_start = time.perf_counter()
+        self.enabled = enabled
+
+    # Метод для видалення всіх накопичених вимірювань
+    def reset(self):
+        with self.lock:
+            self.handlers = {}
+            self.started = self.window_start = time.perf_counter()
+
+    # Метод для запису тривалості seconds виклику обробника name
+    def record(self, name, seconds):
+        with self.lock:
+            stats = self.handlers.get(name)
+            if stats is None:
+                stats = self.handlers[name] = HandlerStats()
+            stats.record(seconds)
+
+    # Метод для підсумку всіх обробників; частота рахується з початку вікна, а вікно починається наново
+    def summary(self):
+        now = time.perf_counter()
+        with self.lock:
+            elapsed = now - self.window_start if self.window_start is not None else 0
+            result = {}
+            for name, stats in sorted(self.handlers.items()):
+                result[name] = stats.summary((stats.count - stats.window_count) / elapsed if elapsed > 0 else 0.0)
+                stats.window_count = stats.count
+            self.window_start = now
+        return result
+
+    # Метод для пікової пам'яті процесу у байтах; None, якщо платформа її не повідомляє
+    @staticmethod
+    def process_memory():
+        if resource is None:
+            return None
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux повідомляє кілобайти, macOS - байти
+        return peak if sys.platform == "darwin" else peak * 1024
+
+    # Метод для запису статистики у файл: JSON як є, CSV - рядками "назва,значення"
+    @staticmethod
+    def dump(statistics, file_path):
+        if os.path.splitext(file_path)[1].lower() == ".csv":
+            rows = []
+            for name, summary in statistics["handlers"].items():
+                rows.extend((f"{name}.{key}", value) for key, value in summary.items() if key != "histogram")
+                rows.extend((f"{name}.histogram.{bound}", count) for bound, count in summary["histogram"])
+            rows.append(("canvas_items", statistics["canvas_items"]))
+            rows.extend((f"memory.{key}", value) for key, value in statistics["memory"].items())
+            with open(file_path, "w", newline="", encoding="utf-8") as file:
+                writer = csv.writer(file)
+                writer.writerow(("name", "value"))
+                writer.writerows(rows)
+        else:
+            with open(file_path, "w", encoding="utf-8") as file:
+                json.dump(statistics, file, ensure_ascii=False, indent=2)
+
+
+# Спільний збирач вимірювань редактора
+PROFILER = Profiler()
+
+
+# Функція-декоратор для вимірювання тривалості обробника під назвою name, коли збирання увімкнене
+def profiled(name):
+    def decorate(method):
+        # Метод для виклику обробника з вимірюванням
+        @functools.wraps(method)
+        def wrapper(*args, **kwargs):
+            if not PROFILER.enabled:
+                return method(*args, **kwargs)
+            started = time.perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                PROFILER.record(name, time.perf_counter() - started)
+
+        return wrapper
+
+    return decorate
+
+
+# Клас RecordingCanvas - легка заміна tk.Canvas, яка лише веде облік елементів.
+# Використовується, коли сеанс відтворюється без дисплея для справжнього полотна.
+
+
+class RecordingCanvas:
+    def __init__(self):
+        self.items = {}
+        self.next_id = 1
+        # Теги прив'язок полотна; події без дисплея не надходять, тож теги лише зберігаються
+        self.tags = ("Canvas",)
+
+    # Метод для створення елемента kind з координатами coords та параметрами options
+    def create(self, kind, coords, options):
+        item = self.next_id
+        self.next_id += 1
+        tags = options.get("tags", ())
+        self.items[item] = {
+            "kind": kind,
+            "coords": self.flatten(coords),
+            "options": options,
+            "tags": {tags} if isinstance(tags, str) else set(tags),
+        }
+        return item
+
+    # Метод для зведення координат до плоского списку: їх можна передати окремо або однією послідовністю
+    @staticmethod
+    def flatten(coords):
+        if len(coords) == 1 and isinstance(coords[0], (list, tuple)):
+            coords = coords[0]
+        return list(coords)
+
+    # Метод для створення лінії
+    def create_line(self, *coords, **options):
+        return self.create("line", coords, options)
+
+    # Метод для створення прямокутника
+    def create_rectangle(self, *coords, **options):
+        return self.create("rectangle", coords, options)
+
+    # Метод для створення багатокутника
+    def create_polygon(self, *coords, **options):
+        return self.create("polygon", coords, options)
+
+    # Метод для створення овалу
+    def create_oval(self, *coords, **options):
+        return self.create("oval", coords, options)
+
+    # Метод для створення тексту
+    def create_text(self, *coords, **options):
+        return self.create("text", coords, options)
+
+    # Метод для створення зображення
+    def create_image(self, *coords, **options):
+        return self.create("image", coords, options)
+
+    # Метод для пошуку елементів за тегом, номером або "all"
+    def find_withtag(self, tag):
+        if tag == "all":
+            return tuple(self.items)
+        if isinstance(tag, int):
+            return (tag,) if tag in self.items else ()
+        return tuple(item for item, data in self.items.items() if tag in data["tags"])
+
+    # Метод для отримання чи зміни координат елемента
+    def coords(self, item, *coords):
+        if coords:
+            self.items[item]["coords"] = self.flatten(coords)
+        return self.items[item]["coords"]
+
+    # Метод для видалення елементів за тегами
+    def delete(self, *tags):
+        for tag in tags:
+            for item in self.find_withtag(tag):
+                del self.items[item]
+
+    # Метод для зміни параметрів елементів
+    def itemconfig(self, item, **options):
+        for found in self.find_withtag(item):
+            self.items[found]["options"].update(options)
+
+    # Метод для отримання параметра елемента
+    def itemcget(self, item, option):
+        return self.items[item]["options"].get(option, "")
+
+    # Метод для зняття тегу з елементів
+    def dtag(self, item, tag):
+        for found in self.find_withtag(item):
+            self.items[found]["tags"].discard(tag)
+
+    # Метод для всіх елементів полотна
+    def find_all(self):
+        return tuple(self.items)
+
+    # Метод для отримання чи заміни тегів прив'язок
+    def bindtags(self, tags=None):
+        if tags is None:
+            return self.tags
+        self.tags = tuple(tags)
+
+    # Метод для решти методів полотна (config, bind, update...), які без дисплея нічого не роблять
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: None
+
+
+# Клас SessionRecorder записує сеанс малювання: натискання, рух та відпускання лівої кнопки на полотні
+# з часом від початку запису, а перед натисканням - зміну інструмента, розміру чи кольору.
+# Обробники стоять в окремому тезі прив'язок полотна, тож зміна інструмента їх не перезаписує.
+
+
+class SessionRecorder:
+    # Тег прив'язок полотна, через який записуються події, та версія формату файлу сеансу
+    bindtag = "session_recorder"
+    version = 1
+
+    def __init__(self, view):
+        self.view = view
+        self.events = []
+        self.started = None
+        # Інструмент, розмір і колір, записані останніми
+        self.state = None
+
+    # Метод для початку запису; тег записувача стоїть першим, тож подія записується до її обробки
+    def start(self):
+        self.events = []
+        self.state = None
+        self.started = time.perf_counter()
+        canvas = self.view.canvas
+        canvas.bind_class(self.bindtag, "<Button-1>", lambda event: self.record("press", event))
+        canvas.bind_class(self.bindtag, "<B1-Motion>", lambda event: self.record("motion", event))
+        canvas.bind_class(self.bindtag, "<ButtonRelease-1>", lambda event: self.record("release", event))
+        canvas.bindtags((self.bindtag, *canvas.bindtags()))
+
+    # Метод для завершення запису; повертає записані події
+    def stop(self):
+        canvas = self.view.canvas
+        canvas.bindtags(tuple(tag for tag in canvas.bindtags() if tag != self.bindtag))
+        return self.events
+
+    # Метод для запису події kind ("press", "motion" або "release") у точці події полотна
+    def record(self, kind, event):
+        moment = round(time.perf_counter() - self.started, 6)
+        if kind == "press":
+            view = self.view
+            state = (view.current_tool, float(view.line_width.get()), view.presenter.model.line_color)
+            if state != self.state:
+                self.state = state
+                self.events.append({"t": moment, "type": "tool", "tool": state[0], "width": state[1],
+                                    "color": state[2]})
+        self.events.append({"t": moment, "type": kind, "x": event.x, "y": event.y})
+
+    # Метод для збереження подій у файл сеансу: рядок заголовка, далі по одній події JSON на рядок
+    @staticmethod
+    def save(events, file_path):
+        with open(file_path, "w", encoding="utf-8") as file:
+            file.write(json.dumps({"version": SessionRecorder.version}) + "\n")
+            for event in events:
+                file.write(json.dumps(event, separators=(",", ":")) + "\n")
+
+    # Метод для читання подій з файлу сеансу
+    @staticmethod
+    def load(file_path):
+        with open(file_path, encoding="utf-8") as file:
+            header = json.loads(file.readline())
+            if header.get("version") != SessionRecorder.version:
+                raise ValueError("Непідтримувана версія файлу сеансу")
+            return [json.loads(line) for line in file if line.strip()]
+
+
+# Клас SessionReplayer відтворює записаний сеанс через обробники DrawView і вимірює кожну подію разом
+# з роботою, яку вона відкладає на цикл подій. Без справжнього вікна цей цикл відтворюється тут же.
+
+
+class SessionReplayer:
+    def __init__(self, view):
+        self.view = view
+
+    # Метод для відтворення подій; realtime=True витримує записані паузи між подіями.
+    # Повертає підсумок: для кожного інструмента кількість подій, частоту (подій за секунду обробки)
+    # та перцентилі затримки, а також кількість елементів полотна і пам'ять документа
+    def play(self, events, realtime=False):
+        view = self.view
+        stats = {}
+        started = time.perf_counter()
+        for record in events:
+            if realtime:
+                self.wait(started + record["t"])
+            if record["type"] == "tool":
+                view.set_tool(record["tool"])
+                view.line_width.set(record["width"])
+                view.presenter.set_color(record["color"])
+                continue
+            handler = self.handler(record["type"])
+            if handler is None:
+                continue
+            event = types.SimpleNamespace(x=record["x"], y=record["y"])
+            began = time.perf_counter()
+            handler(event)
+            self.pump()
+            elapsed = time.perf_counter() - began
+            tool_stats = stats.get(view.current_tool)
+            if tool_stats is None:
+                tool_stats = stats[view.current_tool] = HandlerStats()
+            tool_stats.record(elapsed)
+        self.pump()
+        tools = {}
+        for tool, tool_stats in stats.items():
+            summary = tool_stats.summary(tool_stats.count / tool_stats.total if tool_stats.total else 0.0)
+            del summary["histogram"]
+            tools[tool] = summary
+        return {"tools": tools, "seconds": round(time.perf_counter() - started, 3),
+                "canvas_items": view.item_count(), "memory": view.presenter.model.memory_usage()}
+
+    # Метод для обробника події kind так, як його прив'язує DrawView; текст не відтворюється, бо чекає діалогу
+    def handler(self, kind):
+        view = self.view
+        if kind == "press":
+            handlers = {"fill": view.fill_canvas, "picker": view.pick_color, "text": None}
+            return handlers.get(view.current_tool, view.start_drawing)
+        return view.draw if kind == "motion" else view.end_drawing
+
+    # Метод для обробки роботи, відкладеної на цикл подій: сповіщень моделі та кадрів
+    def pump(self):
+        view = self.view
+        if isinstance(view.root, tk.Misc):
+            view.root.update()
+            return
+        view.presenter.model.flush()
+        if view.frame_pending is not None and time.perf_counter() - view.last_frame >= FRAME_INTERVAL / 1000:
+            view.present()
+
+    # Метод для очікування моменту moment за perf_counter; цикл подій тим часом працює
+    def wait(self, moment):
+        while True:
+            remaining = moment - time.perf_counter()
+            if remaining <= 0:
+                return
+            self.pump()
+            time.sleep(min(remaining, 0.001))
+
+    # Метод для текстового звіту за підсумком відтворення
+    @staticmethod
+    def report(result):
+        lines = ["%-12s %6d подій %8.0f/с  p50 %7.0f  p95 %7.0f  p99 %7.0f мкс" % (
+            tool, summary["count"], summary["rate"], summary["p50_us"], summary["p95_us"], summary["p99_us"])
+            for tool, summary in result["tools"].items()]
+        memory = {key: (value or 0) / 2 ** 20 for key, value in result["memory"].items()}
+        lines.append("Елементів полотна: %d, тривалість %.1f с" % (result["canvas_items"], result["seconds"]))
+        lines.append("Пам'ять, МБ: шари %.1f, композиція %.1f, історія %.1f, фігури %.1f, пік процесу %.0f" % (
+            memory["layers"], memory["composite"], memory["history"], memory["shapes"], memory["process_peak"]))
+        return lines
+
+
+# Клас Operation відповідає за одну дію в історії: плитки буфера до (або після) зміни
+# та елементи полотна, які показують результат дії.
+
+
+class Operation:
+    def __init__(self):
+        # Плитки зберігаються як байти пікселів, після витіснення - стиснені zlib
+        self.tiles = {}
+        self.compressed = False
+        self.size = 0
+        self.items = ()
+        # Індекс першої фігури операції у сховищі фігур та фігури, відрізані під час скасування
+        self.shape_start = 0
+        self.shapes = None
+        # Шар, пікселі якого змінила операція
+        self.layer = None
+
+    # Метод для стискання плиток операції
+    def compress(self):
+        if not self.compressed:
+            self.tiles = {key: zlib.compress(data, 1) for key, data in self.tiles.items()}
+            self.size = sum(len(data) for data in self.tiles.values())
+            self.compressed = True
+
+    # Метод для обчислення прямокутника, який охоплює всі плитки операції
+    def box(self, width, height):
+        columns = [tx for tx, _ in self.tiles]
+        rows = [ty for _, ty in self.tiles]
+        return (min(columns) * TILE_SIZE, min(rows) * TILE_SIZE,
+                min(width, (max(columns) + 1) * TILE_SIZE), min(height, (max(rows) + 1) * TILE_SIZE))
+
+
+# Клас History відповідає за скасування та повторення дій.
+# Перед першою зміною плитки в межах операції зберігається її копія (копіювання під час запису),
+# тому операція займає пам'ять лише під ті плитки, які вона справді змінила.
+
+
+class History:
+    def __init__(self, memory_limit=256 * 1024 * 1024, compress=True):
+        # Межа пам'яті для всіх збережених плиток та чи стискати найстаріші операції перед їх видаленням
+        self.memory_limit = memory_limit
+        self.compress = compress
+        # Стеки операцій: праворуч найновіші, ліворуч ті, що витісняються першими
+        self.undo_stack = deque()
+        self.redo_stack = deque()
+        self.current = None
+        self.size = 0
+        # Кількість операцій з лівого краю кожного стека, які вже стиснені
+        self.undo_compressed = 0
+        self.redo_compressed = 0
+
+    # Метод для початку запису операції; повертає False, якщо операція вже записується
+    def begin(self):
+        if self.current is not None:
+            return False
+        self.current = Operation()
+        return True
+
+    # Метод для збереження плиток, які перетинає box, перед їх зміною
+    def touch(self, image, box):
+        operation = self.current
+        if operation is None:
+            return
+        x0, y0 = max(0, box[0]), max(0, box[1])
+        x1, y1 = min(image.width, box[2]), min(image.height, box[3])
+        for ty in range(y0 // TILE_SIZE, (y1 - 1) // TILE_SIZE + 1):
+            for tx in range(x0 // TILE_SIZE, (x1 - 1) // TILE_SIZE + 1):
+                if (tx, ty) not in operation.tiles:
+                    data = image.crop(self.tile_box(image, tx, ty)).tobytes()
+                    operation.tiles[(tx, ty)] = data
+                    operation.size += len(data)
+
+    # Метод для завершення запису операції; повертає операцію або None, якщо нічого не змінилось
+    def end(self, items=()):
+        operation = self.current
+        self.current = None
+        if operation is None or not operation.tiles:
+            return None
+        operation.items = tuple(items)
+        self.size -= sum(dropped.size for dropped in self.redo_stack)
+        self.redo_stack.clear()
+        self.redo_compressed = 0
+        self.undo_stack.append(operation)
+        self.size += operation.size
+        self.enforce_limit()
+        return operation
+
+    # Метод для дотримання межі пам'яті: спершу стискаються найстаріші операції та найвіддаленіші
+    # скасовані, а якщо цього замало - вони видаляються в тому ж порядку
+    def enforce_limit(self):
+        self.undo_compressed = self.compress_oldest(self.undo_stack, self.undo_compressed)
+        self.redo_compressed = self.compress_oldest(self.redo_stack, self.redo_compressed)
+        while self.size > self.memory_limit and self.undo_stack:
+            self.size -= self.undo_stack.popleft().size
+            self.undo_compressed = max(0, self.undo_compressed - 1)
+        while self.size > self.memory_limit and self.redo_stack:
+            self.size -= self.redo_stack.popleft().size
+            self.redo_compressed = max(0, self.redo_compressed - 1)
+
+    # Метод для стискання операцій стека від найстарішої, поки перевищено межу; повертає кількість стиснених
+    def compress_oldest(self, stack, compressed):
+        while self.size > self.memory_limit and self.compress and compressed < len(stack):
+            operation = stack[compressed]
+            self.size -= operation.size
+            operation.compress()
+            self.size += operation.size
+            compressed += 1
+        return compressed
+
+    # Метод для отримання операції, яку поверне наступний виклик undo (або redo, якщо redo=True); None, якщо такої немає
+    def peek(self, redo=False):
+        stack = self.redo_stack if redo else self.undo_stack
+        if self.current is not None or not stack:
+            return None
+        return stack[-1]
+
+    # Метод для скасування останньої операції; повертає її або None
+    def undo(self, image):
+        if self.current is not None or not self.undo_stack:
+            return None
+        operation = self.undo_stack.pop()
+        self.undo_compressed = min(self.undo_compressed, len(self.undo_stack))
+        self.swap(image, operation)
+        self.redo_stack.append(operation)
+        self.enforce_limit()
+        return operation
+
+    # Метод для повторення скасованої операції; повертає її або None
+    def redo(self, image):
+        if self.current is not None or not self.redo_stack:
+            return None
+        operation = self.redo_stack.pop()
+        self.redo_compressed = min(self.redo_compressed, len(self.redo_stack))
+        self.swap(image, operation)
+        self.undo_stack.append(operation)
+        self.enforce_limit()
+        return operation
+
+    # Метод для обміну плиток буфера зі збереженими: після обміну операція зберігає протилежний стан
+    def swap(self, image, operation):
+        self.size -= operation.size
+        swapped = {}
+        for (tx, ty), data in operation.tiles.items():
+            box = self.tile_box(image, tx, ty)
+            swapped[(tx, ty)] = image.crop(box).tobytes()
+            if operation.compressed:
+                data = zlib.decompress(data)
+            image.paste(Image.frombytes(image.mode, (box[2] - box[0], box[3] - box[1]), data), box[:2])
+        operation.tiles = swapped
+        operation.compressed = False
+        operation.size = sum(len(data) for data in swapped.values())
+        self.size += operation.size
+
+    # Метод для обчислення прямокутника плитки з урахуванням країв буфера
+    @staticmethod
+    def tile_box(image, tx, ty):
+        return (tx * TILE_SIZE, ty * TILE_SIZE,
+                min(image.width, (tx + 1) * TILE_SIZE), min(image.height, (ty + 1) * TILE_SIZE))
+
+
+# Клас TiledImage відповідає за великі зображення, які читаються плитками лише тоді, коли плитка потрібна.
+# Нестиснені растрові дані (PPM, BMP, нестиснений TIFF) відображаються у пам'ять без декодування,
+# решта форматів один раз розпаковується у тимчасовий файл на диску, який далі так само відображається.
+# Для зменшених рівнів піраміди будується огляд, а прочитані плитки зберігаються в обмеженому LRU-кеші.
+# Відкрите велике зображення редагується в повному розмірі: prepare готує RGB-зображення у відображеному файлі,
+# а піраміда лишається джерелом зменшених плиток для вигляду.
+
+
+class TiledImage:
+    # Сирі режими PIL, які можна читати напряму: байтів на піксель та порядок каналів
+    raw_modes = {
+        "L": (1, [0]),
+        "RGB": (3, [0, 1, 2]),
+        "BGR": (3, [2, 1, 0]),
+        "RGBA": (4, [0, 1, 2, 3]),
+        "RGBX": (4, [0, 1, 2]),
+        "BGRX": (4, [2, 1, 0]),
+        "BGRA": (4, [2, 1, 0, 3]),
+    }
+
+    def __init__(self, path, tile_size=256, cache_size=64, overview_size=2048, progress=None):
+        self.path = path
+        # Функція, яка отримує частку виконаної роботи під час розпакування та побудови огляду
+        self.progress = progress
+        self.tile_size = tile_size
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+        with self.open() as image:
+            self.width, self.height = image.size
+            self.mode = "RGBA" if image.mode in ("RGBA", "LA", "PA") or "transparency" in image.info else "RGB"
+            self.chunks = self.map_chunks(image)
+        # Стиснене зображення, розпаковане у тимчасовий файл під час першого читання, та його відображення
+        self.decoded = None
+        self.spool_map = None
+        # Повнорозмірне RGB-зображення для редагування та відображення його окремого файлу (None, якщо ним
+        # стало саме розпаковане зображення)
+        self.image = None
+        self.image_map = None
+        # Рівень піраміди, на якому все зображення вміщується в overview_size; він будується цілком
+        self.overview_level = max(0, math.ceil(math.log2(max(self.width, self.height) / overview_size)))
+        self.overview = None
+
+    # Метод для відкриття файлу без перевірки на "бомбу декомпресії": великі зображення тут очікувані
+    def open(self):
+        limit = Image.MAX_IMAGE_PIXELS
+        Image.MAX_IMAGE_PIXELS = None
+        try:
+            return Image.open(self.path)
+        finally:
+            Image.MAX_IMAGE_PIXELS = limit
+
+    # Метод для відображення сирих фрагментів файлу у пам'ять; повертає None, якщо дані стиснені
+    def map_chunks(self, image):
+        data = None
+        chunks = []
+        for codec, extents, offset, args in (tuple(tile)[:4] for tile in image.tile):
+            if not isinstance(args, tuple):
+                args = (args,)
+            if codec != "raw" or args[0] not in self.raw_modes:
+                return None
+            size, channels = self.raw_modes[args[0]]
+            x0, y0, x1, y1 = extents
+            stride = args[1] if len(args) > 1 and args[1] else (x1 - x0) * size
+            if data is None:
+                data = np.memmap(self.path, dtype=np.uint8, mode="r")
+            rows = data[offset:offset + stride * (y1 - y0)].reshape(y1 - y0, stride)
+            if len(args) > 2 and args[2] < 0:
+                rows = rows[::-1]
+            pixels = rows[:, :(x1 - x0) * size].reshape(y1 - y0, x1 - x0, size)
+            chunks.append((extents, pixels, channels))
+        # Формати, що описують фрагменти лише під час розпакування (наприклад, WebP), теж читаються через spool
+        return self.index_chunks(chunks) if chunks else None
+
+    # Метод для розпакування стисненого зображення у тимчасовий файл. Декодер PIL пише рядки прямо у відображення
+    # файлу, а заповнені сторінки відпускаються після кожного прочитаного блоку стиснених даних, тож пам'ять процесу
+    # не залежить від розміру зображення. Пікселі лишаються в рідному режимі файлу і перетворюються по областях
+    def spool(self):
+        image = self.open()
+        # Крок рядка, якого PIL чекає від відображеного буфера: байт на піксель для L і P, два для I;16, інакше чотири
+        pixel_size = 1 if image.mode in ("L", "P") else 2 if image.mode.startswith("I;16") else 4
+        stride = self.width * pixel_size
+        self.spool_file = tempfile.TemporaryFile()
+        self.spool_file.truncate(stride * self.height)
+        self.spool_map = mmap.mmap(self.spool_file.fileno(), stride * self.height)
+        image.im = Image.core.map_buffer(self.spool_map, image.size, "raw", 0, (image.mode, stride, 1))
+        # Формат може замінити файл під час розпакування, тож без власного читання дані беруться з image.fp
+        read = getattr(image, "load_read", None)
+        total = max(1, os.path.getsize(self.path))
+
+        # Функція для читання блоку стиснених даних: перед ним відпускаються сторінки, які декодер уже заповнив
+        def load_read(size):
+            self.release()
+            self.report(0.5 * min(1, image.fp.tell() / total))
+            return read(size) if read is not None else image.fp.read(size)
+
+        image.load_read = load_read
+        image.load()
+        self.release()
+        return image
+
+    # Метод для звільнення сторінок розпакованого зображення та зображення для редагування з пам'яті процесу:
+    # дані лишаються у тимчасових файлах
+    def release(self):
+        if hasattr(mmap, "MADV_DONTNEED"):
+            for mapping in (self.spool_map, self.image_map):
+                if mapping is not None:
+                    mapping.madvise(mmap.MADV_DONTNEED)
+
+    # Метод для повідомлення про прогрес довгих кроків
+    def report(self, fraction):
+        if self.progress is not None:
+            self.progress(fraction)
+
+    # Метод для підготовки масиву меж фрагментів, щоб шукати фрагменти області без циклу
+    @staticmethod
+    def index_chunks(chunks):
+        return chunks, np.array([extents for extents, _, _ in chunks]).reshape(-1, 4)
+
+    # Метод для читання області вихідного зображення (рівень 0)
+    def read_region(self, box):
+        if self.chunks is None:
+            if self.decoded is None:
+                self.decoded = self.spool()
+            region = self.decoded.crop(box)
+            self.release()
+            return region if region.mode == self.mode else region.convert(self.mode)
+        chunks, extents = self.chunks
+        x0, y0, x1, y1 = box
+        bands = len(chunks[0][2])
+        region = np.zeros((y1 - y0, x1 - x0, bands), dtype=np.uint8)
+        hits = (extents[:, 0] < x1) & (extents[:, 2] > x0) & (extents[:, 1] < y1) & (extents[:, 3] > y0)
+        for index in np.flatnonzero(hits):
+            (cx0, cy0, cx1, cy1), pixels, channels = chunks[index]
+            ix0, iy0, ix1, iy1 = max(x0, cx0), max(y0, cy0), min(x1, cx1), min(y1, cy1)
+            source = pixels[iy0 - cy0:iy1 - cy0, ix0 - cx0:ix1 - cx0]
+            region[iy0 - y0:iy1 - y0, ix0 - x0:ix1 - x0] = source[..., channels]
+        image = Image.fromarray(region[..., 0] if bands == 1 else region)
+        return image if image.mode == self.mode else image.convert(self.mode)
+
+    # Метод для обчислення розміру рівня піраміди
+    def level_size(self, level):
+        return -(-self.width // 2 ** level), -(-self.height // 2 ** level)
+
+    # Метод для побудови огляду: зображення обходиться блоками, кожен блок одразу зменшується
+    def build_overview(self):
+        factor = 2 ** self.overview_level
+        block = factor * 64
+        overview = Image.new(self.mode, self.level_size(self.overview_level))
+        for y in range(0, self.height, block):
+            for x in range(0, self.width, block):
+                region = self.read_region((x, y, min(self.width, x + block), min(self.height, y + block)))
+                overview.paste(region.reduce(factor) if factor > 1 else region, (x // factor, y // factor))
+            self.report(0.5 + 0.5 * min(self.height, y + block) / self.height)
+        self.overview = overview
+
+    # Метод для отримання плитки рівня піраміди (кожен рівень удвічі менший за попередній)
+    def tile(self, level, tx, ty):
+        key = (level, tx, ty)
+        if key in self.cache:
+            self.cache.move_to_end(key)
+            return self.cache[key]
+        size = self.tile_size
+        if level >= self.overview_level:
+            if self.overview is None:
+                self.build_overview()
+            factor = 2 ** (level - self.overview_level)
+            source = self.overview
+        else:
+            factor = 2 ** level
+            source = None
+        box = (tx * size * factor, ty * size * factor, (tx + 1) * size * factor, (ty + 1) * size * factor)
+        if source is None:
+            width, height = self.width, self.height
+        else:
+            width, height = source.size
+        box = box[:2] + (min(width, box[2]), min(height, box[3]))
+        tile = source.crop(box) if source is not None else self.read_region(box)
+        if factor > 1:
+            tile = tile.reduce(factor)
+        self.cache[key] = tile
+        while len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+        return tile
+
+    # Метод для підготовки зображення до редагування; викликається у фоні. Будується огляд і повнорозмірне
+    # RGB-зображення, яке змінюється на місці, а його пікселі лежать у відображеному тимчасовому файлі.
+    # Розпаковане RGB-зображення стає ним без копіювання, решта режимів і сирі дані файлу переводяться смугами,
+    # прозорі пікселі кладуться на білий папір, як під шарами документа. Повертає це зображення
+    def prepare(self, strip_height=256):
+        if self.overview is None:
+            self.build_overview()
+        if self.chunks is None and self.decoded.mode == "RGB":
+            self.image = self.decoded._new(self.decoded.im)
+            return self.image
+        stride = self.width * 4
+        self.image_file = tempfile.TemporaryFile()
+        self.image_file.truncate(stride * self.height)
+        self.image_map = mmap.mmap(self.image_file.fileno(), stride * self.height)
+        core = Image.core.map_buffer(self.image_map, (self.width, self.height), "raw", 0, ("RGB", stride, 1))
+        self.image = Image.new("RGB", (0, 0))._new(core)
+        for y in range(0, self.height, strip_height):
+            region = self.read_region((0, y, self.width, min(self.height, y + strip_height)))
+            if region.mode == "RGBA":
+                paper = Image.new("RGB", region.size, "white")
+                paper.paste(region, mask=region)
+                region = paper
+            self.image.paste(region, (0, y))
+            self.release()
+        return self.image
+
+
+# Функція для кодування зображення у байти; виконується в окремому процесі, тому оголошена на рівні модуля
+def encode_image(image, image_format):
+    buffer = io.BytesIO()
+    image.save(buffer, image_format)
+    return buffer.getvalue()
+
+
+# Функція для створення пулу з workers процесів, які запускаються заново ("spawn") і не успадковують стан Tk.
+# multiprocessing імпортується тут, а не на рівні модуля: так він не сповільнює запуск редактора,
+# а звичайний імпорт, на відміну від lazy_import, безпечний, якщо пул уперше потрібен не в головному потоці
+def process_pool(workers):
+    import multiprocessing
+    return concurrent.futures.ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+
+
+# Функція для запису фрагмента PNG: довжина, тип, дані та контрольна сума
+def png_chunk(file, kind, data):
+    file.write(struct.pack(">I", len(data)) + kind)
+    file.write(data)
+    file.write(struct.pack(">I", zlib.crc32(data, zlib.crc32(kind))))
+
+
+# Функція для потокового запису PNG з масиву pixels (H x W x C, uint8). Рядки фільтруються фільтром Sub
+# і стискаються одним потоком zlib смугами по strip_height рядків, тож крім пікселів у пам'яті лежить лише смуга
+def write_png(file, pixels, strip_height=256, level=6):
+    height, width, bands = pixels.shape
+    file.write(b"\x89PNG\r\n\x1a\n")
+    png_chunk(file, b"IHDR", struct.pack(">IIBBBBB", width, height, 8, {1: 0, 2: 4, 3: 2, 4: 6}[bands], 0, 0, 0))
+    compressor = zlib.compressobj(level)
+    for y in range(0, height, strip_height):
+        flat = pixels[y:y + strip_height].reshape(-1, width * bands)
+        rows = np.empty((len(flat), width * bands + 1), dtype=np.uint8)
+        rows[:, 0] = 1
+        rows[:, 1:bands + 1] = flat[:, :bands]
+        np.subtract(flat[:, bands:], flat[:, :-bands], out=rows[:, bands + 1:])
+        data = compressor.compress(rows)
+        if data:
+            png_chunk(file, b"IDAT", data)
+    png_chunk(file, b"IDAT", compressor.flush())
+    png_chunk(file, b"IEND", b"")
+
+
+# Функція для переведення пікселів (H x W x 4, RGBX) у зображення з палітрою 256 кольорів для GIF.
+# Палітру будує швидкий адаптивний квантувач (октодерево) з рівномірної вибірки близько sample пікселів,
+# а пікселі переводяться в неї смугами по strip_height рядків, тож повна RGB-копія не створюється:
+# у пам'яті лежить лише результат, байт на піксель
+def palette_image(pixels, strip_height=256, sample=1 << 20):
+    height, width = pixels.shape[:2]
+    step = max(1, math.isqrt(height * width // sample))
+    palette = Image.fromarray(np.ascontiguousarray(pixels[::step, ::step, :3]))
+    palette = palette.quantize(256, method=Image.Quantize.FASTOCTREE)
+    result = Image.new("P", (width, height))
+    result.putpalette(palette.getpalette())
+    for y in range(0, height, strip_height):
+        strip = Image.fromarray(np.ascontiguousarray(pixels[y:y + strip_height, :, :3]))
+        result.paste(strip.quantize(palette=palette, dither=Image.Dither.NONE), (0, y))
+    return result
+
+
+# Функція для кодування одного виходу експорту kind у файл path; виконується в окремому процесі.
+# Знімок лежить у спільній пам'яті snapshot_name як RGBX (H x W x 4): у такому вигляді PIL відображає його
+# без копіювання, тож JPEG кодується, а мініатюра зменшується прямо зі спільної пам'яті, PNG пишеться смугами,
+# а GIF - смугами переводиться в палітру. Файл пишеться через тимчасовий, щоб перерваний запис не зіпсував
+# наявний файл. Повертає розмір файлу. Перед закриттям спільної пам'яті звільняються всі її подання, зокрема
+# у кадрах трасування помилки, інакше BufferError під час закриття підмінив би справжню помилку
+def export_output(snapshot_name, shape, kind, path, options):
+    from multiprocessing import shared_memory
+    memory = shared_memory.SharedMemory(name=snapshot_name)
+    temporary = path + ".part"
+    pixels = image = None
+    try:
+        pixels = np.ndarray(shape, dtype=np.uint8, buffer=memory.buf)
+        image = Image.frombuffer("RGBX", (shape[1], shape[0]), memory.buf, "raw", "RGBX", 0, 1)
+        with open(temporary, "wb") as file:
+            if kind == "png":
+                write_png(file, pixels[..., :3], options["strip_height"])
+            elif kind == "jpeg":
+                image.save(file, "JPEG", quality=options["jpeg_quality"])
+            elif kind == "gif":
+                palette_image(pixels, options["strip_height"]).save(file, "GIF")
+            else:
+                factor = max(1, min(image.width, image.height, max(image.size) // options["thumbnail_size"]))
+                thumbnail = (image.reduce(factor) if factor > 1 else image).convert("RGB")
+                thumbnail.thumbnail((options["thumbnail_size"], options["thumbnail_size"]))
+                write_png(file, np.asarray(thumbnail))
+        os.replace(temporary, path)
+        return os.path.getsize(path)
+    except BaseException as error:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+        traceback.clear_frames(error.__traceback__)
+        raise
+    finally:
+        pixels = image = None
+        memory.close()
+
+
+# Функція для розмиття масиву float32 (H x W x C) гаусовим ядром; ядро розділяється на два одновимірні проходи.
+# За межами масиву повторюються крайні пікселі
+def gaussian_blur(data, sigma):
+    radius = filter_radius(sigma)
+    if not radius:
+        return data
+    kernel = np.exp(-np.arange(-radius, radius + 1) ** 2 / (2 * sigma ** 2)).astype(np.float32)
+    kernel /= kernel.sum()
+    for axis in (0, 1):
+        pad = [(0, 0)] * data.ndim
+        pad[axis] = (radius, radius)
+        padded = np.pad(data, pad, mode="edge")
+        window = [slice(None)] * data.ndim
+        result = np.zeros_like(data)
+        for offset, weight in enumerate(kernel):
+            window[axis] = slice(offset, offset + data.shape[axis])
+            result += weight * padded[tuple(window)]
+        data = result
+    return data
+
+
+# Функція для обчислення радіуса гаусового ядра (три сигми)
+def filter_radius(sigma):
+    return math.ceil(3 * sigma) if sigma > 0 else 0
+
+
+# Функція для обчислення перекриття плиток, якого потребує фільтр: пікселі плитки залежать від сусідів на цій відстані
+def filter_halo(name, params):
+    if name in ("blur", "sharpen"):
+        return filter_radius(params[0])
+    return 0
+
+
+# Функція для застосування фільтра до масиву пікселів (H x W x C, uint8); params - кортеж параметрів фільтра.
+# Розмиття та різкість шарів з прозорістю рахуються на кольорі, помноженому на непрозорість,
+# щоб прозорі пікселі не темнили краї
+def filter_pixels(name, params, pixels):
+    data = pixels.astype(np.float32)
+    premultiplied = data.shape[2] == 4 and name in ("blur", "sharpen")
+    if premultiplied:
+        data[..., :3] *= data[..., 3:] / 255
+    if name == "blur":
+        data = gaussian_blur(data, params[0])
+    elif name == "sharpen":
+        radius, amount = params
+        data += amount * (data - gaussian_blur(data, radius))
+    elif name == "grayscale":
+        data[..., :3] = (data[..., :3] @ np.array([0.299, 0.587, 0.114], dtype=np.float32))[..., None]
+    elif name == "levels":
+        black, white, gamma = params
+        data[..., :3] = 255 * np.clip((data[..., :3] - black) / max(1, white - black), 0, 1) ** (1 / gamma)
+    else:
+        raise ValueError(f"Невідомий фільтр: {name}")
+    if premultiplied:
+        data = np.clip(data, 0, 255)
+        data[..., :3] *= 255 / np.maximum(data[..., 3:], 1)
+    return np.clip(data + 0.5, 0, 255).astype(np.uint8)
+
+
+# Функція для обробки однієї плитки box в окремому процесі. Пікселі читаються зі спільної пам'яті input_name
+# разом із перекриттям halo, а внутрішня частина результату пишеться у спільну пам'ять output_name,
+# тож між процесами передаються лише назви та координати
+def filter_tile(name, params, input_name, output_name, shape, box, halo):
+    from multiprocessing import shared_memory
+    source = shared_memory.SharedMemory(name=input_name)
+    target = shared_memory.SharedMemory(name=output_name)
+    try:
+        pixels = np.ndarray(shape, dtype=np.uint8, buffer=source.buf)
+        output = np.ndarray(shape, dtype=np.uint8, buffer=target.buf)
+        x0, y0, x1, y1 = box
+        # На краях зображення перекриття немає: фільтр сам повторює крайні пікселі, як і для всього зображення
+        hx0, hy0 = max(0, x0 - halo), max(0, y0 - halo)
+        hx1, hy1 = min(shape[1], x1 + halo), min(shape[0], y1 + halo)
+        result = filter_pixels(name, params, pixels[hy0:hy1, hx0:hx1])
+        output[y0:y1, x0:x1] = result[y0 - hy0:y1 - hy0, x0 - hx0:x1 - hx0]
+        del pixels, output
+    finally:
+        source.close()
+        target.close()
+
+
+# Виняток, яким переривається фонове завдання після його скасування
+
+
+class TaskCancelled(Exception):
+    pass
+
+
+# Клас BackgroundTask описує одне фонове завдання: його вид, назву для рядка стану та прапорець скасування.
+
+
+class BackgroundTask:
+    def __init__(self, worker, kind, title, job, on_done):
+        self.worker = worker
+        self.kind = kind
+        self.title = title
+        self.job = job
+        self.on_done = on_done
+        self.cancelled = threading.Event()
+        self.future = None
+
+    # Метод для повідомлення про прогрес з робочого потоку; перериває завдання, якщо його скасовано
+    def report(self, fraction):
+        if self.cancelled.is_set():
+            raise TaskCancelled()
+        self.worker.results.put((self, "progress", fraction))
+
+    # Метод для очікування результату з пулу процесів із перевіркою скасування
+    def wait(self, future, interval=0.05):
+        while True:
+            try:
+                return future.result(timeout=interval)
+            except FutureTimeoutError:
+                if self.cancelled.is_set():
+                    future.cancel()
+                    raise TaskCancelled()
+
+    # Метод для скасування завдання; завдання, яке ще не почалось, знімається з черги одразу
+    def cancel(self):
+        self.cancelled.set()
+        if self.future is not None and self.future.cancel():
+            self.worker.results.put((self, "cancelled", None))
+
+
+# Клас ImageIOWorker виконує відкриття та збереження зображень поза головним потоком Tk.
+# Читання та запис файлів іде в пулі потоків, кодування - в окремому процесі,
+# а результати повертаються у головний цикл через чергу, яку опитує root.after.
+
+
+class ImageIOWorker:
+    def __init__(self, root, observer, threads=2, poll_interval=50):
+        self.root = root
+        # Обсервер отримує task_progress(task, fraction) та task_finished(task, status, error)
+        self.observer = observer
+        self.threads = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="image-io")
+        # Пул процесів створюється лише під час першого збереження
+        self.processes = None
+        self.results = queue.Queue()
+        self.tasks = []
+        self.poll_interval = poll_interval
+        self.polling = None
+
+    # Метод для запуску фонового завдання; job отримує завдання і повертає результат для on_done
+    def submit(self, kind, title, job, on_done):
+        task = BackgroundTask(self, kind, title, job, on_done)
+        self.tasks.append(task)
+        task.future = self.threads.submit(self.run, task)
+        self.schedule()
+        return task
+
+    # Метод, що виконує завдання у робочому потоці і кладе підсумок у чергу
+    def run(self, task):
+        started = time.perf_counter()
+        try:
+            result = task.job(task)
+        except TaskCancelled:
+            self.results.put((task, "cancelled", None))
+        except Exception as e:
+            self.results.put((task, "error", e))
+        else:
+            self.results.put((task, "done", result))
+        finally:
+            if PROFILER.enabled:
+                PROFILER.record("io." + task.kind, time.perf_counter() - started)
+
+    # Метод для планування наступного опитування черги, поки є незавершені завдання
+    def schedule(self):
+        if self.tasks and self.polling is None:
+            self.polling = self.root.after(self.poll_interval, self.poll)
+
+    # Метод для розбору черги результатів у головному потоці. Помилка в on_done завершує завдання зі статусом
+    # "error", а опитування планується наново за будь-якого результату, щоб решта завдань не зависла
+    def poll(self):
+        self.polling = None
+        try:
+            while True:
+                try:
+                    task, status, value = self.results.get_nowait()
+                except queue.Empty:
+                    break
+                if task not in self.tasks:
+                    continue
+                if status == "progress":
+                    self.observer.task_progress(task, value)
+                    continue
+                self.tasks.remove(task)
+                if status == "done":
+                    try:
+                        task.on_done(value)
+                    except Exception as e:
+                        status, value = "error", e
+                self.observer.task_finished(task, status, value if status == "error" else None)
+        finally:
+            self.schedule()
+
+    # Метод для перевірки, чи є незавершені завдання заданого виду
+    def busy(self, kind=None):
+        return any(kind is None or task.kind == kind for task in self.tasks)
+
+    # Метод для скасування незавершених завдань заданого виду (або всіх)
+    def cancel(self, kind=None):
+        for task in self.tasks:
+            if kind is None or task.kind == kind:
+                task.cancel()
+
+    # Метод для пулу процесів кодування. Викликається в головному потоці, коли завдання ставиться в чергу:
+    # робочі потоки лише користуються готовим пулом, тож два збереження, запущені разом, не створять двох пулів
+    def pool(self):
+        if self.processes is None:
+            self.processes = process_pool(1)
+        return self.processes
+
+    # Метод для фонового відкриття зображення. Зображення, більше за width x height, не зменшується:
+    # on_done отримує TiledImage, уже підготовлений до редагування в повному розмірі
+    def open_image(self, file_path, width, height, on_done):
+        def job(task):
+            task.report(0)
+            tiled = TiledImage(file_path, progress=task.report)
+            if tiled.width > width or tiled.height > height:
+                tiled.prepare()
+                image = tiled
+            else:
+                image = Image.open(file_path)
+                image.load()
+            task.report(1)
+            return image
+
+        return self.submit("open", f"Відкриття {os.path.basename(file_path)}", job, on_done)
+
+    # Метод для фонового збереження знімка зображення у файл
+    def save_image(self, image, file_path, on_done):
+        processes = self.pool()
+
+        def job(task):
+            task.report(0)
+            extension = os.path.splitext(file_path)[1].lower()
+            data = task.wait(processes.submit(encode_image, image, Image.registered_extensions()[extension]))
+            task.report(0.5)
+            self.write_file(task, file_path, data)
+            return file_path
+
+        return self.submit("save", f"Збереження {os.path.basename(file_path)}", job, on_done)
+
+    # Метод для запису даних частинами через тимчасовий файл, щоб скасований запис не зіпсував наявний файл
+    @staticmethod
+    def write_file(task, file_path, data, chunk=1 << 20):
+        descriptor, temporary = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(file_path)), suffix=".part")
+        try:
+            with os.fdopen(descriptor, "wb") as file:
+                view = memoryview(data)
+                for start in range(0, len(data), chunk):
+                    file.write(view[start:start + chunk])
+                    task.report(0.5 + 0.5 * min(len(data), start + chunk) / len(data))
+            os.replace(temporary, file_path)
+        except BaseException:
+            os.remove(temporary)
+            raise
+
+    # Метод для зупинки пулів; незавершені записи дочекаються кінця, якщо wait=True
+    def shutdown(self, wait=True):
+        self.threads.shutdown(wait=wait, cancel_futures=not wait)
+        if self.processes is not None:
+            self.processes.shutdown(wait=wait, cancel_futures=not wait)
+        if self.polling is not None:
+            self.root.after_cancel(self.polling)
+            self.polling = None
+
+
+# Клас FilterEngine відповідає за фільтри зображення (розмиття, різкість, відтінки сірого, рівні).
+# Повне зображення обробляється плитками з перекриттям у пулі процесів: пікселі лежать у спільній пам'яті,
+# тож процеси не отримують і не повертають їх через pickle. Попередній перегляд рахується на зменшеній копії.
+
+
+class FilterEngine:
+    # Назви фільтрів та їх параметри: підпис, найменше, найбільше та початкове значення
+    filters = {
+        "blur": ("Розмиття", [("Радіус", 0.5, 20, 3)]),
+        "sharpen": ("Різкість", [("Радіус", 0.5, 10, 2), ("Сила", 0.1, 3, 1)]),
+        "grayscale": ("Відтінки сірого", []),
+        "levels": ("Рівні", [("Чорний", 0, 254, 0), ("Білий", 1, 255, 255), ("Гамма", 0.1, 3, 1)]),
+    }
+
+    def __init__(self, workers=None, tile_size=512):
+        self.workers = workers or os.cpu_count() or 1
+        self.tile_size = tile_size
+        # Пул процесів створюється лише під час першого застосування фільтра
+        self.processes = None
+
+    # Метод для пулу процесів фільтрів; у фоновому застосуванні його створює головний потік до передачі завдання
+    def pool(self):
+        if self.processes is None:
+            self.processes = process_pool(self.workers)
+        return self.processes
+
+    # Метод для застосування фільтра до всього зображення; task (BackgroundTask) отримує прогрес і може
+    # перервати обробку. Повертає нове зображення
+    def run(self, image, name, params, task=None):
+        processes = self.pool()
+        pixels = np.asarray(image)
+        shape = pixels.shape
+        # Спільна пам'ять потрібна лише фільтрам, тож її модуль не імпортується під час запуску редактора
+        from multiprocessing import shared_memory
+        source = shared_memory.SharedMemory(create=True, size=pixels.nbytes)
+        target = shared_memory.SharedMemory(create=True, size=pixels.nbytes)
+        futures = []
+        try:
+            np.ndarray(shape, dtype=np.uint8, buffer=source.buf)[:] = pixels
+            halo = filter_halo(name, params)
+            tile = self.tile_size
+            for y in range(0, shape[0], tile):
+                for x in range(0, shape[1], tile):
+                    box = (x, y, min(shape[1], x + tile), min(shape[0], y + tile))
+                    futures.append(processes.submit(filter_tile, name, params, source.name, target.name,
+                                                    shape, box, halo))
+            for done, future in enumerate(futures, 1):
+                if task is not None:
+                    task.wait(future)
+                    task.report(done / len(futures))
+                else:
+                    future.result()
+            result = np.ndarray(shape, dtype=np.uint8, buffer=target.buf).copy()
+        finally:
+            # Після скасування або помилки решта плиток знімається з черги; спільна пам'ять звільняється, коли
+            # процеси, які вже обробляють плитки, її відпустять
+            for future in futures:
+                future.cancel()
+            concurrent.futures.wait(futures)
+            source.close()
+            source.unlink()
+            target.close()
+            target.unlink()
+        return Image.fromarray(result, image.mode)
+
+    # Метод для зменшеної копії зображення в межах width x height; повертає копію та коефіцієнт зменшення
+    @staticmethod
+    def proxy(image, width=400, height=300):
+        factor = min(1, width / image.width, height / image.height)
+        size = (max(1, round(image.width * factor)), max(1, round(image.height * factor)))
+        return image.resize(size, Image.Resampling.BILINEAR), factor
+
+    # Метод для попереднього перегляду фільтра на зменшеній копії; радіуси зменшуються разом із копією.
+    # Повертає RGB-зображення, прозорі пікселі показуються на білому тлі
+    @staticmethod
+    def preview(proxy, factor, name, params):
+        if name in ("blur", "sharpen"):
+            params = (params[0] * factor,) + tuple(params[1:])
+        result = Image.fromarray(filter_pixels(name, params, np.asarray(proxy)), proxy.mode)
+        if result.mode == "RGBA":
+            result = Image.alpha_composite(Image.new("RGBA", result.size, "white"), result)
+        return result.convert("RGB")
+
+    # Метод для зупинки пулу процесів
+    def shutdown(self, wait=True):
+        if self.processes is not None:
+            self.processes.shutdown(wait=wait, cancel_futures=True)
+            self.processes = None
+
+
+# Клас ExportPipeline експортує документ одразу в кілька форматів. Композиція шарів один раз пишеться смугами
+# у спільну пам'ять, а кожен вихід кодується у своєму процесі прямо з неї: PNG - потоковим кодувальником смугами,
+# JPEG - через PIL з відображеного знімка, GIF - смугами в палітру швидкого квантувача, мініатюра - зі зменшення.
+
+
+class ExportPipeline:
+    # Виходи експорту: підпис та закінчення імені файлу
+    outputs = {
+        "png": ("PNG", ".png"),
+        "jpeg": ("JPEG", ".jpg"),
+        "gif": ("GIF з палітрою", ".gif"),
+        "thumbnail": ("Мініатюра PNG", "_thumb.png"),
+    }
+
+    def __init__(self, workers=None, strip_height=256, thumbnail_size=256, jpeg_quality=90):
+        self.workers = workers or min(len(self.outputs), os.cpu_count() or 1)
+        self.options = {"strip_height": strip_height, "thumbnail_size": thumbnail_size, "jpeg_quality": jpeg_quality}
+        # Пул процесів створюється лише під час першого експорту
+        self.processes = None
+        # Знімки, які ще не звільнені; лишаються, якщо експорт скасовано до початку
+        self.snapshots = set()
+
+    # Метод для знімка композиції документа у спільній пам'яті; викликається в головному потоці,
+    # тож подальше малювання не потрапляє до експорту. Композиція, як і на екрані та під час збереження,
+    # лежить на білому папері, тож прозорість шарів до файлів не потрапляє: усі виходи непрозорі.
+    # Пікселі зберігаються як RGBX (четвертий байт не використовується), щоб процеси відображали їх у PIL
+    # без копії. Повертає спільну пам'ять і форму масиву пікселів
+    def snapshot(self, model):
+        from multiprocessing import shared_memory
+        shape = (model.height, model.width, 4)
+        memory = shared_memory.SharedMemory(create=True, size=model.height * model.width * 4)
+        self.snapshots.add(memory)
+        pixels = np.ndarray(shape, dtype=np.uint8, buffer=memory.buf)
+        strip = self.options["strip_height"]
+        for y in range(0, model.height, strip):
+            pixels[y:y + strip, :, :3] = np.asarray(model.render((0, y, model.width, min(model.height, y + strip))))
+        del pixels
+        return memory, shape
+
+    # Метод для звільнення знімка
+    def release(self, snapshot):
+        memory = snapshot[0]
+        if memory in self.snapshots:
+            self.snapshots.discard(memory)
+            memory.close()
+            memory.unlink()
+
+    # Метод для пулу процесів експорту; у фоновому експорті його створює головний потік до передачі завдання
+    def pool(self):
+        if self.processes is None:
+            self.processes = process_pool(self.workers)
+        return self.processes
+
+    # Метод для кодування виходів kinds зі знімка у файли base_path + закінчення; task (BackgroundTask)
+    # отримує прогрес і може перервати експорт. Знімок звільняється в кінці. Повертає {вихід: шлях до файлу}
+    def run(self, snapshot, base_path, kinds, task=None):
+        futures = []
+        try:
+            processes = self.pool()
+            memory, shape = snapshot
+            paths = {kind: base_path + self.outputs[kind][1] for kind in kinds}
+            futures = [processes.submit(export_output, memory.name, shape, kind, path, self.options)
+                       for kind, path in paths.items()]
+            for done, future in enumerate(futures, 1):
+                if task is not None:
+                    task.wait(future)
+                    task.report(done / len(futures))
+                else:
+                    future.result()
+            return paths
+        finally:
+            # Після скасування або помилки решта виходів знімається з черги; знімок звільняється, коли
+            # процеси, які вже кодують, його відпустять
+            for future in futures:
+                future.cancel()
+            concurrent.futures.wait(futures)
+            self.release(snapshot)
+
+    # Метод для зупинки пулу процесів і звільнення знімків скасованих експортів
+    def shutdown(self, wait=True):
+        if self.processes is not None:
+            self.processes.shutdown(wait=wait, cancel_futures=True)
+            self.processes = None
+        for memory in list(self.snapshots):
+            self.release((memory, None))
+
+
+# Клас Shape - компактний запис фігури документа. Точки лежать у спільному буфері сховища
+# (start, count - зсув і кількість точок), колір і товщина - індекси в таблицях сховища.
+
+
+class Shape:
+    __slots__ = ("kind", "start", "count", "color", "width", "extra")
+
+    def __init__(self, kind, start, count, color, width, extra=None):
+        self.kind = kind
+        self.start = start
+        self.count = count
+        self.color = color
+        self.width = width
+        # Додаткові параметри фігури: пунктир для ліній, (текст, шрифт) для тексту
+        self.extra = extra
+
+
+# Клас SpatialGrid - просторовий індекс фігур у вигляді рівномірної сітки. Клітинка зберігає номери фігур,
+# частини яких її перетинають, за зростанням, тож нові фігури дописуються в кінець, скасовані знімаються з кінця,
+# а фігури до останнього очищення полотна відсікаються двійковим пошуком. Запит переглядає лише клітинки навколо точки.
+
+
+class SpatialGrid:
+    # Найбільша кількість клітинок однієї частини фігури; більші частини перевіряються під час кожного запиту
+    max_cells = 1024
+
+    def __init__(self, cell=TILE_SIZE):
+        self.cell = cell
+        self.cells = {}
+        self.oversized = []
+        # Номери фігур очищення полотна: фігури до останньої з них уже не видно
+        self.clears = []
+
+    # Метод для діапазонів рядків і стовпців клітинок, які перетинає прямокутник box
+    def span(self, box):
+        cell = self.cell
+        return (range(math.floor(box[1] / cell), math.floor(box[3] / cell) + 1),
+                range(math.floor(box[0] / cell), math.floor(box[2] / cell) + 1))
+
+    # Метод для додавання частини фігури index з прямокутником box
+    def insert(self, index, box):
+        rows, columns = self.span(box)
+        if len(rows) * len(columns) > self.max_cells:
+            if not self.oversized or self.oversized[-1] != index:
+                self.oversized.append(index)
+            return
+        for cy in rows:
+            for cx in columns:
+                items = self.cells.get((cx, cy))
+                if items is None:
+                    self.cells[(cx, cy)] = [index]
+                elif not items or items[-1] != index:
+                    items.append(index)
+
+    # Метод для позначення фігури index, яка очищає полотно
+    def clear(self, index):
+        self.clears.append(index)
+
+    # Метод для видалення фігур, починаючи з індексу start
+    def truncate(self, start):
+        for items in itertools.chain(self.cells.values(), (self.oversized, self.clears)):
+            while items and items[-1] >= start:
+                items.pop()
+
+    # Метод для номерів фігур, частини яких можуть перетинати прямокутник box, від верхньої фігури до нижньої
+    def query(self, box):
+        floor = self.clears[-1] + 1 if self.clears else 0
+        rows, columns = self.span(box)
+        found = set(self.oversized[bisect.bisect_left(self.oversized, floor):])
+        for cy in rows:
+            for cx in columns:
+                items = self.cells.get((cx, cy))
+                if items:
+                    found.update(items[bisect.bisect_left(items, floor):])
+        return sorted(found, reverse=True)
+
+
+# Клас ShapeStore зберігає штрихи та фігури документа незалежно від полотна Tk.
+# Координати всіх фігур лежать в одному буфері float32, межі фігур - у масиві N x 4,
+# а кольори та товщини записуються один раз у таблиці, тож мільйон точок займає кілька мегабайтів.
+
+
+class ShapeStore:
+    # Усі види фігур; у файлі проєкту вид зберігається індексом у цьому списку
+    kinds = ("line", "polygon", "rectangle", "oval", "spray", "text", "fill", "clear", "image", "filter")
+    # Фігури, які є контуром з точок: для них влучання перевіряється відстанню до відрізків
+    outlines = ("line", "polygon", "rectangle")
+    # Фігури із замкненим контуром, всередині яких заливка шукає область спершу в їхніх межах
+    closed = ("polygon", "rectangle", "oval")
+    # Фігури без власного місця на полотні, які не потрапляють до просторового індексу
+    unplaced = ("fill", "clear", "image", "filter")
+    # Кількість відрізків штриха в одній частині, яка потрапляє до індексу
+    run_length = 16
+    # Допустиме відхилення проріджених точок штриха від намальованих, у пікселях
+    stroke_tolerance = 0.5
+
+    def __init__(self, capacity=4096):
+        self.points = np.empty((capacity, 2), dtype=np.float32)
+        self.size = 0
+        self.records = []
+        self.bounds = np.empty((256, 4), dtype=np.float32)
+        self.colors = []
+        self.color_ids = {}
+        self.widths = []
+        self.width_ids = {}
+        # Останній штрих, який ще можна продовжити точками (до завершення операції)
+        self.open = None
+        # Кількість початкових точок і фігур, які не змінювались від останнього збереження проєкту
+        self.clean_points = 0
+        self.clean_records = 0
+        # Просторовий індекс фігур; None - індекс ще не побудований для фігур, завантажених одним блоком
+        self.grid = SpatialGrid()
+
+    def __len__(self):
+        return len(self.records)
+
+    def __iter__(self):
+        return iter(self.records)
+
+    # Метод для отримання індексу значення у таблиці, з додаванням нового значення
+    @staticmethod
+    def intern(value, table, ids):
+        index = ids.get(value)
+        if index is None:
+            index = ids[value] = len(table)
+            table.append(value)
+        return index
+
+    # Метод для розширення буферів, щоб вмістити ще points точок та shapes фігур
+    def reserve(self, points, shapes=1):
+        if self.size + points > len(self.points):
+            grown = np.empty((max(2 * len(self.points), self.size + points), 2), dtype=np.float32)
+            grown[:self.size] = self.points[:self.size]
+            self.points = grown
+        if len(self.records) + shapes > len(self.bounds):
+            grown = np.empty((max(2 * len(self.bounds), len(self.records) + shapes), 4), dtype=np.float32)
+            grown[:len(self.records)] = self.bounds[:len(self.records)]
+            self.bounds = grown
+
+    # Метод для додавання фігури; points - плоский список [x0, y0, x1, y1, ...] або масив N x 2.
+    # Якщо extend=True і попередній штрих того ж кольору та товщини закінчується першою точкою, він продовжується.
+    def add(self, kind, points, color, width, extra=None, extend=False):
+        xy = np.asarray(points, dtype=np.float32).reshape(-1, 2)
+        color = self.intern(color, self.colors, self.color_ids)
+        width = self.intern(float(width), self.widths, self.width_ids)
+        shape = self.open
+        if (extend and shape is not None and shape.kind == kind and shape.color == color
+                and shape.width == width and shape.extra == extra):
+            if kind == "line":
+                if not np.array_equal(self.points[self.size - 1], xy[0]):
+                    shape = None
+                else:
+                    xy = xy[1:]
+        else:
+            shape = None
+        # Продовження штриха потрапляє до індексу разом з останньою точкою, щоб частина охопила весь відрізок
+        joined = shape is not None and kind == "line"
+        self.reserve(len(xy))
+        self.clean_points = min(self.clean_points, self.size)
+        self.clean_records = min(self.clean_records, len(self.records) - (shape is not None))
+        self.points[self.size:self.size + len(xy)] = xy
+        if shape is None:
+            shape = Shape(kind, self.size, 0, color, width, extra)
+            self.records.append(shape)
+            self.bounds[len(self.records) - 1] = (np.inf, np.inf, -np.inf, -np.inf)
+        self.size += len(xy)
+        shape.count += len(xy)
+        self.open = shape if extend else None
+        if len(xy):
+            bounds = self.bounds[len(self.records) - 1]
+            bounds[:2] = np.minimum(bounds[:2], xy.min(axis=0))
+            bounds[2:] = np.maximum(bounds[2:], xy.max(axis=0))
+        if self.grid is not None:
+            self.index_shape(len(self.records) - 1, shape, self.points[self.size - len(xy) - joined:self.size])
+        return shape
+
+    # Метод для просторового індексу; для фігур, завантажених одним блоком, він будується під час першого запиту
+    def spatial(self):
+        if self.grid is None:
+            self.grid = SpatialGrid()
+            for index, shape in enumerate(self.records):
+                self.index_shape(index, shape, self.xy(shape))
+        return self.grid
+
+    # Метод для додавання точок xy фігури index до індексу. Штрих додається частинами по run_length відрізків,
+    # тож клітинки охоплюють сам штрих, а не весь його прямокутник
+    def index_shape(self, index, shape, xy):
+        if shape.kind == "clear":
+            self.grid.clear(index)
+            return
+        if shape.kind in self.unplaced or not len(xy):
+            return
+        pad = self.widths[shape.width] / 2
+        step = self.run_length
+        if len(xy) <= step + 1:
+            boxes = [xy.min(axis=0).tolist() + xy.max(axis=0).tolist()]
+        else:
+            starts = np.arange(0, len(xy) - 1, step)
+            ends = np.minimum(starts + step, len(xy) - 1)
+            lows = np.minimum(np.minimum.reduceat(xy, starts), xy[ends])
+            highs = np.maximum(np.maximum.reduceat(xy, starts), xy[ends])
+            boxes = np.hstack((lows, highs)).tolist()
+        for x0, y0, x1, y1 in boxes:
+            self.grid.insert(index, (x0 - pad, y0 - pad, x1 + pad, y1 + pad))
+
+    # Метод для завершення штриха, щоб наступні точки почали нову фігуру.
+    # Точки завершеного штриха проріджуються: пензель уже намалював його, тож сховищу досить обрису для влучань
+    def seal(self):
+        shape, self.open = self.open, None
+        if shape is None or shape.kind != "line" or shape.count < 3:
+            return
+        xy = simplify_stroke(self.xy(shape), self.stroke_tolerance)
+        kept = len(xy) // 2
+        if kept == shape.count:
+            return
+        index = len(self.records) - 1
+        self.points[shape.start:shape.start + kept] = np.asarray(xy, dtype=np.float32).reshape(-1, 2)
+        self.size = shape.start + kept
+        shape.count = kept
+        self.clean_points = min(self.clean_points, shape.start)
+        self.bounds[index] = self.xy(shape).min(axis=0).tolist() + self.xy(shape).max(axis=0).tolist()
+        if self.grid is not None:
+            self.grid.truncate(index)
+            self.index_shape(index, shape, self.xy(shape))
+
+    # Метод для отримання точок фігури як масиву N x 2 без копіювання
+    def xy(self, shape):
+        return self.points[shape.start:shape.start + shape.count]
+
+    # Метод для отримання кольору та товщини фігури
+    def style(self, shape):
+        return self.colors[shape.color], self.widths[shape.width]
+
+    # Метод для відрізання фігур, починаючи з індексу start; повертає їх разом з точками для повернення
+    def cut(self, start):
+        self.open = None
+        records = self.records[start:]
+        offset = records[0].start if records else self.size
+        chunk = (records, self.points[offset:self.size].copy(), self.bounds[start:len(self.records)].copy(), offset)
+        del self.records[start:]
+        if self.grid is not None:
+            self.grid.truncate(start)
+        self.size = offset
+        self.clean_points = min(self.clean_points, offset)
+        self.clean_records = min(self.clean_records, start)
+        return chunk
+
+    # Метод для повернення відрізаних фігур у кінець сховища
+    def paste(self, chunk):
+        records, points, bounds, offset = chunk
+        self.open = None
+        self.reserve(len(points), len(records))
+        start = len(self.records)
+        self.clean_points = min(self.clean_points, self.size)
+        self.clean_records = min(self.clean_records, start)
+        for shape in records:
+            shape.start += self.size - offset
+            self.records.append(shape)
+        self.points[self.size:self.size + len(points)] = points
+        self.bounds[start:len(self.records)] = bounds
+        self.size += len(points)
+        if self.grid is not None:
+            for index in range(start, len(self.records)):
+                self.index_shape(index, self.records[index], self.xy(self.records[index]))
+
+    # Метод для пошуку верхньої фігури, яка проходить через точку (x, y) з допуском tolerance; повертає індекс або None
+    # Точно перевіряються лише фігури, які просторовий індекс знаходить біля точки
+    def hit_test(self, x, y, tolerance=2.0):
+        for index in self.spatial().query((x - tolerance, y - tolerance, x + tolerance, y + tolerance)):
+            shape = self.records[index]
+            reach = self.widths[shape.width] / 2 + tolerance
+            x0, y0, x1, y1 = self.bounds[index].tolist()
+            if x0 - reach <= x <= x1 + reach and y0 - reach <= y <= y1 + reach and self.contains(shape, x, y, reach):
+                return index
+        return None
+
+    # Метод для прямокутників замкнених фігур, всередині яких лежить точка (x, y), від верхньої фігури до нижньої
+    def enclosing(self, x, y):
+        for index in self.spatial().query((x, y, x, y)):
+            shape = self.records[index]
+            if shape.kind in self.closed and self.inside(shape, x, y):
+                pad = self.widths[shape.width] / 2 + 1
+                x0, y0, x1, y1 = self.bounds[index].tolist()
+                yield x0 - pad, y0 - pad, x1 + pad, y1 + pad
+
+    # Метод для точної перевірки, що точка лежить усередині замкненої фігури
+    def inside(self, shape, x, y):
+        xy = self.xy(shape).astype(np.float64)
+        if shape.kind in ("rectangle", "oval"):
+            (x0, y0), (x1, y1) = np.sort(xy, axis=0)
+            if shape.kind == "rectangle":
+                return x0 < x < x1 and y0 < y < y1
+            rx, ry = (x1 - x0) / 2, (y1 - y0) / 2
+            return rx > 0 and ry > 0 and ((x - (x0 + x1) / 2) / rx) ** 2 + ((y - (y0 + y1) / 2) / ry) ** 2 < 1
+        # Багатокутник: промінь праворуч від точки перетинає контур непарну кількість разів
+        a, b = xy, np.roll(xy, -1, axis=0)
+        crosses = (a[:, 1] > y) != (b[:, 1] > y)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            at = a[:, 0] + (y - a[:, 1]) * (b[:, 0] - a[:, 0]) / (b[:, 1] - a[:, 1])
+        return bool(np.count_nonzero(crosses & (x < at)) % 2)
+
+    # Метод для точної перевірки влучання точки у фігуру
+    def contains(self, shape, x, y, reach):
+        xy = self.xy(shape).astype(np.float64)
+        point = np.array((x, y))
+        if shape.kind in self.outlines:
+            if shape.kind == "rectangle":
+                (x0, y0), (x1, y1) = xy
+                xy = np.array(((x0, y0), (x1, y0), (x1, y1), (x0, y1), (x0, y0)))
+            elif shape.kind == "polygon":
+                xy = np.vstack((xy, xy[:1]))
+            if len(xy) == 1:
+                return np.hypot(*(xy[0] - point)) <= reach
+            a, b = xy[:-1], xy[1:]
+            ab = b - a
+            lengths = (ab ** 2).sum(axis=1)
+            t = np.clip(((point - a) * ab).sum(axis=1) / np.where(lengths, lengths, 1), 0, 1)
+            return np.hypot(*(a + ab * t[:, None] - point).T).min() <= reach
+        if shape.kind == "oval":
+            (x0, y0), (x1, y1) = np.sort(xy, axis=0)
+            rx, ry = max((x1 - x0) / 2, 1e-6), max((y1 - y0) / 2, 1e-6)
+            angle = math.atan2((y - (y0 + y1) / 2) / ry, (x - (x0 + x1) / 2) / rx)
+            edge = ((x0 + x1) / 2 + rx * math.cos(angle), (y0 + y1) / 2 + ry * math.sin(angle))
+            return math.hypot(x - edge[0], y - edge[1]) <= reach
+        if shape.kind == "spray":
+            return np.hypot(*(xy - point).T).min() <= reach
+        if shape.kind == "text":
+            return True
+        return False
+
+    # Метод для пакування сховища у масиви та таблиці для збереження у файл
+    def pack(self):
+        records = np.array([(shape.start, shape.count, shape.color, shape.width) for shape in self.records],
+                           dtype=np.int64).reshape(-1, 4)
+        return {
+            "points": self.points[:self.size].copy(),
+            "records": records,
+            "kinds": [shape.kind for shape in self.records],
+            "extras": [shape.extra for shape in self.records],
+            "bounds": self.bounds[:len(self.records)].copy(),
+            "colors": list(self.colors),
+            "widths": list(self.widths),
+        }
+
+    # Метод для відновлення сховища з результату pack
+    @classmethod
+    def unpack(cls, data):
+        store = cls(capacity=max(1, len(data["points"])))
+        store.points[:len(data["points"])] = data["points"]
+        store.size = len(data["points"])
+        for kind, (start, count, color, width), extra in zip(data["kinds"], data["records"].tolist(), data["extras"]):
+            store.records.append(Shape(kind, start, count, color, width, extra))
+        store.bounds = np.empty((max(256, len(store.records)), 4), dtype=np.float32)
+        store.bounds[:len(store.records)] = data["bounds"]
+        store.grid = None
+        for value in data["colors"]:
+            store.intern(value, store.colors, store.color_ids)
+        for value in data["widths"]:
+            store.intern(value, store.widths, store.width_ids)
+        return store
+
+    # Метод для позначення всього вмісту збереженим
+    def mark_clean(self):
+        self.clean_points = self.size
+        self.clean_records = len(self.records)
+
+    # Метод для оцінки пам'яті, яку займає сховище, у байтах
+    def memory(self):
+        return self.points.nbytes + self.bounds.nbytes + sum(shape.__sizeof__() for shape in self.records)
+
+
+# Клас DamageTracker збирає змінені прямокутники буфера. Прямокутники, що перекриваються
+# чи торкаються, зливаються, тож далекі один від одного мазки лишаються окремими невеликими областями.
+
+
+class DamageTracker:
+    def __init__(self, max_regions=16):
+        self.regions = []
+        # Якщо областей стає забагато, вони замінюються одним охопним прямокутником
+        self.max_regions = max_regions
+
+    # Метод для додавання зміненої області
+    def add(self, box):
+        x0, y0, x1, y1 = box
+        if x0 >= x1 or y0 >= y1:
+            return
+        merged = True
+        while merged:
+            merged = False
+            for index, (rx0, ry0, rx1, ry1) in enumerate(self.regions):
+                if rx0 <= x1 and x0 <= rx1 and ry0 <= y1 and y0 <= ry1:
+                    x0, y0, x1, y1 = min(x0, rx0), min(y0, ry0), max(x1, rx1), max(y1, ry1)
+                    del self.regions[index]
+                    merged = True
+                    break
+        self.regions.append((x0, y0, x1, y1))
+        if len(self.regions) > self.max_regions:
+            self.regions = [self.bounds()]
+
+    # Метод для обчислення прямокутника, який охоплює всі області; None, якщо змін немає
+    def bounds(self):
+        if not self.regions:
+            return None
+        x0s, y0s, x1s, y1s = zip(*self.regions)
+        return min(x0s), min(y0s), max(x1s), max(y1s)
+
+    # Метод для отримання накопичених областей з очищенням трекера
+    def take(self):
+        regions, self.regions = self.regions, []
+        return regions
+
+    def __bool__(self):
+        return bool(self.regions)
+
+
+# Клас ChangeSet накопичує зміни моделі між двома сповіщеннями: види змін у порядку появи
+# та змінені області буфера.
+
+
+class ChangeSet:
+    def __init__(self):
+        self.kinds = []
+        self.damage = DamageTracker()
+
+    # Метод для додавання зміни; box - змінена область буфера або None
+    def add(self, kind, box=None):
+        if kind not in self.kinds:
+            self.kinds.append(kind)
+        if box is not None:
+            self.damage.add(box)
+
+    # Змінені області буфера
+    @property
+    def regions(self):
+        return list(self.damage.regions)
+
+    # Прямокутник, що охоплює всі змінені області, або None
+    @property
+    def box(self):
+        return self.damage.bounds()
+
+    def __contains__(self, kind):
+        return kind in self.kinds
+
+
+# Клас Layer відповідає за один шар документа: пікселі шару та параметри, з якими він накладається.
+# Нижній шар (фон) непрозорий і зберігається в RGB, шари малювання - в RGBA.
+
+
+class Layer:
+    def __init__(self, layer_id, name, image, opacity=1.0, visible=True, blend="normal"):
+        self.id = layer_id
+        self.name = name
+        self.opacity = opacity
+        self.visible = visible
+        self.blend = blend
+        self.set_image(image)
+
+    # Метод для заміни пікселів шару
+    def set_image(self, image):
+        self.image = image
+        self.draw = ImageDraw.Draw(image)
+
+    # Метод для опису шару без пікселів (для файлу проєкту)
+    def describe(self):
+        return {"id": self.id, "name": self.name, "mode": self.image.mode, "opacity": self.opacity,
+                "visible": self.visible, "blend": self.blend}
+
+
+# Клас LayerStack відповідає за порядок шарів та їх композицію через NumPy.
+# Видимі шари під активним зводяться в кешований буфер, а шари над ним - у кешоване перетворення
+# результат = основа * scale + offset (режими normal, multiply та screen лінійні відносно основи).
+# Тому малювання на активному шарі коштує одного накладання на кожну змінену область, а кеші
+# перебудовуються лише тоді, коли змінюється склад шарів, їх параметри або вибір активного шару.
+
+
+class LayerStack:
+    def __init__(self, background):
+        self.layers = [background]
+        self.active_index = 0
+        self.next_id = background.id + 1
+        # Кеш шарів під активним, перетворення шарів над ним та шари над ним, які в перетворення не зводяться
+        self.below = None
+        self.above = None
+        self.above_layers = []
+        self.valid = False
+
+    def __len__(self):
+        return len(self.layers)
+
+    def __iter__(self):
+        return iter(self.layers)
+
+    def __getitem__(self, index):
+        return self.layers[index]
+
+    # Активний шар, на якому малюють інструменти
+    @property
+    def active(self):
+        return self.layers[self.active_index]
+
+    # Чи складається документ з одного шару (тоді композиція - це сам шар)
+    @property
+    def single(self):
+        return len(self.layers) == 1
+
+    # Розміри шарів
+    @property
+    def size(self):
+        return self.layers[0].image.size
+
+    # Метод для додавання прозорого шару над активним; новий шар стає активним
+    def add(self, name=None):
+        layer = Layer(self.next_id, name or f"Шар {self.next_id}", Image.new("RGBA", self.size, (0, 0, 0, 0)))
+        self.next_id += 1
+        self.active_index += 1
+        self.layers.insert(self.active_index, layer)
+        self.invalidate()
+        return layer
+
+    # Метод для видалення шару; останній шар видалити не можна
+    def remove(self, index):
+        if self.single:
+            raise ValueError("Документ повинен мати хоча б один шар")
+        del self.layers[index]
+        # Після видалення активного шару активним стає той, що був над ним (або під ним, якщо той був верхнім)
+        if self.active_index > index or self.active_index == len(self.layers):
+            self.active_index -= 1
+        self.invalidate()
+
+    # Метод для вибору активного шару
+    def select(self, index):
+        if index != self.active_index:
+            self.active_index = index
+            self.invalidate()
+
+    # Метод для позначення кешів застарілими; перебудуються вони під час наступної композиції
+    def invalidate(self):
+        self.valid = False
+        self.below = None
+        self.above = None
+        self.above_layers = []
+
+    # Метод для копіювання шарів разом з пікселями
+    def copy(self):
+        layers = [Layer(layer.id, layer.name, layer.image.copy(), layer.opacity, layer.visible, layer.blend)
+                  for layer in self.layers]
+        stack = LayerStack(layers[0])
+        stack.layers = layers
+        stack.active_index = self.active_index
+        stack.next_id = self.next_id
+        return stack
+
+    # Метод для опису шарів без пікселів (для файлу проєкту)
+    def describe(self):
+        return {"layers": [layer.describe() for layer in self.layers], "active": self.active_index,
+                "next": self.next_id}
+
+    # Метод для читання кольору (H x W x 3) та непрозорості області шару у float32 від 0 до 1
+    @staticmethod
+    def pixels(layer, box):
+        data = np.asarray(layer.image.crop(box), dtype=np.float32) / 255
+        if layer.image.mode == "RGBA":
+            return data[..., :3], data[..., 3:] * np.float32(layer.opacity)
+        return data, np.float32(layer.opacity)
+
+    # Метод для накладання кольору color з непрозорістю alpha на основу base у режимі mode
+    @staticmethod
+    def blend(mode, base, color, alpha):
+        if mode == "multiply":
+            mixed = base * color
+        elif mode == "screen":
+            mixed = base + color - base * color
+        elif mode == "overlay":
+            mixed = np.where(base < 0.5, 2 * base * color, 1 - 2 * (1 - base) * (1 - color))
+        else:
+            mixed = color
+        return base + alpha * (mixed - base)
+
+    # Метод для подання накладання у вигляді основа * scale + offset; режим overlay так не подається
+    @staticmethod
+    def linear(mode, color, alpha):
+        if mode == "multiply":
+            return 1 - alpha + alpha * color, 0
+        elif mode == "screen":
+            return 1 - alpha * color, alpha * color
+        return 1 - alpha, alpha * color
+
+    # Метод для перебудови кешів композиції
+    def rebuild(self):
+        width, height = self.size
+        box = (0, 0, width, height)
+        # Під усіма шарами лежить білий папір
+        below = np.ones((height, width, 3), dtype=np.float32)
+        for layer in self.layers[:self.active_index]:
+            if layer.visible and layer.opacity > 0:
+                below = self.blend(layer.blend, below, *self.pixels(layer, box))
+        self.below = below
+        above = [layer for layer in self.layers[self.active_index + 1:] if layer.visible and layer.opacity > 0]
+        if any(layer.blend == "overlay" for layer in above):
+            # Перекриття залежить від основи нелінійно, тож такі шари накладаються по черзі на кожну область
+            self.above_layers = above
+        elif above:
+            scale = np.ones((height, width, 3), dtype=np.float32)
+            offset = np.zeros((height, width, 3), dtype=np.float32)
+            for layer in above:
+                layer_scale, layer_offset = self.linear(layer.blend, *self.pixels(layer, box))
+                scale = scale * layer_scale
+                offset = offset * layer_scale + layer_offset
+            self.above = scale, offset
+        self.valid = True
+
+    # Метод для композиції області box; повертає RGB-зображення
+    def render(self, box):
+        active = self.active
+        if self.single and active.image.mode == "RGB" and active.visible and active.opacity == 1 \
+                and active.blend == "normal":
+            return active.image.crop(box)
+        if not self.valid:
+            self.rebuild()
+        x0, y0, x1, y1 = box
+        result = self.below[y0:y1, x0:x1]
+        if active.visible and active.opacity > 0:
+            result = self.blend(active.blend, result, *self.pixels(active, box))
+        if self.above is not None:
+            scale, offset = self.above
+            result = result * scale[y0:y1, x0:x1] + offset[y0:y1, x0:x1]
+        for layer in self.above_layers:
+            result = self.blend(layer.blend, result, *self.pixels(layer, box))
+        return Image.fromarray(np.clip(result * 255 + 0.5, 0, 255).astype(np.uint8))
+
+    # Метод для композиції всього документа
+    def flatten(self):
+        width, height = self.size
+        return self.render((0, 0, width, height))
+
+
+# Клас ProjectFile відповідає за власний формат проєкту: заголовок, фрагменти даних та індекс фрагментів.
+# Растр кожного шару зберігається плитками, фігури - масивами точок, меж і записів із запасом місця.
+# Збереження дописує лише змінені фрагменти та новий індекс, а заголовок, що вказує на індекс,
+# переписується останнім, тож перерваний запис лишає попередню версію цілою.
+# Масиви фігур під час відкриття відображаються у пам'ять і читаються лише тоді, коли до них звертаються.
+# Плитки растру натомість читаються одразу всі: шари - звичайні зображення PIL, а композиція шарів і
+# операції над цілим шаром (заливка, фільтри, журнал) потребують усіх пікселів.
+
+
+class ProjectFile:
+    magic = b"RGEPROJ1"
+    # Заголовок: сигнатура, зсув та довжина індексу
+    header = struct.Struct("<8sQQ")
+    # Запис фігури у файлі; межі та точки зберігаються окремими масивами
+    record_dtype = np.dtype([("kind", "u1"), ("start", "<i8"), ("count", "<i8"), ("color", "<u4"), ("width", "<u4")])
+    # Вирівнювання фрагментів та частка невикористаного місця, після якої файл переписується начисто
+    alignment = 64
+    compact_threshold = 0.5
+
+    def __init__(self, path):
+        self.path = path
+        self.index = None
+        self.size = 0
+
+    # Метод для збереження моделі; metadata - довільні дані, що зберігаються в індексі.
+    # Повертає кількість записаних байтів фрагментів
+    def save(self, model, metadata=None):
+        # Проєкт без шарів переписується повністю, щоб плитки одразу отримали імена з номером шару
+        if self.index is None or "layers" not in self.index or not os.path.exists(self.path):
+            return self.rewrite(model, metadata)
+        garbage = self.index["garbage"]
+        if garbage > 16 * 1024 * 1024 and garbage > self.compact_threshold * self.size:
+            return self.rewrite(model, metadata)
+        if metadata is not None:
+            self.index["metadata"] = metadata
+        with open(self.path, "r+b") as file:
+            return self.write(file, model, full=False)
+
+    # Метод для запису проєкту у новий файл, який замінює старий лише після повного запису
+    def rewrite(self, model, metadata=None):
+        descriptor, temporary = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(self.path)), suffix=".part")
+        self.index = {"width": model.width, "height": model.height, "chunks": {}, "arrays": {}, "garbage": 0,
+                      "metadata": metadata or {}}
+        self.size = self.header.size
+        try:
+            with os.fdopen(descriptor, "w+b") as file:
+                file.write(bytes(self.header.size))
+                written = self.write(file, model, full=True)
+            os.replace(temporary, self.path)
+        except BaseException:
+            self.index = None
+            if os.path.exists(temporary):
+                os.remove(temporary)
+            raise
+        return written
+
+    # Метод для запису змінених фрагментів, індексу та заголовка
+    def write(self, file, model, full):
+        store = model.shapes
+        layers = {layer.id: layer for layer in model.layers}
+        written = 0
+        if full:
+            tiles = {(layer_id, tx, ty) for layer_id in layers for ty in range(-(-model.height // TILE_SIZE))
+                     for tx in range(-(-model.width // TILE_SIZE))}
+        else:
+            tiles = model.dirty_tiles
+        for layer_id, tx, ty in sorted(tiles):
+            if layer_id in layers:
+                image = layers[layer_id].image
+                data = image.crop(History.tile_box(image, tx, ty)).tobytes()
+                written += self.put(file, f"tile/{layer_id}/{tx}/{ty}", data)
+        # Плитки видалених шарів стають невикористаним місцем
+        for name in [name for name in self.index["chunks"] if int(name.split("/")[1]) not in layers]:
+            self.index["garbage"] += self.index["chunks"].pop(name)[1]
+        self.index["layers"] = model.layers.describe()
+        clean_points = 0 if full else store.clean_points
+        clean_records = 0 if full else store.clean_records
+        written += self.put_array(file, "points", lambda a, b: store.points[a:b], store.size, clean_points, 8)
+        written += self.put_array(file, "bounds", lambda a, b: store.bounds[a:b], len(store), clean_records, 16)
+        written += self.put_array(file, "records", lambda a, b: self.records(store, a, b), len(store), clean_records,
+                                  self.record_dtype.itemsize)
+        # Додаткові параметри фігур рідкісні, тож зберігаються в індексі; незмінена частина береться з попереднього
+        extras = {key: value for key, value in self.index.get("extras", {}).items() if int(key) < clean_records}
+        for index in range(clean_records, len(store)):
+            if store.records[index].extra is not None:
+                extras[str(index)] = store.records[index].extra
+        self.index.update(extras=extras, colors=store.colors, widths=store.widths)
+        file.flush()
+        os.fsync(file.fileno())
+        # Індекс дописується в кінець, а заголовок переводиться на нього лише після того, як дані вже на диску
+        previous = self.index.get("location")
+        if previous:
+            self.index["garbage"] += previous[1]
+        index = json.dumps(self.index).encode("utf-8")
+        offset = self.allocate(file, len(index))
+        self.index["location"] = (offset, len(index))
+        file.seek(offset)
+        file.write(index)
+        file.flush()
+        os.fsync(file.fileno())
+        file.seek(0)
+        file.write(self.header.pack(self.magic, offset, len(index)))
+        file.flush()
+        os.fsync(file.fileno())
+        return written
+
+    # Метод для виділення місця в кінці файлу; повертає зсув
+    def allocate(self, file, length):
+        offset = -(-self.size // self.alignment) * self.alignment
+        self.size = offset + length
+        file.truncate(self.size)
+        return offset
+
+    # Метод для запису фрагмента в нове місце; попередня версія фрагмента стає невикористаним місцем
+    def put(self, file, name, data):
+        previous = self.index["chunks"].get(name)
+        if previous:
+            self.index["garbage"] += previous[1]
+        offset = self.allocate(file, len(data))
+        file.seek(offset)
+        file.write(data)
+        self.index["chunks"][name] = (offset, len(data))
+        return len(data)
+
+    # Метод для запису масиву з рядками розміру row_size, з яких перші clean не змінювались.
+    # Якщо збережені рядки не змінились і нові вміщуються в запас, вони дописуються на місці,
+    # інакше масив переноситься в кінець файлу з подвоєним запасом.
+    def put_array(self, file, name, rows, count, clean, row_size):
+        entry = self.index["arrays"].get(name)
+        if entry is not None and clean >= min(entry["count"], count) and count <= entry["capacity"]:
+            start = min(entry["count"], count)
+            if count > start:
+                file.seek(entry["offset"] + start * row_size)
+                file.write(np.ascontiguousarray(rows(start, count)).tobytes())
+            entry["count"] = count
+            return (count - start) * row_size
+        if entry is not None:
+            self.index["garbage"] += entry["capacity"] * row_size
+        capacity = max(1024, 2 * count)
+        offset = self.allocate(file, capacity * row_size)
+        file.seek(offset)
+        file.write(np.ascontiguousarray(rows(0, count)).tobytes())
+        self.index["arrays"][name] = {"offset": offset, "capacity": capacity, "count": count}
+        return count * row_size
+
+    # Метод для побудови записів фігур з індексами start..end у форматі файлу
+    def records(self, store, start, end):
+        table = np.empty(end - start, dtype=self.record_dtype)
+        shapes = store.records[start:end]
+        codes = {kind: code for code, kind in enumerate(store.kinds)}
+        table["kind"] = [codes[shape.kind] for shape in shapes]
+        table["start"] = [shape.start for shape in shapes]
+        table["count"] = [shape.count for shape in shapes]
+        table["color"] = [shape.color for shape in shapes]
+        table["width"] = [shape.width for shape in shapes]
+        return table
+
+    # Метод для відкриття проєкту; повертає шари та сховище фігур
+    def load(self):
+        with open(self.path, "rb") as file:
+            magic, offset, length = self.header.unpack(file.read(self.header.size))
+            if magic != self.magic:
+                raise ValueError("Файл не є проєктом редактора")
+            file.seek(offset)
+            index = json.loads(file.read(length))
+        data = np.memmap(self.path, dtype=np.uint8, mode="r")
+        size = (index["width"], index["height"])
+        description = index.get("layers", {"layers": [{"id": 0, "name": "Фон", "mode": "RGB"}], "active": 0, "next": 1})
+        layers = {}
+        for entry in description["layers"]:
+            image = Image.new(entry["mode"], size, "white" if entry["mode"] == "RGB" else 0)
+            layers[entry["id"]] = Layer(entry["id"], entry["name"], image, entry.get("opacity", 1.0),
+                                        entry.get("visible", True), entry.get("blend", "normal"))
+        for name, (offset, length) in index["chunks"].items():
+            # Проєкти без шарів зберігали плитки єдиного буфера як tile/tx/ty
+            parts = [int(part) for part in name.split("/")[1:]]
+            layer_id, tx, ty = parts if len(parts) == 3 else [0] + parts
+            image = layers[layer_id].image
+            box = History.tile_box(image, tx, ty)
+            tile = Image.frombuffer(image.mode, (box[2] - box[0], box[3] - box[1]), data[offset:offset + length],
+                                    "raw", image.mode, 0, 1)
+            image.paste(tile, box[:2])
+        stack = LayerStack(layers[description["layers"][0]["id"]])
+        stack.layers = [layers[entry["id"]] for entry in description["layers"]]
+        stack.active_index = description["active"]
+        stack.next_id = description["next"]
+        # Масиви фігур відображаються з копіюванням під час запису: зміни в пам'яті не потрапляють у файл
+        arrays = {}
+        for name, dtype, shape in (("points", np.float32, (2,)), ("bounds", np.float32, (4,)),
+                                   ("records", self.record_dtype, ())):
+            entry = index["arrays"][name]
+            arrays[name] = np.memmap(self.path, dtype=dtype, mode="c", offset=entry["offset"],
+                                     shape=(entry["capacity"],) + shape)
+        count = index["arrays"]["records"]["count"]
+        table = arrays["records"][:count]
+        extras = index["extras"]
+        store = ShapeStore(capacity=1)
+        store.records = [
+            Shape(store.kinds[kind], start, points, color, width,
+                  tuple(extras[str(number)]) if str(number) in extras else None)
+            for number, (kind, start, points, color, width) in enumerate(zip(
+                table["kind"].tolist(), table["start"].tolist(), table["count"].tolist(),
+                table["color"].tolist(), table["width"].tolist()))
+        ]
+        store.points = arrays["points"]
+        store.size = index["arrays"]["points"]["count"]
+        store.bounds = arrays["bounds"]
+        store.grid = None
+        for value in index["colors"]:
+            store.intern(value, store.colors, store.color_ids)
+        for value in index["widths"]:
+            store.intern(value, store.widths, store.width_ids)
+        store.mark_clean()
+        self.index = index
+        self.size = os.path.getsize(self.path)
+        return stack, store
+
+
+# Клас Journal веде журнал дій для відновлення після збою.
+# Головний потік лише кладе дію в чергу, а фоновий потік кодує її, дописує у файл
+# і викликає fsync не частіше, ніж раз на fsync_interval секунд. Час від часу стан документа
+# зберігається знімком у форматі проєкту, після чого журнал починається заново.
+# Відновлення - це відкриття знімка та повторення записів журналу того ж покоління.
+
+
+class Journal:
+    magic = b"RGEJRNL1"
+    # Заголовок журналу: сигнатура та покоління знімка, до якого дописуються записи
+    header = struct.Struct("<8sQ")
+    # Заголовок запису: довжина опису, довжина даних та контрольна сума
+    frame = struct.Struct("<III")
+
+    def __init__(self, directory, model=None, fsync_interval=0.5, batch_interval=0.05, snapshot_records=5000,
+                 snapshot_interval=60):
+        self.directory = directory
+        self.path = os.path.join(directory, "journal.bin")
+        self.snapshot_path = os.path.join(directory, "snapshot.rgep")
+        self.fsync_interval = fsync_interval
+        # Фоновий потік прокидається не частіше за batch_interval, щоб не перебивати обробку подій на кожному записі
+        self.batch_interval = batch_interval
+        self.snapshot_records = snapshot_records
+        self.snapshot_interval = snapshot_interval
+        os.makedirs(directory, exist_ok=True)
+        # Якщо передано модель (наприклад, щойно відновлену), її стан спершу зберігається знімком,
+        # і лише потім старий журнал очищається
+        if model is not None:
+            self.generation = self.snapshot_generation(self.snapshot_path) + 1
+            ProjectFile(self.snapshot_path).rewrite(self.copy(model), {"journal": self.generation})
+        else:
+            self.discard(directory)
+            self.generation = 0
+        self.file = open(self.path, "wb")
+        self.file.write(self.header.pack(self.magic, self.generation))
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.records = 0
+        self.last_snapshot = time.monotonic()
+        self.error = None
+        self.queue = queue.Queue()
+        self.writer = threading.Thread(target=self.run, name="journal-writer", daemon=True)
+        self.writer.start()
+
+    # Метод для додавання дії у журнал; у головному потоці лише ставить її в чергу
+    def append(self, op, args, parts=()):
+        if self.error is None:
+            self.queue.put(("record", op, args, parts))
+            self.records += 1
+
+    # Метод для збереження знімка, якщо з попереднього накопичилось багато записів або минуло багато часу
+    def maybe_snapshot(self, model):
+        if self.records >= self.snapshot_records or (
+                self.records and time.monotonic() - self.last_snapshot >= self.snapshot_interval):
+            self.snapshot(model)
+
+    # Метод для збереження знімка у фоновому потоці: у головному потоці лише копіюється стан
+    def snapshot(self, model):
+        self.generation += 1
+        self.queue.put(("snapshot", self.copy(model), self.generation))
+        self.records = 0
+        self.last_snapshot = time.monotonic()
+
+    # Метод для копіювання стану моделі, який потрібен для знімка
+    @staticmethod
+    def copy(model):
+        state = types.SimpleNamespace(width=model.width, height=model.height, dirty_tiles=set())
+        state.layers = model.layers.copy()
+        state.shapes = ShapeStore.unpack(model.shapes.pack())
+        return state
+
+    # Метод для очікування, поки всі записи черги потраплять на диск
+    def flush(self):
+        done = threading.Event()
+        self.queue.put(("flush", done))
+        done.wait()
+
+    # Метод для зупинки журналу; discard=True видаляє його разом зі знімком (звичайне завершення роботи)
+    def close(self, discard=False):
+        self.queue.put(("close",))
+        self.writer.join()
+        if discard:
+            self.discard(self.directory)
+
+    # Метод фонового потоку: записи, що накопичились у черзі, кодуються одним пакетом, fsync - раз на fsync_interval
+    def run(self):
+        unsynced = False
+        last_sync = time.monotonic()
+        while True:
+            timeout = max(0.0, self.fsync_interval - (time.monotonic() - last_sync)) if unsynced else None
+            try:
+                batch = [self.queue.get(timeout=timeout)]
+            except queue.Empty:
+                batch = []
+            while True:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            records = []
+            for command, *args in batch + [("end",)]:
+                if command == "record":
+                    records.append(args)
+                    continue
+                try:
+                    if records and self.error is None:
+                        self.file.write(self.encode(records))
+                        unsynced = True
+                    records = []
+                    if command == "snapshot":
+                        self.sync()
+                        state, generation = args
+                        ProjectFile(self.snapshot_path).rewrite(state, {"journal": generation})
+                        self.file.seek(0)
+                        self.file.truncate()
+                        self.file.write(self.header.pack(self.magic, generation))
+                        self.sync()
+                        unsynced = False
+                    elif command == "flush":
+                        self.sync()
+                        unsynced = False
+                        args[0].set()
+                    elif command == "close":
+                        self.sync()
+                        self.file.close()
+                        return
+                except OSError as e:
+                    # Журнал не повинен заважати роботі: після помилки запису він просто вимикається
+                    self.error = e
+                    if command == "flush":
+                        args[0].set()
+            if unsynced and time.monotonic() - last_sync >= self.fsync_interval:
+                try:
+                    self.sync()
+                except OSError as e:
+                    self.error = e
+                unsynced = False
+                last_sync = time.monotonic()
+            if batch:
+                time.sleep(self.batch_interval)
+
+    # Метод для скидання записаного на диск
+    def sync(self):
+        if self.error is None:
+            self.file.flush()
+            os.fsync(self.file.fileno())
+
+    # Метод для кодування пакета записів (op, args, parts): описи дій у JSON та їх дані (точки, пікселі)
+    # у двійковому вигляді. Координати зі списків збираються в один масив, щоб не перетворювати кожен окремо
+    @classmethod
+    def encode(cls, records):
+        metas = []
+        blobs = []
+        floats = []
+        for op, args, parts in records:
+            lengths = []
+            for part in parts:
+                if isinstance(part, (list, tuple)):
+                    floats.extend(part)
+                    lengths.append(4 * len(part))
+                    continue
+                if floats:
+                    blobs.append(np.array(floats, dtype=np.float32).tobytes())
+                    floats = []
+                if isinstance(part, Image.Image):
+                    blobs.append(zlib.compress(part.tobytes(), 1))
+                else:
+                    blobs.append(np.asarray(part, dtype=np.float32).tobytes())
+                lengths.append(len(blobs[-1]))
+            metas.append([op, args, lengths])
+        if floats:
+            blobs.append(np.array(floats, dtype=np.float32).tobytes())
+        meta = json.dumps(metas, separators=(",", ":")).encode("utf-8")
+        blob = b"".join(blobs)
+        return cls.frame.pack(len(meta), len(blob), zlib.crc32(blob, zlib.crc32(meta))) + meta + blob
+
+    # Метод для читання записів журналу; зупиняється на першому неповному чи пошкодженому пакеті
+    @classmethod
+    def read(cls, path):
+        with open(path, "rb") as file:
+            data = file.read()
+        if len(data) < cls.header.size:
+            return None, []
+        magic, generation = cls.header.unpack_from(data)
+        if magic != cls.magic:
+            return None, []
+        records = []
+        position = cls.header.size
+        while position + cls.frame.size <= len(data):
+            meta_length, blob_length, checksum = cls.frame.unpack_from(data, position)
+            start = position + cls.frame.size
+            end = start + meta_length + blob_length
+            if end > len(data) or zlib.crc32(data[start:end]) != checksum:
+                break
+            offset = start + meta_length
+            for op, args, lengths in json.loads(data[start:start + meta_length]):
+                parts = []
+                for length in lengths:
+                    parts.append(data[offset:offset + length])
+                    offset += length
+                records.append((op, args, parts))
+            position = end
+        return generation, records
+
+    # Метод для отримання покоління знімка; 0, якщо знімка немає або його не вдається прочитати
+    @staticmethod
+    def snapshot_generation(path):
+        if not os.path.exists(path):
+            return 0
+        try:
+            with open(path, "rb") as file:
+                magic, offset, length = ProjectFile.header.unpack(file.read(ProjectFile.header.size))
+                file.seek(offset)
+                return json.loads(file.read(length))["metadata"].get("journal", 0)
+        except (OSError, ValueError, KeyError, struct.error):
+            return 0
+
+    # Метод для перевірки, чи лишилась після попереднього запуску незбережена робота
+    @classmethod
+    def exists(cls, directory):
+        path = os.path.join(directory, "journal.bin")
+        if os.path.exists(os.path.join(directory, "snapshot.rgep")):
+            return True
+        return os.path.exists(path) and bool(cls.read(path)[1])
+
+    # Метод для видалення журналу та знімка
+    @staticmethod
+    def discard(directory):
+        for name in ("journal.bin", "snapshot.rgep"):
+            path = os.path.join(directory, name)
+            if os.path.exists(path):
+                os.remove(path)
+
+    # Метод для відновлення моделі зі знімка та записів журналу; повертає кількість повторених записів
+    @classmethod
+    def recover(cls, directory, model):
+        snapshot_path = os.path.join(directory, "snapshot.rgep")
+        generation = cls.snapshot_generation(snapshot_path)
+        if generation:
+            model.open_project(snapshot_path)
+            model.project = None
+        path = os.path.join(directory, "journal.bin")
+        journal_generation, records = cls.read(path) if os.path.exists(path) else (None, [])
+        # Журнал старшого покоління вже увійшов у знімок
+        if journal_generation != generation:
+            records = []
+        journal, model.journal = model.journal, None
+        try:
+            for op, args, parts in records:
+                cls.apply(model, op, args, parts)
+        finally:
+            model.journal = journal
+        model.history = History(model.history.memory_limit, model.history.compress)
+        return len(records)
+
+    # Метод для повторення однієї дії журналу
+    @staticmethod
+    def apply(model, op, args, parts):
+        def points(part):
+            return np.frombuffer(part, dtype=np.float32).tolist()
+
+        def image(part, mode, size):
+            return Image.frombytes(mode, tuple(size), zlib.decompress(part))
+
+        if op == "line":
+            color, width, dash, round_caps = args
+            model.draw_line(points(parts[0]), color, width, dash=tuple(dash) if dash else None, round_caps=round_caps)
+        elif op == "paint":
+            color, width, start, hardness, spacing = args
+            engine = model.brush_engine
+            settings = engine.hardness, engine.spacing
+            engine.hardness, engine.spacing = hardness, spacing
+            try:
+                model.paint(points(parts[0]), color, width, start)
+            finally:
+                engine.hardness, engine.spacing = settings
+        elif op == "rectangle":
+            model.draw_rectangle(*points(parts[0]), *args)
+        elif op == "polygon":
+            model.draw_polygon(points(parts[0]), *args)
+        elif op == "oval":
+            model.draw_oval(*points(parts[0]), *args)
+        elif op == "spray":
+            model.stamp(np.frombuffer(parts[0], dtype=np.float32).reshape(-1, 2).astype(np.intp), args[0])
+        elif op == "text":
+            x, y, text, color, family, size = args
+            model.draw_text(x, y, text, color, (family, size))
+        elif op == "fill":
+            x, y, color, tolerance, connectivity = args
+            engine = model.fill_engine
+            settings = engine.tolerance, engine.connectivity
+            engine.tolerance, engine.connectivity = tolerance, connectivity
+            try:
+                model.fill_area(x, y, color)
+            finally:
+                engine.tolerance, engine.connectivity = settings
+        elif op == "clear":
+            model.clear_screen()
+        elif op == "image":
+            model.open_image(image(parts[0], *args))
+        elif op == "filter":
+            name, params, mode, size = args
+            model.apply_filtered(image(parts[0], mode, size), name, params)
+        elif op == "add_layer":
+            model.add_layer(*args)
+        elif op == "remove_layer":
+            model.remove_layer()
+        elif op == "select_layer":
+            model.select_layer(*args)
+        elif op == "configure_layer":
+            model.configure_layer(*args)
+        elif op in ("undo", "redo"):
+            box, count, shapes = args
+            model.image.paste(image(parts[0], model.image.mode, (box[2] - box[0], box[3] - box[1])), tuple(box[:2]))
+            model.shapes.cut(count)
+            xy = np.frombuffer(parts[1], dtype=np.float32).reshape(-1, 2) if len(parts) > 1 else None
+            offset = 0
+            for kind, length, color, width, extra in shapes:
+                model.shapes.add(kind, xy[offset:offset + length], color, width, tuple(extra) if extra else None)
+                offset += length
+            model.shapes.seal()
+            model.notify("image", tuple(box))
+
 
 # Клас DrawModel відповідає за модель додатка.
 
 
 class DrawModel:
-    def __init__(self):
+    def __init__(self, width=1250, height=600, background="white"):
         # Ініціалізація початковий колір лінії та колір для видалення
         self.line_color = "black"
-        self.erase_color = "white"
+        self.erase_color = background
         # Координати попередньої точки
         self.prev_x = None
         self.prev_y = None
-        # Список обсерверів, яким буде надсилатись сповіщення про зміни
-        self.observers = set()
+        # Розміри документа та шари; інструменти рендеряться у растровий буфер активного шару
+        self.width = width
+        self.height = height
+        self.layers = LayerStack(Layer(0, "Фон", Image.new("RGB", (self.width, self.height), self.erase_color)))
+        # Рушій заливки з налаштуваннями допуску кольору та зв'язності
+        self.fill_engine = FloodFillEngine()
+        # Рушій розпилювача з налаштуваннями щільності та розподілу крапель
+        self.spray_engine = SprayEngine()
+        # Рушій пензля олівця та гумки з кешем масок відбитків
+        self.brush_engine = BrushEngine()
+        # Історія змін буфера для скасування та повторення дій
+        self.history = History()
+        # Штрихи та фігури документа у компактному вигляді та індекс першої фігури поточної операції
+        self.shapes = ShapeStore()
+        self.operation_start = None
+        # Файл проєкту, з яким пов'язаний документ, та плитки шарів (номер шару, tx, ty), змінені після його збереження
+        self.project = None
+        self.dirty_tiles = set()
+        # Відкрите велике зображення (TiledImage), з піраміди якого беруться зменшені плитки, та позначки плиток
+        # TILE_SIZE, де композиція змінилась після відкриття
+        self.source = None
+        self.source_edits = None
+        # Журнал дій для відновлення після збою; None, якщо журнал не ведеться
+        self.journal = None
+        # Список обсерверів, яким буде надсилатись сповіщення про зміни, у порядку підписки
+        self.observers = []
+        # Зміни, які ще не надіслані обсерверам, та функція для відкладеного надсилання (наприклад, root.after_idle).
+        # Без неї сповіщення надсилаються одразу.
+        self.changes = None
+        self.scheduler = None
+        self.flush_scheduled = False
+
+    # Растровий буфер активного шару
+    @property
+    def image(self):
+        return self.layers.active.image
+
+    @image.setter
+    def image(self, image):
+        self.layers.active.set_image(image)
+        self.layers.invalidate()
+
+    # Об'єкт для малювання у буфері активного шару
+    @property
+    def image_draw(self):
+        return self.layers.active.draw
+
+    # Колір, яким гумка стирає активний шар: фон зафарбовується кольором паперу, а шари малювання стають прозорими
+    @property
+    def erase_ink(self):
+        return self.erase_color if self.image.mode == "RGB" else "#00000000"
 
     # Метод для встановлення кольору
     def set_color(self, col):
         self.line_color = col
-        self.notify()
+        self.notify("color")
 
     # Метод для встановлення коліру гумки
     def set_erase_color(self):
         self.line_color = self.erase_color
-        self.notify()
+        self.notify("color")
 
     # Метод для очищення екрану
     def clear_screen(self):
         self.prev_x = None
         self.prev_y = None
-        self.notify()
+        started = self.begin_operation()
+        self.history.touch(self.image, (0, 0, self.width, self.height))
+        self.image_draw.rectangle((0, 0, self.width, self.height), fill=self.erase_ink)
+        self.shapes.add("clear", (), self.erase_ink, 0)
+        self.log("clear", [])
+        if started:
+            self.end_operation()
+        self.notify("image", (0, 0, self.width, self.height))
+
+    # Метод для початку операції, яку можна буде скасувати; повертає False, якщо операція вже триває
+    def begin_operation(self):
+        started = self.history.begin()
+        if started:
+            self.operation_start = len(self.shapes)
+        return started
+
+    # Метод для завершення операції; items - елементи полотна, що показують її результат
+    def end_operation(self, items=()):
+        operation = self.history.end(items)
+        self.shapes.seal()
+        if self.operation_start is not None:
+            # Фігури операції, яка не змінила буфер, не потрапляють у документ
+            if operation is None:
+                self.shapes.cut(self.operation_start)
+            else:
+                operation.shape_start = self.operation_start
+                operation.layer = self.layers.active
+            self.operation_start = None
+        if self.journal is not None:
+            self.journal.maybe_snapshot(self)
+        return operation
+
+    # Метод для скасування останньої операції; повертає операцію або None.
+    # Шар, який змінила операція, стає активним
+    def undo(self):
+        self.select_operation_layer(self.history.peek())
+        operation = self.history.undo(self.image)
+        if operation:
+            operation.shapes = self.shapes.cut(operation.shape_start)
+            box = operation.box(self.width, self.height)
+            # Скасування у журналі записується результатом, бо знімок не містить історії
+            if self.journal is not None:
+                self.log("undo", [box, len(self.shapes), []], self.image.crop(box))
+            self.notify("image", box)
+        return operation
+
+    # Метод для повторення скасованої операції; повертає операцію або None
+    def redo(self):
+        self.select_operation_layer(self.history.peek(redo=True))
+        operation = self.history.redo(self.image)
+        if operation:
+            self.shapes.paste(operation.shapes)
+            operation.shapes = None
+            box = operation.box(self.width, self.height)
+            if self.journal is not None:
+                shapes = self.shapes.records[operation.shape_start:]
+                records = [[shape.kind, shape.count, *self.shapes.style(shape), shape.extra] for shape in shapes]
+                self.log("redo", [box, operation.shape_start, records],
+                         self.image.crop(box), self.shapes.points[shapes[0].start:self.shapes.size].copy()
+                         if shapes else ())
+            self.notify("image", box)
+        return operation
+
+    # Метод для вибору шару, який змінила операція
+    def select_operation_layer(self, operation):
+        if operation is not None and operation.layer is not None and operation.layer is not self.layers.active:
+            self.select_layer(self.layers.layers.index(operation.layer))
+
+    # Метод для малювання лінії (або ламаної) у растровому буфері
+    def draw_line(self, points, color, width, dash=None, round_caps=False):
+        width = max(1, round(width))
+        box = bounding_box(points, width)
+        self.history.touch(self.image, box)
+        if dash:
+            for i in range(0, len(points) - 2, 2):
+                self.draw_dashed_segment(*points[i:i + 4], color, width, dash)
+        else:
+            self.image_draw.line(points, fill=color, width=width, joint="curve")
+        if round_caps and width > 2:
+            radius = width / 2
+            for x, y in ((points[0], points[1]), (points[-2], points[-1])):
+                self.image_draw.ellipse((x - radius, y - radius, x + radius, y + radius), fill=color)
+        # Відрізки олівця, що йдуть один за одним, складаються в один штрих сховища
+        self.shapes.add("line", points, color, width, extra=dash, extend=not dash)
+        self.log("line", [color, width, dash, round_caps], points)
+        self.notify("image", box)
+
+    # Метод для нанесення відрізків штриха пензлем; start=True починає новий штрих.
+    # Повертає змінений прямокутник або None
+    def paint(self, points, color, width, start=False):
+        width = max(1, round(width))
+        engine = self.brush_engine
+        box = engine.stroke(self.image, points, ImageColor.getcolor(color, "RGBA"), width, start,
+                            before_change=lambda box: self.history.touch(self.image, box))
+        self.shapes.add("line", points, color, width, extend=True)
+        self.log("paint", [color, width, start, engine.hardness, engine.spacing], points)
+        if box:
+            self.notify("image", box)
+        return box
+
+    # Метод для малювання одного пунктирного відрізка
+    def draw_dashed_segment(self, x0, y0, x1, y1, color, width, dash):
+        length = ((x1 - x0) ** 2 + (y1 - y0) ** 2) ** 0.5
+        if not length:
+            return
+        dx = (x1 - x0) / length
+        dy = (y1 - y0) / length
+        on, off = dash
+        position = 0
+        while position < length:
+            end = min(position + on, length)
+            self.image_draw.line((x0 + dx * position, y0 + dy * position, x0 + dx * end, y0 + dy * end),
+                                 fill=color, width=width)
+            position = end + off
+
+    # Метод для малювання контуру прямокутника
+    def draw_rectangle(self, x0, y0, x1, y1, color, width):
+        width = max(1, round(width))
+        half = width // 2
+        x0, x1 = sorted((x0, x1))
+        y0, y1 = sorted((y0, y1))
+        box = bounding_box((x0, y0, x1, y1), width)
+        self.history.touch(self.image, box)
+        self.image_draw.rectangle((x0 - half, y0 - half, x1 + half, y1 + half), outline=color, width=width)
+        self.shapes.add("rectangle", (x0, y0, x1, y1), color, width)
+        self.log("rectangle", [color, width], (x0, y0, x1, y1))
+        self.notify("image", box)
+
+    # Метод для малювання контуру многокутника
+    def draw_polygon(self, points, color, width):
+        width = max(1, round(width))
+        box = bounding_box(points, width)
+        self.history.touch(self.image, box)
+        self.image_draw.line(list(points) + list(points[:2]), fill=color, width=width, joint="curve")
+        self.shapes.add("polygon", points, color, width)
+        self.log("polygon", [color, width], points)
+        self.notify("image", box)
+
+    # Метод для малювання контуру овалу
+    def draw_oval(self, x0, y0, x1, y1, color, width):
+        width = max(1, round(width))
+        half = width // 2
+        x0, x1 = sorted((x0, x1))
+        y0, y1 = sorted((y0, y1))
+        box = bounding_box((x0, y0, x1, y1), width)
+        self.history.touch(self.image, box)
+        self.image_draw.ellipse((x0 - half, y0 - half, x1 + half, y1 + half), outline=color, width=width)
+        self.shapes.add("oval", (x0, y0, x1, y1), color, width)
+        self.log("oval", [color, width], (x0, y0, x1, y1))
+        self.notify("image", box)
+
+    # Метод для малювання фігури tool з SHAPE_TOOLS за точками, які дає shape_points
+    def draw_shape(self, tool, points, color, width):
+        if tool in ("line", "dashed_line"):
+            self.draw_line(points, color, width, dash=DASH_PATTERN if tool == "dashed_line" else None)
+        elif tool == "rectangle":
+            self.draw_rectangle(*points, color, width)
+        elif tool == "triangle":
+            self.draw_polygon(points, color, width)
+        elif tool == "oval":
+            self.draw_oval(*points, color, width)
+
+    # Метод для розпилення порції крапель навколо (x, y); повертає змінений прямокутник або None
+    def spray(self, x, y, radius, color):
+        points = self.spray_engine.burst(x, y, radius)
+        inside = (points >= 0).all(axis=1) & (points[:, 0] < self.width) & (points[:, 1] < self.height)
+        return self.stamp(points[inside], color)
+
+    # Метод для нанесення крапель розпилювача у точках points (масив N x 2); повертає змінений прямокутник або None
+    def stamp(self, points, color):
+        if not len(points):
+            return None
+        x0, y0 = points.min(axis=0).tolist()
+        x1, y1 = (points.max(axis=0) + 1).tolist()
+        self.history.touch(self.image, (x0, y0, x1, y1))
+        # Краплі ставляться одним присвоєнням у копію області, а область повертається у буфер
+        region = np.array(self.image.crop((x0, y0, x1, y1)))
+        region[points[:, 1] - y0, points[:, 0] - x0] = ImageColor.getcolor(color, self.image.mode)
+        self.image.paste(Image.fromarray(region), (x0, y0))
+        self.shapes.add("spray", points, color, 1, extend=True)
+        self.log("spray", [color], points)
+        self.notify("image", (x0, y0, x1, y1))
+        return x0, y0, x1, y1
+
+    # Метод для малювання тексту, font - це пара (назва шрифту, розмір у пунктах)
+    def draw_text(self, x, y, text, color, font):
+        family, size = font
+        font = self.load_font(family, size)
+        box = self.image_draw.textbbox((x, y), text, font=font, anchor="mm")
+        self.history.touch(self.image, box)
+        self.image_draw.text((x, y), text, fill=color, font=font, anchor="mm")
+        # Перша точка - центр тексту, дві наступні - його межі
+        self.shapes.add("text", (x, y) + tuple(box), color, 0, extra=(text, family, size))
+        self.log("text", [x, y, text, color, family, size])
+        self.notify("image", box)
+
+    # Метод для завантаження шрифту, який відповідає шрифту Tk
+    @staticmethod
+    def load_font(family, size):
+        files = {
+            "Arial": "arial.ttf",
+            "Calibri": "calibri.ttf",
+            "Courier New": "cour.ttf",
+            "Times New Roman": "times.ttf",
+        }
+        # Tk задає розмір у пунктах, а PIL - у пікселях (96 точок на дюйм)
+        pixels = round(size * 96 / 72)
+        try:
+            return ImageFont.truetype(files.get(family, family), pixels)
+        except OSError:
+            return ImageFont.load_default(pixels)
+
+    # Метод для заливки області однакового кольору; повертає змінений прямокутник або None
+    def fill_area(self, x, y, color):
+        if 0 <= x < self.width and 0 <= y < self.height:
+            # Замкнені фігури навколо точки підказують, де шукати область, щоб не обробляти все полотно
+            box = self.fill_engine.fill(self.image, x, y, color,
+                                        before_change=lambda box: self.history.touch(self.image, box),
+                                        windows=self.shapes.enclosing(x, y))
+            if box:
+                self.shapes.add("fill", (x, y), color, 0)
+                self.log("fill", [x, y, color, self.fill_engine.tolerance, self.fill_engine.connectivity])
+                self.notify("image", box)
+            return box
+        return None
+
+    # Метод для піпетки: колір верхньої фігури під точкою (x, y) стає кольором малювання. Фігуру знаходить
+    # просторовий індекс сховища, тож на краю згладженого штриха береться його колір, а не змішаний піксель.
+    # Де фігури немає або вона стирала до прозорості, береться колір композиції. Повертає вибраний колір
+    def pick_color(self, x, y):
+        if not (0 <= x < self.width and 0 <= y < self.height):
+            return None
+        index = self.shapes.hit_test(x, y)
+        color = self.shapes.style(self.shapes.records[index])[0] if index is not None else None
+        if color is None or ImageColor.getrgb(color)[3:] == (0,):
+            x, y = math.floor(x), math.floor(y)
+            color = "#%02x%02x%02x" % self.render((x, y, x + 1, y + 1)).getpixel((0, 0))
+        self.set_color(color)
+        return color
+
+    # Метод для розміщення відкритого зображення по центру фонового (нижнього) шару; активний шар не змінюється
+    @profiled("model.open_image")
+    def open_image(self, image):
+        active = self.layers.active_index
+        self.select_layer(0)
+        started = self.begin_operation()
+        self.history.touch(self.image, (0, 0, self.width, self.height))
+        self.image_draw.rectangle((0, 0, self.width, self.height), fill=self.erase_color)
+        image = image.convert("RGBA")
+        x = (self.width - image.width) // 2
+        y = (self.height - image.height) // 2
+        self.image.paste(image, (x, y), image)
+        # Пікселі зображення живуть лише в буфері, у сховищі лишається його розташування
+        self.shapes.add("image", (x, y, x + image.width, y + image.height), self.erase_color, 0)
+        self.log("image", [image.mode, image.size], image)
+        if started:
+            self.end_operation()
+        self.notify("image", (0, 0, self.width, self.height))
+        self.select_layer(active)
+
+    # Метод для відкриття великого зображення новим документом його розміру. Фоном стає повнорозмірне зображення,
+    # яке TiledImage підготував у фоні, а піраміда TiledImage дає зменшені плитки вигляду, поки їх область
+    # не змінено. Як і після відкриття проєкту, фігури та історія починаються наново
+    @profiled("model.open_tiled")
+    def open_tiled(self, tiled):
+        self.layers = LayerStack(Layer(0, "Фон", tiled.image))
+        self.width, self.height = tiled.width, tiled.height
+        self.shapes = ShapeStore()
+        self.history = History(self.history.memory_limit, self.history.compress)
+        self.operation_start = None
+        self.project = None
+        self.source = None
+        self.notify("layers")
+        self.notify("image", (0, 0, self.width, self.height))
+        self.dirty_tiles.clear()
+        self.source = tiled
+        self.source_edits = np.zeros((-(-self.height // TILE_SIZE), -(-self.width // TILE_SIZE)), dtype=bool)
+        if self.journal is not None:
+            self.journal.snapshot(self)
+
+    # Метод для плитки (tx, ty) рівня level піраміди відкритого великого зображення зі стороною size;
+    # None, якщо такого джерела немає або композиція в області плитки змінилась після відкриття
+    def source_tile(self, level, tx, ty, size):
+        source = self.source
+        if source is None or source.tile_size != size:
+            return None
+        span = size * 2 ** level // TILE_SIZE
+        if self.source_edits[ty * span:(ty + 1) * span, tx * span:(tx + 1) * span].any():
+            return None
+        tile = source.tile(level, tx, ty)
+        if tile.mode == "RGBA":
+            paper = Image.new("RGB", tile.size, "white")
+            paper.paste(tile, mask=tile)
+            tile = paper
+        return tile
+
+    # Метод для заміни пікселів активного шару результатом фільтра name з параметрами params
+    def apply_filtered(self, image, name, params):
+        started = self.begin_operation()
+        self.history.touch(self.image, (0, 0, self.width, self.height))
+        self.image.paste(image)
+        # Пікселі результату живуть лише в буфері, у сховищі лишається назва фільтра та його параметри
+        self.shapes.add("filter", (), self.erase_color, 0, extra=(name,) + tuple(params))
+        self.log("filter", [name, list(params), image.mode, image.size], image)
+        if started:
+            self.end_operation()
+        self.notify("image", (0, 0, self.width, self.height))
+
+    # Метод для збереження композиції шарів у файл без захоплення екрану
+    @profiled("model.save_image")
+    def save_image(self, file_path):
+        self.layers.flatten().save(file_path)
+
+    # Метод для композиції шарів в області box; повертає RGB-зображення. Прочитані сторінки відкритого
+    # великого зображення одразу звільняються, тож прокручування не накопичує його в пам'яті процесу
+    def render(self, box):
+        image = self.layers.render(box)
+        if self.source is not None:
+            self.source.release()
+        return image
+
+    # Метод для додавання прозорого шару над активним; новий шар стає активним
+    def add_layer(self, name=None):
+        layer = self.layers.add(name)
+        self.log("add_layer", [layer.name])
+        self.notify("layers")
+        return layer
+
+    # Метод для видалення активного шару; повертає False, якщо це єдиний шар.
+    # Операції видаленого шару вже не скасувати, тож історія починається наново
+    def remove_layer(self):
+        if self.layers.single:
+            return False
+        self.layers.remove(self.layers.active_index)
+        self.history = History(self.history.memory_limit, self.history.compress)
+        self.operation_start = None
+        self.log("remove_layer", [])
+        self.notify("layers")
+        self.notify("image", (0, 0, self.width, self.height))
+        return True
+
+    # Метод для вибору активного шару за його індексом (0 - нижній)
+    def select_layer(self, index):
+        if index != self.layers.active_index:
+            self.layers.select(index)
+            self.log("select_layer", [index])
+            self.notify("layers")
+
+    # Метод для зміни непрозорості (0..1), видимості та режиму накладання шару; None лишає параметр без змін
+    def configure_layer(self, index, opacity=None, visible=None, blend=None):
+        if blend is not None and blend not in BLEND_MODES:
+            raise ValueError(f"Невідомий режим накладання: {blend}")
+        layer = self.layers[index]
+        changes = {name: value for name, value in (("opacity", opacity), ("visible", visible), ("blend", blend))
+                   if value is not None and getattr(layer, name) != value}
+        if not changes:
+            return
+        for name, value in changes.items():
+            setattr(layer, name, value)
+        self.layers.invalidate()
+        self.log("configure_layer", [index, opacity, visible, blend])
+        self.notify("layers")
+        self.notify("image", (0, 0, self.width, self.height))
+
+    # Метод для збереження проєкту; у той самий файл дописуються лише зміни. Повертає кількість записаних байтів
+    @profiled("model.save_project")
+    def save_project(self, file_path):
+        if self.project is None or self.project.path != file_path:
+            self.project = ProjectFile(file_path)
+        written = self.project.save(self)
+        self.dirty_tiles.clear()
+        self.shapes.mark_clean()
+        return written
+
+    # Метод для відкриття проєкту: буфер і фігури замінюються, історія починається наново
+    @profiled("model.open_project")
+    def open_project(self, file_path):
+        project = ProjectFile(file_path)
+        self.layers, self.shapes = project.load()
+        self.width, self.height = self.layers.size
+        self.source = None
+        self.history = History(self.history.memory_limit, self.history.compress)
+        self.operation_start = None
+        self.project = project
+        self.notify("layers")
+        self.notify("image", (0, 0, self.width, self.height))
+        self.dirty_tiles.clear()
+        # Відкритий проєкт не повторюється з журналу, тож одразу стає новим знімком
+        if self.journal is not None:
+            self.journal.snapshot(self)
+
+    # Метод для обліку пам'яті документа у байтах: буфери шарів, кеші композиції, історія та сховище фігур
+    def memory_usage(self):
+        layers = sum(layer.image.width * layer.image.height * len(layer.image.getbands()) for layer in self.layers)
+        caches = sum(array.nbytes for array in (self.layers.below, *(self.layers.above or ())) if array is not None)
+        return {"layers": layers, "composite": caches, "history": self.history.size,
+                "shapes": self.shapes.points.nbytes + self.shapes.bounds.nbytes,
+                "process_peak": Profiler.process_memory()}
+
+    # Метод для запису дії у журнал відновлення
+    def log(self, op, args, *parts):
+        if self.journal is not None:
+            self.journal.append(op, args, parts)
 
     # Метод для підписки на сповіщення
     def subscribe(self, observer):
-        self.observers.add(observer)
+        if observer not in self.observers:
+            self.observers.append(observer)
 
     # Метод для відписки від сповіщень
     def unsubscribe(self, observer):
         self.observers.remove(observer)
 
-    # Метод для сповіщення обсерверів про зміни
-    def notify(self):
-        for observer in self.observers:
-            observer.update()
+    # Метод для встановлення функції відкладеного надсилання сповіщень
+    def set_scheduler(self, scheduler):
+        self.scheduler = scheduler
+
+    # Метод для сповіщення обсерверів про зміну kind в області box.
+    # Зміни до надсилання об'єднуються, тож серія змін дає одне сповіщення.
+    @profiled("model.notify")
+    def notify(self, kind="state", box=None):
+        if box is not None:
+            box = (max(0, box[0]), max(0, box[1]), min(self.width, box[2]), min(self.height, box[3]))
+            if box[0] >= box[2] or box[1] >= box[3]:
+                box = None
+        if kind == "image" and box is not None:
+            if self.source is not None:
+                self.source_edits[box[1] // TILE_SIZE:-(-box[3] // TILE_SIZE),
+                                  box[0] // TILE_SIZE:-(-box[2] // TILE_SIZE)] = True
+            layer_id = self.layers.active.id
+            self.dirty_tiles.update((layer_id, tx, ty)
+                                    for ty in range(box[1] // TILE_SIZE, (box[3] - 1) // TILE_SIZE + 1)
+                                    for tx in range(box[0] // TILE_SIZE, (box[2] - 1) // TILE_SIZE + 1))
+        if self.changes is None:
+            self.changes = ChangeSet()
+        self.changes.add(kind, box)
+        if self.scheduler is None:
+            self.flush()
+        elif not self.flush_scheduled:
+            self.flush_scheduled = True
+            self.scheduler(self.flush)
+
+    # Метод для надсилання накопичених змін обсерверам у порядку підписки.
+    # Зміни, зроблені обсерверами під час надсилання, потрапляють у наступне сповіщення.
+    def flush(self):
+        self.flush_scheduled = False
+        changes, self.changes = self.changes, None
+        if changes is None:
+            return
+        for observer in list(self.observers):
+            observer.update(changes)
+
+
+# Клас ShapePreview відповідає за тимчасову фігуру, яку видно під час перетягування мишею.
+# Елемент полотна створюється один раз за жест, далі змінюються лише його координати,
+# а після відпускання кнопки той самий елемент стає остаточною фігурою.
+
+
+class ShapePreview:
+    def __init__(self, view):
+        self.view = view
+        self.item = None
+
+    # Метод для оновлення тимчасової фігури
+    def update(self, create, coords, options):
+        if self.item is None:
+            self.item = create(*coords, tags="temp", **options)
+        else:
+            self.view.canvas.coords(self.item, *coords)
+
+    # Метод для перетворення тимчасової фігури на остаточну; повертає елемент полотна
+    def commit(self, create, coords, options):
+        if self.item is None:
+            return create(*coords, **options)
+        item = self.item
+        self.item = None
+        self.view.canvas.coords(item, *coords)
+        self.view.canvas.dtag(item, "temp")
+        return item
+
+    # Метод для видалення незавершеної тимчасової фігури
+    def cancel(self):
+        if self.item is not None:
+            self.view.canvas.delete(self.item)
+            self.item = None
+
+
+# Клас CanvasCompactor не дає кількості елементів полотна рости без меж. Растровий буфер уже містить результат
+# кожної завершеної дії, тож елементи старих дій прибираються з полотна одним викликом після чергового кадру,
+# коли растр під ними актуальний. У моделі дії лишаються і скасовуються, як і раніше, через плитки історії.
+
+
+class CanvasCompactor:
+    def __init__(self, view, keep_operations=64, max_items=4000):
+        self.view = view
+        # Скільки останніх дій зберігають свої елементи та найбільша кількість елементів дій на полотні
+        self.keep_operations = keep_operations
+        self.max_items = max_items
+        # Елементи дій від найстарішої до найновішої та їх загальна кількість
+        self.groups = deque()
+        self.count = 0
+
+    # Метод для обліку елементів щойно завершеної дії
+    def track(self, items):
+        if items:
+            self.groups.append(tuple(items))
+            self.count += len(items)
+
+    # Метод для забування елементів скасованої дії; скасовується завжди найновіша дія
+    def discard(self, items):
+        if self.groups and self.groups[-1] == tuple(items):
+            self.count -= len(self.groups.pop())
+
+    # Метод для забування всіх елементів, коли їх прибрано з полотна
+    def reset(self):
+        self.groups.clear()
+        self.count = 0
+
+    # Метод для перевірки, чи пора прибирати елементи
+    def due(self):
+        return len(self.groups) > self.keep_operations or self.count > self.max_items
+
+    # Метод для видалення елементів старих дій; повертає кількість видалених елементів. Найновіша дія
+    # лишається завжди, а після перевищення ліміту елементів лишається половина ліміту, щоб прибирання
+    # не запускалось після кожної дії
+    @profiled("view.compact")
+    def compact(self):
+        stale = []
+        while len(self.groups) > 1 and (len(self.groups) > self.keep_operations or self.count > self.max_items // 2):
+            group = self.groups.popleft()
+            self.count -= len(group)
+            stale.extend(group)
+        if stale:
+            self.view.canvas.delete(*stale)
+        return len(stale)
+
+
+# Клас Viewport описує видиму частину документа: масштаб (пікселів екрана на піксель документа) та точку документа
+# в лівому верхньому куті області малювання. Через нього координати полотна переводяться в координати документа
+# і назад. Масштаб змінюється кроками у чверть октави, тож після збільшень і зменшень повертається точно до 1.
+
+
+class Viewport:
+    # Кількість кроків масштабу на подвоєння та межі масштабу в кроках (від 1/32 до 32)
+    steps_per_octave = 4
+    min_step = -20
+    max_step = 20
+
+    def __init__(self, width, height):
+        # Розмір області малювання на екрані та розмір документа
+        self.width = width
+        self.height = height
+        self.document = (width, height)
+        self.scale = 1
+        self.x = 0
+        self.y = 0
+
+    # Метод для перевірки, що документ показано без масштабу та зсуву
+    def identity(self):
+        return self.scale == 1 and self.x == 0 and self.y == 0
+
+    # Метод для зміни розміру документа
+    def set_document(self, width, height):
+        self.document = (width, height)
+        self.clamp()
+
+    # Метод для утримання зсуву в межах документа; документ, менший за область малювання, стоїть у її куті
+    def clamp(self):
+        self.x = min(max(0, self.document[0] - self.width / self.scale), max(0, self.x))
+        self.y = min(max(0, self.document[1] - self.height / self.scale), max(0, self.y))
+        if self.scale == 1:
+            self.x, self.y = round(self.x), round(self.y)
+
+    # Метод для зміни масштабу на steps кроків так, щоб точка (sx, sy) області малювання лишилась на місці
+    def zoom(self, steps, sx, sy):
+        step = round(math.log2(self.scale) * self.steps_per_octave) + steps
+        scale = 2 ** (min(self.max_step, max(self.min_step, step)) / self.steps_per_octave)
+        self.x += sx / self.scale - sx / scale
+        self.y += sy / self.scale - sy / scale
+        self.scale = scale
+        self.clamp()
+
+    # Метод для зсуву вмісту на (dx, dy) пікселів екрана
+    def pan(self, dx, dy):
+        self.x -= dx / self.scale
+        self.y -= dy / self.scale
+        self.clamp()
+
+    # Метод для масштабу, за якого весь документ вміщується в область малювання
+    def fit(self):
+        self.scale = min(self.width / self.document[0], self.height / self.document[1])
+        self.x = self.y = 0
+        self.clamp()
+
+    # Метод для показу документа в реальному розмірі
+    def reset(self):
+        self.scale = 1
+        self.x = self.y = 0
+
+    # Метод для переведення координат області малювання (x0, y0, x1, y1, ...) у координати документа
+    def to_document(self, coords):
+        if self.identity():
+            return list(coords)
+        return [c / self.scale + (self.y if i % 2 else self.x) for i, c in enumerate(coords)]
+
+    # Метод для прямокутника області малювання, який показує прямокутник документа box; None, якщо його не видно
+    def to_screen(self, box):
+        scale = self.scale
+        x0 = max(0, math.floor((max(0, box[0]) - self.x) * scale))
+        y0 = max(0, math.floor((max(0, box[1]) - self.y) * scale))
+        x1 = min(self.width, math.ceil((min(self.document[0], box[2]) - self.x) * scale))
+        y1 = min(self.height, math.ceil((min(self.document[1], box[3]) - self.y) * scale))
+        return (x0, y0, x1, y1) if x0 < x1 and y0 < y1 else None
+
+    # Метод для видимої частини документа
+    def visible(self):
+        return (math.floor(self.x), math.floor(self.y),
+                min(self.document[0], math.ceil(self.x + self.width / self.scale)),
+                min(self.document[1], math.ceil(self.y + self.height / self.scale)))
+
+
+# Клас MipmapCache зберігає композицію документа плитками на кількох рівнях: кожен рівень удвічі менший
+# за попередній і будується з чотирьох його плиток. Зменшений великий документ малюється з малого рівня,
+# а не перераховується з повної роздільності щокадру; змінена область скидає плитки всіх рівнів над нею.
+# Кожен рівень має власний LRU-кеш, тож побудова дрібного рівня не витісняє вже готові плитки крупних.
+# Якщо документ має готову піраміду (відкрите велике зображення), плитки незмінених областей беруться з неї.
+
+
+class MipmapCache:
+    def __init__(self, render, tile_size=256, cache_size=128, source=None):
+        # Функція композиції області документа (рівень 0), розмір плитки та найбільша кількість плиток рівня
+        self.render_source = render
+        # Функція source(level, tx, ty, tile_size) для готової плитки рівня; None - плитку треба будувати
+        self.source = source
+        self.tile_size = tile_size
+        self.cache_size = cache_size
+        # Плитки за рівнями: рівень -> OrderedDict {(tx, ty): зображення}
+        self.cache = {}
+        self.size = (0, 0)
+
+    # Метод для зміни розміру документа; плитки старого документа вже не потрібні
+    def set_document(self, width, height):
+        if (width, height) != self.size:
+            self.size = (width, height)
+            self.cache.clear()
+
+    # Метод для скидання плиток, які перекривають змінену область документа box
+    def invalidate(self, box):
+        for level, tiles in self.cache.items():
+            span = self.tile_size * 2 ** level
+            tx0, ty0, tx1, ty1 = box[0] // span, box[1] // span, (box[2] - 1) // span, (box[3] - 1) // span
+            for key in [(tx, ty) for tx, ty in tiles if tx0 <= tx <= tx1 and ty0 <= ty <= ty1]:
+                del tiles[key]
+
+    # Метод для обчислення розміру рівня
+    def level_size(self, level):
+        return -(-self.size[0] // 2 ** level), -(-self.size[1] // 2 ** level)
+
+    # Метод для отримання плитки рівня: рівень 0 береться з композиції, решта - з готової піраміди документа
+    # або зменшенням чотирьох плиток попереднього рівня
+    def tile(self, level, tx, ty):
+        tiles = self.cache.setdefault(level, OrderedDict())
+        tile = tiles.get((tx, ty))
+        if tile is not None:
+            tiles.move_to_end((tx, ty))
+            return tile
+        size = self.tile_size
+        if level == 0:
+            width, height = self.size
+            tile = self.render_source((tx * size, ty * size, min(width, (tx + 1) * size),
+                                       min(height, (ty + 1) * size)))
+        elif self.source is not None:
+            tile = self.source(level, tx, ty, size)
+        if tile is None:
+            width, height = self.level_size(level - 1)
+            x0, y0 = 2 * tx * size, 2 * ty * size
+            block = Image.new("RGB", (min(width, x0 + 2 * size) - x0, min(height, y0 + 2 * size) - y0))
+            for cy in range(2 * ty, min(2 * ty + 2, -(-height // size))):
+                for cx in range(2 * tx, min(2 * tx + 2, -(-width // size))):
+                    block.paste(self.tile(level - 1, cx, cy), (cx * size - x0, cy * size - y0))
+            tile = block.reduce(2)
+        tiles[(tx, ty)] = tile
+        while len(tiles) > self.cache_size:
+            tiles.popitem(last=False)
+        return tile
+
+    # Метод для відмальовування області документа box (дробові координати) у розмір size з рівня, найближчого
+    # до масштабу scale; збільшений документ показується чіткими пікселями
+    def render(self, box, size, scale):
+        level = max(0, math.floor(math.log2(1 / scale)))
+        factor = 2 ** level
+        width, height = self.level_size(level)
+        lx0, ly0 = max(0, math.floor(box[0] / factor)), max(0, math.floor(box[1] / factor))
+        lx1, ly1 = min(width, math.ceil(box[2] / factor)), min(height, math.ceil(box[3] / factor))
+        canvas = Image.new("RGB", (max(1, lx1 - lx0), max(1, ly1 - ly0)))
+        tile = self.tile_size
+        for ty in range(ly0 // tile, (ly1 - 1) // tile + 1):
+            for tx in range(lx0 // tile, (lx1 - 1) // tile + 1):
+                canvas.paste(self.tile(level, tx, ty), (tx * tile - lx0, ty * tile - ly0))
+        crop = (min(canvas.width, max(0, box[0] / factor - lx0)), min(canvas.height, max(0, box[1] / factor - ly0)),
+                min(canvas.width, box[2] / factor - lx0), min(canvas.height, box[3] / factor - ly0))
+        resample = Image.Resampling.NEAREST if scale >= 1 else Image.Resampling.BILINEAR
+        return canvas.resize(size, resample, box=crop)
 
 
 # Клас DrawView відповідає за представлення додатка та його інтерфейс.
@@ -60,22 +3689,55 @@ class DrawView:
         self.root = root
         self.presenter = presenter
         self.current_tool = "pencil"
+        # Чи наступний відрізок олівця чи гумки починає новий штрих пензля
+        self.stroke_start = False
+        # Тимчасова фігура для ліній, прямокутників, трикутників та овалів
+        self.preview = ShapePreview(self)
+        # Прибирання елементів старих дій, які вже є в растрі
+        self.compactor = CanvasCompactor(self)
+        # Видима частина документа, зменшені рівні його композиції та точка, з якої почалось перетягування вигляду
+        self.viewport = Viewport(1250, 600)
+        self.mipmaps = MipmapCache(lambda box: self.presenter.model.render(box),
+                                   source=lambda *tile: self.presenter.model.source_tile(*tile))
+        self.mipmaps.set_document(*self.viewport.document)
+        self.pan_start = None
+        # Області буфера, які ще не перенесені на екран, запланований кадр та час попереднього кадру
+        self.damage = DamageTracker()
+        self.frame_pending = None
+        self.last_frame = 0.0
+        # Вікно панелі шарів, якщо воно відкрите, та чи оновлюється панель зараз за станом моделі
+        self.layers_dialog = None
+        self.updating_layers = False
+        # Заплановане оновлення накладки зі статистикою (None, якщо накладка прихована) та його період у мс
+        self.overlay_job = None
+        self.overlay_interval = 500
         # Налаштування основних властивостей вікна
         self.root.title("Растровий графічний редактор")
-        self.root.geometry("1280x720")
+        self.root.geometry("1280x750")
         self.root.resizable(False, False)
         self.root.config(bg="#38454F")
         # Налаштування інтерфейсу
         self.setup_ui()
 
-    # Метод для налаштування інтерфейсу
+    # Метод для налаштування інтерфейсу: одразу будується все, що потрібно для малювання,
+    # а меню та палітра кольорів - після першого показу полотна
     def setup_ui(self):
-        self.create_color_palette()
-        self.create_menu()
         self.create_tool_buttons()
         self.create_width_selector()
         self.create_draw_area()
+        self.create_status_bar()
         self.set_cursor()
+        self.canvas.bind("<Expose>", self.canvas_exposed)
+
+    # Метод для обробки першого показу полотна: другорядний інтерфейс стає в чергу після перемальовування вікна
+    def canvas_exposed(self, event):
+        self.canvas.unbind("<Expose>")
+        self.root.after_idle(self.setup_deferred_ui)
+
+    # Метод для побудови другорядної частини інтерфейсу
+    def setup_deferred_ui(self):
+        self.create_color_palette()
+        self.create_menu()
 
     # Метод для створення меню
     def create_menu(self):
@@ -85,12 +3747,59 @@ class DrawView:
         file_menu = tk.Menu(menu_bar, tearoff=0)
         file_menu.add_command(label="Відкрити", command=self.presenter.open_image)
         file_menu.add_command(label="Зберегти", command=self.presenter.save_image)
+        file_menu.add_command(label="Експортувати як...", command=self.show_export)
+        file_menu.add_separator()
+        file_menu.add_command(label="Відкрити проєкт", command=self.presenter.open_project)
+        file_menu.add_command(label="Зберегти проєкт", command=self.presenter.save_project)
         file_menu.add_separator()
         file_menu.add_command(label="Очистити", command=self.presenter.clear_screen)
         file_menu.add_separator()
         file_menu.add_command(label="Вихід", command=self.presenter.exit_application)
         menu_bar.add_cascade(label="Файл", menu=file_menu)
 
+        filters_menu = tk.Menu(menu_bar, tearoff=0)
+        for name, (title, parameters) in FilterEngine.filters.items():
+            filters_menu.add_command(label=title + ("..." if parameters else ""),
+                                     command=lambda name=name: self.show_filter(name))
+        menu_bar.add_cascade(label="Фільтри", menu=filters_menu)
+
+        edit_menu = tk.Menu(menu_bar, tearoff=0)
+        edit_menu.add_command(label="Скасувати", accelerator="Ctrl+Z", command=self.presenter.undo)
+        edit_menu.add_command(label="Повторити", accelerator="Ctrl+Y", command=self.presenter.redo)
+        edit_menu.add_separator()
+        edit_menu.add_command(label="Піпетка", command=lambda: self.set_tool("picker"))
+        menu_bar.add_cascade(label="Редагування", menu=edit_menu)
+
+        layers_menu = tk.Menu(menu_bar, tearoff=0)
+        layers_menu.add_command(label="Панель шарів", command=self.show_layers)
+        layers_menu.add_separator()
+        layers_menu.add_command(label="Додати шар", command=self.presenter.add_layer)
+        layers_menu.add_command(label="Видалити шар", command=self.presenter.remove_layer)
+        menu_bar.add_cascade(label="Шари", menu=layers_menu)
+
+        view_menu = tk.Menu(menu_bar, tearoff=0)
+        view_menu.add_command(label="Збільшити", accelerator="Ctrl++", command=lambda: self.zoom(1))
+        view_menu.add_command(label="Зменшити", accelerator="Ctrl+-", command=lambda: self.zoom(-1))
+        view_menu.add_command(label="Реальний розмір", accelerator="Ctrl+0", command=self.zoom_actual)
+        view_menu.add_command(label="Вмістити у вікно", command=self.zoom_fit)
+        menu_bar.add_cascade(label="Вигляд", menu=view_menu)
+
+        debug_menu = tk.Menu(menu_bar, tearoff=0)
+        debug_menu.add_command(label="Статистика продуктивності", accelerator="F12", command=self.toggle_overlay)
+        debug_menu.add_command(label="Зберегти статистику...", command=self.presenter.dump_statistics)
+        debug_menu.add_command(label="Скинути статистику", command=self.presenter.reset_statistics)
+        debug_menu.add_separator()
+        debug_menu.add_command(label="Почати / зупинити запис сеансу", command=self.presenter.toggle_recording)
+        debug_menu.add_command(label="Відтворити сеанс...", command=self.presenter.replay_session)
+        menu_bar.add_cascade(label="Налагодження", menu=debug_menu)
+        self.root.bind("<F12>", lambda event: self.toggle_overlay())
+        self.root.bind("<Control-z>", lambda event: self.presenter.undo())
+        self.root.bind("<Control-y>", lambda event: self.presenter.redo())
+        self.root.bind("<Control-plus>", lambda event: self.zoom(1))
+        self.root.bind("<Control-equal>", lambda event: self.zoom(1))
+        self.root.bind("<Control-minus>", lambda event: self.zoom(-1))
+        self.root.bind("<Control-0>", lambda event: self.zoom_actual())
+
     # Метод для створення кнопок вибору інстументів
     def create_tool_buttons(self):
         buttons = [
@@ -131,6 +3840,8 @@ class DrawView:
             self.canvas.config(cursor="spraycan")
         elif self.current_tool == "text":
             self.canvas.config(cursor="top_tee")
+        elif self.current_tool == "picker":
+            self.canvas.config(cursor="crosshair")
         else:
             self.canvas.config(cursor="tcross")
 
@@ -142,6 +3853,8 @@ class DrawView:
             self.canvas.bind("<Button-1>", self.fill_canvas)
         elif self.current_tool == "text":
             self.canvas.bind("<Button-1>", self.place_text)
+        elif self.current_tool == "picker":
+            self.canvas.bind("<Button-1>", self.pick_color)
         else:
             self.canvas.bind("<Button-1>", self.start_drawing)
 
@@ -221,73 +3934,200 @@ class DrawView:
         self.canvas.bind("<Button-1>", self.start_drawing)
         self.canvas.bind("<B1-Motion>", self.draw)
         self.canvas.bind("<ButtonRelease-1>", self.end_drawing)
+        # Коліщатко миші змінює масштаб (на X11 воно надходить кнопками 4 і 5), середня кнопка зсуває вигляд
+        self.canvas.bind("<MouseWheel>", lambda event: self.zoom(1 if event.delta > 0 else -1, event))
+        self.canvas.bind("<Button-4>", lambda event: self.zoom(1, event))
+        self.canvas.bind("<Button-5>", lambda event: self.zoom(-1, event))
+        self.canvas.bind("<Button-2>", self.start_pan)
+        self.canvas.bind("<B2-Motion>", self.pan)
+        # Зсув області малювання відносно рамки полотна
+        self.offset = int(self.canvas["bd"]) + int(self.canvas["highlightthickness"])
+        # Зображення, яке показує растровий буфер під елементами полотна
+        self.raster_photo = tk.PhotoImage(master=self.root, width=1250, height=600)
+        self.create_raster_item()
+
+    # Метод для створення рядка стану з прогресом фонових завдань та кнопкою їх скасування
+    def create_status_bar(self):
+        self.status_frame = tk.Frame(self.root, bg="#38454F")
+        self.status_frame.place(x=7, y=720, width=1266, height=26)
+        self.status_label = tk.Label(self.status_frame, font=("Corbel", 11), bg="#38454F", fg="white", anchor="w")
+        self.status_label.pack(side=tk.LEFT, fill=tk.X, expand=True)
+        self.cancel_button = tk.Button(
+            self.status_frame,
+            text="Скасувати",
+            font=("Corbel", 10),
+            bd=2,
+            bg="#38454F",
+            fg="white",
+            command=self.presenter.cancel_tasks,
+            relief=tk.RIDGE,
+        )
+        self.progress_bar = Progressbar(self.status_frame, orient=tk.HORIZONTAL, length=300, maximum=1.0)
+
+    # Метод для показу прогресу фонового завдання у рядку стану
+    def show_progress(self, text, fraction):
+        self.status_label.config(text=text)
+        self.progress_bar["value"] = fraction
+        if not self.progress_bar.winfo_ismapped():
+            self.cancel_button.pack(side=tk.RIGHT, padx=4)
+            self.progress_bar.pack(side=tk.RIGHT, padx=4)
+
+    # Метод для приховування прогресу, коли фонових завдань не лишилось
+    def hide_progress(self, text=""):
+        self.status_label.config(text=text)
+        self.progress_bar.pack_forget()
+        self.cancel_button.pack_forget()
+
+    # Метод для створення елемента полотна з растровим буфером
+    def create_raster_item(self):
+        self.canvas.create_image(self.offset, self.offset, anchor="nw", image=self.raster_photo, tags="raster")
+
+    # Метод для позначення зміненої області растрового буфера; на полотно вона потрапить з наступним кадром.
+    # changed=False - документ не змінився, область лише треба показати наново, тож кеш рівнів лишається
+    def refresh_region(self, box, changed=True):
+        if changed and self.mipmaps.cache:
+            self.mipmaps.invalidate(box)
+        self.damage.add(box)
+        if self.frame_pending is None:
+            delay = max(0, round(FRAME_INTERVAL - (time.perf_counter() - self.last_frame) * 1000))
+            self.frame_pending = self.root.after(delay, self.present)
+
+    # Метод для перенесення накопичених областей композиції шарів на полотно;
+    # вартість залежить від площі областей, а не від полотна. Без масштабу та зсуву області копіюються
+    # як є, інакше видима частина кожної області малюється з рівня MipmapCache. Після кадру растр актуальний,
+    # тож тоді ж прибираються елементи старих дій
+    @profiled("view.present")
+    def present(self):
+        self.frame_pending = None
+        self.last_frame = time.perf_counter()
+        model = self.presenter.model
+        viewport = self.viewport
+        for box in self.damage.take():
+            screen = viewport.to_screen(box)
+            if screen is None:
+                continue
+            if viewport.identity():
+                image = model.render(screen)
+            else:
+                x0, y0, x1, y1 = screen
+                scale = viewport.scale
+                image = self.mipmaps.render((viewport.x + x0 / scale, viewport.y + y0 / scale,
+                                             viewport.x + x1 / scale, viewport.y + y1 / scale),
+                                            (x1 - x0, y1 - y0), scale)
+            patch = ImageTk.PhotoImage(image, master=self.root)
+            self.raster_photo.tk.call(self.raster_photo, "copy", patch, "-to", screen[0], screen[1])
+        if self.compactor.due():
+            self.compactor.compact()
+
+    # Метод для переведення координат полотна у координати растрового буфера
+    def to_document(self, *coords):
+        return self.viewport.to_document([c - self.offset for c in coords])
+
+    # Метод для зміни масштабу на steps кроків навколо точки події
+    def zoom(self, steps, event=None):
+        if event is None:
+            sx, sy = self.viewport.width / 2, self.viewport.height / 2
+        else:
+            sx, sy = event.x - self.offset, event.y - self.offset
+        self.viewport.zoom(steps, sx, sy)
+        self.viewport_changed()
+
+    # Метод для показу документа в реальному розмірі
+    def zoom_actual(self):
+        self.viewport.reset()
+        self.viewport_changed()
+
+    # Метод для масштабу, за якого видно весь документ
+    def zoom_fit(self):
+        self.viewport.fit()
+        self.viewport_changed()
+
+    # Метод для початку перетягування вигляду середньою кнопкою
+    def start_pan(self, event):
+        self.pan_start = (event.x, event.y)
+
+    # Метод для зсуву вигляду за перетягуванням
+    def pan(self, event):
+        if self.pan_start is None:
+            return
+        self.viewport.pan(event.x - self.pan_start[0], event.y - self.pan_start[1])
+        self.pan_start = (event.x, event.y)
+        self.viewport_changed()
+
+    # Метод для перемальовування після зміни масштабу чи зсуву. Елементи полотна лишились у старих координатах,
+    # а їх результат уже є в растрі, тож вони прибираються, а видима частина документа малюється наново
+    def viewport_changed(self):
+        self.drop_items()
+        self.raster_photo.blank()
+        self.refresh_region(self.viewport.visible(), changed=False)
+        self.status_label.config(text="Масштаб %d%%" % round(self.viewport.scale * 100))
+
+    # Метод для реакції на зміну розміру документа (наприклад, після відкриття проєкту)
+    def document_resized(self, width, height):
+        if (width, height) != self.viewport.document:
+            self.viewport.set_document(width, height)
+            self.mipmaps.set_document(width, height)
+            self.raster_photo.blank()
+            self.refresh_region(self.viewport.visible())
 
     # Метод для координат початку малювання
+    @profiled("view.start_drawing")
     def start_drawing(self, event):
         self.start_x = event.x
         self.start_y = event.y
+        self.stroke_start = True
+        self.preview.cancel()
+        self.presenter.model.begin_operation()
 
     # Метод для малювання та опису частини інструментів
+    @profiled("view.draw")
     def draw(self, event):
-        if self.current_tool == "pencil":
-            self.canvas.create_line(self.start_x, self.start_y, event.x, event.y, capstyle=tk.ROUND, smooth=tk.TRUE,
-                                    fill=self.presenter.model.line_color,
-                                    width=self.line_width.get())
-            self.start_x = event.x
-            self.start_y = event.y
-        elif self.current_tool == "eraser":
-            self.canvas.create_line(self.start_x, self.start_y, event.x, event.y, capstyle=tk.ROUND, smooth=tk.TRUE,
-                                    fill=self.presenter.model.erase_color,
-                                    width=self.line_width.get())
+        model = self.presenter.model
+        if self.current_tool in ("pencil", "eraser"):
+            # Штрих малюється лише пензлем у буфері, на екран його переносить наступний кадр
+            color = model.line_color if self.current_tool == "pencil" else model.erase_ink
+            model.paint(self.to_document(self.start_x, self.start_y, event.x, event.y),
+                        color, self.line_width.get(), start=self.stroke_start)
+            self.stroke_start = False
             self.start_x = event.x
             self.start_y = event.y
         elif self.current_tool == "fill":
             self.fill_canvas(event)
         elif self.current_tool == "sprayer":
-            for _ in range(30):
-                x = event.x + random.randint(-15, 15)
-                y = event.y + random.randint(-15, 15)
-                self.canvas.create_oval(x, y, x + 1, y + 1, fill=self.presenter.model.line_color,
-                                        outline=self.presenter.model.line_color)
-        elif self.current_tool == "line":
-            self.canvas.delete("temp")
-            self.canvas.create_line(self.start_x, self.start_y, event.x, event.y,
-                                    fill=self.presenter.model.line_color,
-                                    width=self.line_width.get(), tags="temp")
+            radius = max(15, 4 * self.line_width.get())
+            model.spray(*self.to_document(event.x, event.y), radius, model.line_color)
+        elif self.current_tool in SHAPE_TOOLS:
+            self.preview.update(*self.shape_item(event.x, event.y))
+
+    # Метод для опису фігури від точки початку до (x, y): функція створення елемента, координати та параметри
+    def shape_item(self, x, y):
+        color = self.presenter.model.line_color
+        width = self.line_width.get() * self.viewport.scale
+        coords = shape_points(self.current_tool, self.start_x, self.start_y, x, y)
+        if self.current_tool == "line":
+            return self.canvas.create_line, coords, {"fill": color, "width": width}
         elif self.current_tool == "dashed_line":
-            self.canvas.delete("temp")
-            self.canvas.create_line(self.start_x, self.start_y, event.x, event.y,
-                                    fill=self.presenter.model.line_color,
-                                    width=self.line_width.get(), dash=(5, 5), tags="temp")
+            return self.canvas.create_line, coords, {"fill": color, "width": width, "dash": DASH_PATTERN}
         elif self.current_tool == "rectangle":
-            self.canvas.delete("temp")
-            self.canvas.create_rectangle(self.start_x, self.start_y, event.x, event.y,
-                                         outline=self.presenter.model.line_color,
-                                         width=self.line_width.get(), tags="temp")
+            return self.canvas.create_rectangle, coords, {"outline": color, "width": width}
         elif self.current_tool == "triangle":
-            self.canvas.delete("temp")
-            x1 = (self.start_x + event.x) / 2
-            y1 = self.start_y
-            x2 = event.x
-            y2 = event.y
-            x3 = self.start_x
-            y3 = event.y
-            self.canvas.create_polygon(x1, y1, x2, y2, x3, y3, outline=self.presenter.model.line_color,
-                                       width=self.line_width.get(), fill="", tags="temp")
+            return self.canvas.create_polygon, coords, {"outline": color, "width": width, "fill": ""}
         elif self.current_tool == "oval":
-            self.canvas.delete("temp")
-            self.canvas.create_oval(self.start_x, self.start_y, event.x, event.y,
-                                    outline=self.presenter.model.line_color,
-                                    width=self.line_width.get(), tags="temp")
+            return self.canvas.create_oval, coords, {"outline": color, "width": width}
 
     # Метод для опису заливки
+    @profiled("view.fill_canvas")
     def fill_canvas(self, event):
-        item = self.canvas.find_closest(event.x, event.y)
-        if not item:
-            self.canvas.config(bg=self.presenter.model.line_color)
-        else:
-            item = item[0]
-            self.canvas.itemconfig(item, fill=self.presenter.model.line_color)
+        started = self.presenter.model.begin_operation()
+        x, y = (math.floor(c) for c in self.to_document(event.x, event.y))
+        self.presenter.model.fill_area(x, y, self.presenter.model.line_color)
+        if started:
+            self.presenter.model.end_operation()
+
+    # Метод для вибору кольору піпеткою
+    @profiled("view.pick_color")
+    def pick_color(self, event):
+        self.presenter.model.pick_color(*self.to_document(event.x, event.y))
 
     # Метод для опису тексту
     def place_text(self, event):
@@ -319,93 +4159,277 @@ class DrawView:
         def apply_text():
             entered_text = text_entry.get()
             font = (font_combobox.get(), int(size_entry.get()))
-            self.canvas.create_text(event.x, event.y, text=entered_text,
-                                    fill=self.presenter.model.line_color, font=font)
+            self.presenter.model.begin_operation()
+            item = self.canvas.create_text(event.x, event.y, text=entered_text,
+                                           fill=self.presenter.model.line_color, font=font)
+            self.presenter.model.draw_text(*self.to_document(event.x, event.y), entered_text,
+                                           self.presenter.model.line_color, font)
+            self.presenter.model.end_operation(self.committed_items([item]))
             text_dialog.destroy()
 
         apply_button = tk.Button(text_dialog, text="Застосувати", command=apply_text)
         apply_button.grid(row=3, columnspan=2, pady=10)
 
     # Метод для встановлення кінцевих координат малювання фігур та ліній
+    @profiled("view.end_drawing")
     def end_drawing(self, event):
-        if self.current_tool == "line":
-            self.canvas.create_line(self.start_x, self.start_y, event.x, event.y,
-                                    fill=self.presenter.model.line_color,
-                                    width=self.line_width.get())
-        elif self.current_tool == "dashed_line":
-            self.canvas.create_line(self.start_x, self.start_y, event.x, event.y,
-                                    fill=self.presenter.model.line_color,
-                                    width=self.line_width.get(), dash=(5, 5))
-        elif self.current_tool == "rectangle":
-            self.canvas.create_rectangle(self.start_x, self.start_y, event.x, event.y,
-                                         outline=self.presenter.model.line_color,
-                                         width=self.line_width.get())
-        elif self.current_tool == "triangle":
-            x1 = (self.start_x + event.x) / 2
-            y1 = self.start_y
-            x2 = event.x
-            y2 = event.y
-            x3 = self.start_x
-            y3 = event.y
-            self.canvas.create_polygon(x1, y1, x2, y2, x3, y3, outline=self.presenter.model.line_color,
-                                       width=self.line_width.get(), fill="")
-        elif self.current_tool == "oval":
-            self.canvas.create_oval(self.start_x, self.start_y, event.x, event.y,
-                                    outline=self.presenter.model.line_color,
-                                    width=self.line_width.get())
+        model = self.presenter.model
+        items = ()
+        if self.current_tool in SHAPE_TOOLS:
+            create, coords, options = self.shape_item(event.x, event.y)
+            items = (self.preview.commit(create, coords, options),)
+            model.draw_shape(self.current_tool, self.to_document(*coords), model.line_color, self.line_width.get())
+        model.end_operation(self.committed_items(items))
 
-    # Метод для відкривання зображення
-    def open_image(self, image):
-        canvas_width = self.canvas.winfo_width()
-        canvas_height = self.canvas.winfo_height()
+    # Метод для кількості елементів полотна без накладки зі статистикою
+    def item_count(self):
+        return len(self.canvas.find_all()) - len(self.canvas.find_withtag("overlay"))
 
-        image_width = image.width()
-        image_height = image.height()
+    # Метод для показу чи приховування накладки зі статистикою; вимірювання ведеться, поки накладка видима
+    def toggle_overlay(self):
+        if self.overlay_job is None:
+            PROFILER.set_enabled(True)
+            self.update_overlay()
+        else:
+            self.root.after_cancel(self.overlay_job)
+            self.overlay_job = None
+            self.canvas.delete("overlay")
+            PROFILER.set_enabled(False)
 
-        x = (canvas_width - image_width) // 2
-        y = (canvas_height - image_height) // 2
+    # Метод для перемальовування накладки зі статистикою; повторюється кожні overlay_interval мс
+    def update_overlay(self):
+        statistics = self.presenter.statistics()
+        lines = ["%-20s %6.0f/с  p50 %7.0f  p95 %7.0f  p99 %7.0f мкс" % (
+            name, summary["rate"], summary["p50_us"], summary["p95_us"], summary["p99_us"])
+            for name, summary in statistics["handlers"].items()]
+        memory = {key: (value or 0) / 2 ** 20 for key, value in statistics["memory"].items()}
+        lines.append("Елементів полотна: %d" % statistics["canvas_items"])
+        lines.append("Пам'ять, МБ: шари %.1f, композиція %.1f, історія %.1f, фігури %.1f, пік процесу %.0f" % (
+            memory["layers"], memory["composite"], memory["history"], memory["shapes"], memory["process_peak"]))
+        self.canvas.delete("overlay")
+        text = self.canvas.create_text(self.offset + 8, self.offset + 8, anchor="nw", text="\n".join(lines),
+                                       font=("Courier New", 9), fill="white", tags="overlay")
+        bbox = self.canvas.bbox(text)
+        if bbox:
+            background = self.canvas.create_rectangle(bbox[0] - 4, bbox[1] - 4, bbox[2] + 4, bbox[3] + 4,
+                                                      fill="#38454F", outline="", tags="overlay")
+            self.canvas.tag_lower(background, text)
+        self.overlay_job = self.root.after(self.overlay_interval, self.update_overlay)
 
-        self.clear_screen()
+    # Метод для відбору елементів полотна, які лишаються після завершення дії.
+    # Елементи лежать поверх растру і не знають про шари, тож коли шарів кілька, вони показують дію
+    # лише під час жесту, а після нього видно композицію шарів
+    def committed_items(self, items):
+        if self.presenter.model.layers.single:
+            self.compactor.track(items)
+            return items
+        for item in items:
+            self.canvas.delete(item)
+        return ()
 
-        self.canvas.create_image(x, y, anchor="nw", image=image)
-        self.canvas.image = image
+    # Метод для видалення всіх елементів полотна, крім растру, який уже містить їх результат
+    def drop_items(self):
+        self.preview.cancel()
+        self.compactor.reset()
+        self.canvas.delete("all")
+        self.create_raster_item()
 
-    # Метод для збереження зображення
-    def save_image(self, file_path):
-        self.root.update_idletasks()
+    # Метод для показу вікна фільтра з параметрами та попереднім переглядом на зменшеній копії активного шару.
+    # Фільтр без параметрів застосовується одразу
+    def show_filter(self, name):
+        title, parameters = FilterEngine.filters[name]
+        if not parameters:
+            self.presenter.apply_filter(name, ())
+            return
+        dialog = tk.Toplevel(self.root)
+        dialog.title(title)
+        dialog.resizable(False, False)
+        proxy, factor = FilterEngine.proxy(self.presenter.model.image)
 
-        canvas_width = self.canvas.winfo_width()
-        canvas_height = self.canvas.winfo_height()
+        preview_label = tk.Label(dialog)
+        preview_label.grid(row=0, column=0, columnspan=2, padx=5, pady=5)
+        scales = []
+        pending = []
 
-        x0 = self.canvas.winfo_rootx() + 7
-        y0 = self.canvas.winfo_rooty() + 7
+        # Метод для параметрів фільтра з повзунків
+        def values():
+            return tuple(round(float(scale.get()), 2) for scale in scales)
 
-        x1 = x0 + canvas_width - 14
-        y1 = y0 + canvas_height - 14
+        # Метод для перерахунку попереднього перегляду; під час перетягування повзунка рахується раз на кадр
+        def refresh():
+            pending.clear()
+            photo = ImageTk.PhotoImage(FilterEngine.preview(proxy, factor, name, values()), master=dialog)
+            preview_label.config(image=photo)
+            preview_label.image = photo
 
-        image = ImageGrab.grab(bbox=(x0, y0, x1, y1))
+        # Метод для планування перерахунку після зміни повзунка
+        def schedule(value=None):
+            if not pending:
+                pending.append(dialog.after(FRAME_INTERVAL, refresh))
 
-        file_extension = file_path.split(".")[-1].lower()
-        if file_extension in ["png", "jpg", "jpeg", "tiff", "gif"]:
-            image.save(file_path)
-        else:
-            messagebox.showerror("Помилка", "Непідтримуваний формат файлу.")
+        for row, (label, low, high, default) in enumerate(parameters, 1):
+            parameter_label = tk.Label(dialog, text=label + ":")
+            parameter_label.grid(row=row, column=0, padx=5, pady=5, sticky="w")
+            scale = Scale(dialog, orient=tk.HORIZONTAL, from_=low, to=high, length=200)
+            scale.set(default)
+            scale.config(command=schedule)
+            scale.grid(row=row, column=1, padx=5, pady=5, sticky="w")
+            scales.append(scale)
+
+        # Метод для застосування фільтра у повній роздільності
+        def apply_filter():
+            self.presenter.apply_filter(name, values())
+            dialog.destroy()
+
+        apply_button = tk.Button(dialog, text="Застосувати", command=apply_filter)
+        apply_button.grid(row=len(parameters) + 1, column=0, pady=10)
+        cancel_button = tk.Button(dialog, text="Скасувати", command=dialog.destroy)
+        cancel_button.grid(row=len(parameters) + 1, column=1, pady=10)
+        refresh()
+
+    # Метод для показу вікна експорту з вибором виходів
+    def show_export(self):
+        dialog = tk.Toplevel(self.root)
+        dialog.title("Експортувати як")
+        dialog.resizable(False, False)
+        choices = {}
+        for row, (kind, (label, suffix)) in enumerate(ExportPipeline.outputs.items()):
+            choices[kind] = tk.BooleanVar(master=dialog, value=True)
+            check = tk.Checkbutton(dialog, text=f"{label} (*{suffix})", variable=choices[kind])
+            check.grid(row=row, column=0, columnspan=2, padx=5, pady=2, sticky="w")
+
+        # Метод для запуску експорту вибраних виходів
+        def export():
+            kinds = [kind for kind, chosen in choices.items() if chosen.get()]
+            dialog.destroy()
+            if kinds:
+                self.presenter.export_image(kinds)
+
+        export_button = tk.Button(dialog, text="Експортувати...", command=export)
+        export_button.grid(row=len(choices), column=0, pady=10)
+        cancel_button = tk.Button(dialog, text="Скасувати", command=dialog.destroy)
+        cancel_button.grid(row=len(choices), column=1, pady=10)
+
+    # Метод для показу панелі шарів: список шарів (верхній - першим), непрозорість, видимість та режим накладання
+    def show_layers(self):
+        if self.layers_dialog is not None and self.layers_dialog.winfo_exists():
+            self.layers_dialog.lift()
+            return
+        dialog = tk.Toplevel(self.root)
+        dialog.title("Шари")
+        dialog.resizable(False, False)
+        self.layers_dialog = dialog
+
+        self.layers_list = tk.Listbox(dialog, width=30, height=8, exportselection=False)
+        self.layers_list.grid(row=0, column=0, columnspan=2, padx=5, pady=5)
+        self.layers_list.bind("<<ListboxSelect>>", lambda event: self.layer_selected())
+
+        opacity_label = tk.Label(dialog, text="Непрозорість:")
+        opacity_label.grid(row=1, column=0, padx=5, pady=5, sticky="w")
+        self.layer_opacity = Scale(dialog, orient=tk.HORIZONTAL, from_=0, to=100, length=120,
+                                   command=lambda value: self.layer_changed(opacity=round(float(value)) / 100))
+        self.layer_opacity.grid(row=1, column=1, padx=5, pady=5, sticky="w")
+
+        blend_label = tk.Label(dialog, text="Накладання:")
+        blend_label.grid(row=2, column=0, padx=5, pady=5, sticky="w")
+        self.layer_blend = Combobox(dialog, state="readonly", width=15, values=list(BLEND_MODES.values()))
+        self.layer_blend.grid(row=2, column=1, padx=5, pady=5, sticky="w")
+        self.layer_blend.bind("<<ComboboxSelected>>", lambda event: self.layer_changed(
+            blend=list(BLEND_MODES)[self.layer_blend.current()]))
+
+        self.layer_visible = tk.BooleanVar(master=dialog)
+        visible_button = tk.Checkbutton(dialog, text="Видимий", variable=self.layer_visible,
+                                        command=lambda: self.layer_changed(visible=self.layer_visible.get()))
+        visible_button.grid(row=3, column=0, padx=5, pady=5, sticky="w")
+
+        add_button = tk.Button(dialog, text="Додати", command=self.presenter.add_layer)
+        add_button.grid(row=4, column=0, pady=10)
+        remove_button = tk.Button(dialog, text="Видалити", command=self.presenter.remove_layer)
+        remove_button.grid(row=4, column=1, pady=10)
+
+        self.update_layers()
+
+    # Метод для оновлення панелі шарів за станом моделі
+    def update_layers(self):
+        if self.layers_dialog is None or not self.layers_dialog.winfo_exists():
+            return
+        layers = self.presenter.model.layers
+        active = layers.active
+        # Віджети під час оновлення викликають свої команди, які не повинні змінювати модель
+        self.updating_layers = True
+        try:
+            self.layers_list.delete(0, tk.END)
+            for layer in reversed(layers.layers):
+                self.layers_list.insert(tk.END, layer.name if layer.visible else f"{layer.name} (приховано)")
+            self.layers_list.selection_set(len(layers) - 1 - layers.active_index)
+            self.layer_opacity.set(active.opacity * 100)
+            self.layer_blend.current(list(BLEND_MODES).index(active.blend))
+            self.layer_visible.set(active.visible)
+        finally:
+            self.updating_layers = False
+
+    # Метод для вибору шару у списку панелі
+    def layer_selected(self):
+        selection = self.layers_list.curselection()
+        if selection and not self.updating_layers:
+            self.presenter.select_layer(len(self.presenter.model.layers) - 1 - selection[0])
+
+    # Метод для зміни параметрів активного шару з панелі
+    def layer_changed(self, **properties):
+        if not self.updating_layers:
+            self.presenter.configure_layer(self.presenter.model.layers.active_index, **properties)
+
+    # Метод для показу скасованої операції: її елементи прибираються, а область оновиться зі сповіщення моделі
+    def undo_operation(self, operation):
+        self.compactor.discard(operation.items)
+        for item in operation.items:
+            self.canvas.delete(item)
 
     # Метод для очищення області малювання
     def clear_screen(self):
+        self.preview.cancel()
+        self.compactor.reset()
         self.canvas.delete("all")
+        self.raster_photo.blank()
+        self.create_raster_item()
 
 
 # Клас DrawPresenter відповідає за взаємодію між моделлю та представленням.
 
 
 class DrawPresenter:
-    def __init__(self, root, model):
+    def __init__(self, root, model, autosave_dir=None):
         # Ініціалізація презентера
         self.root = root
         self.model = model
         self.view = DrawView(root, self)
+        # Сповіщення моделі збираються і надсилаються одним викликом, коли цикл подій вільний
+        self.model.set_scheduler(root.after_idle)
         self.model.subscribe(self)
+        # Фонове відкриття та збереження зображень; вихід чекає на незавершені збереження
+        self.io = ImageIOWorker(root, self)
+        # Фільтри зображення, які застосовуються у фоні
+        self.filters = FilterEngine()
+        # Експорт у кілька форматів одночасно
+        self.exporter = ExportPipeline()
+        self.exit_pending = False
+        # Записувач сеансу малювання, поки йде запис
+        self.recorder = None
+        # Журнал відновлення ведеться лише тоді, коли задано теку для нього
+        if autosave_dir:
+            self.start_journal(autosave_dir)
+
+    # Метод для запуску журналу відновлення; робота, не збережена через збій, пропонується до відновлення
+    def start_journal(self, directory):
+        recovered = None
+        if Journal.exists(directory) and messagebox.askyesno(
+                "Відновлення роботи", "Попередній сеанс завершився аварійно. Відновити незбережену роботу?"):
+            try:
+                Journal.recover(directory, self.model)
+                recovered = self.model
+            except Exception as e:
+                messagebox.showerror("Сталась помилка", f"Не вдалось відновити роботу: {e}")
+        self.model.journal = Journal(directory, recovered)
 
     # Метод для встановлення кольору малювання
     def set_color(self, col):
@@ -423,12 +4447,21 @@ class DrawPresenter:
             ]
         )
         if file_path:
-            try:
-                image = Image.open(file_path)
-                photo = ImageTk.PhotoImage(image)
-                self.view.open_image(photo)
-            except Exception as e:
-                messagebox.showerror("Сталась помилка", f"Не вдалось відкрити зображення: {e}")
+            # Новий файл замінює той, що ще відкривається
+            self.io.cancel("open")
+            task = self.io.open_image(file_path, self.model.width, self.model.height, self.image_opened)
+            self.view.show_progress(task.title, 0)
+
+    # Метод для показу відкритого зображення; викликається у головному потоці після декодування.
+    # Велике зображення (TiledImage) стає документом свого розміру і показується цілим у вікні
+    def image_opened(self, image):
+        self.view.clear_screen()
+        if isinstance(image, TiledImage):
+            self.model.open_tiled(image)
+            self.view.document_resized(self.model.width, self.model.height)
+            self.view.zoom_fit()
+        else:
+            self.model.open_image(image)
 
     # Метод для Збереження зображення
     def save_image(self):
@@ -439,20 +4472,199 @@ class DrawPresenter:
                 ("TIFF files", "*.tiff"),
                 ("GIF files", "*.gif")]
         )
+        if not file_path:
+            return
+        if file_path.split(".")[-1].lower() not in SAVE_FORMATS:
+            messagebox.showerror("Помилка", "Непідтримуваний формат файлу.")
+            return
+        # Кодується композиція шарів у новому буфері, тож малювання під час збереження не змінює файл
+        task = self.io.save_image(self.model.layers.flatten(), file_path, self.image_saved)
+        self.view.show_progress(task.title, 0)
+
+    # Метод для повідомлення про успішне збереження
+    def image_saved(self, file_path):
+        if not self.exit_pending:
+            messagebox.showinfo("Збереження зображення", "Зображення успішно збережено.")
+
+    # Метод для експорту документа у виходи kinds (ключі ExportPipeline.outputs); композиція знімається одразу,
+    # тож малювання під час експорту не потрапляє до файлів
+    def export_image(self, kinds):
+        file_path = filedialog.asksaveasfilename(title="Експортувати як")
+        if not file_path:
+            return
+        base_path = os.path.splitext(file_path)[0]
+        snapshot = self.exporter.snapshot(self.model)
+        # Як і для фільтрів, пул процесів створюється в головному потоці
+        self.exporter.pool()
+        task = self.io.submit("export", f"Експорт {os.path.basename(base_path)}",
+                              lambda task: self.exporter.run(snapshot, base_path, kinds, task), self.image_exported)
+        self.view.show_progress(task.title, 0)
+
+    # Метод для повідомлення про успішний експорт
+    def image_exported(self, paths):
+        if not self.exit_pending:
+            messagebox.showinfo("Експорт", "Збережено файли:\n" + "\n".join(paths.values()))
+
+    # Метод для застосування фільтра до активного шару у фоні; результат замінить пікселі цього шару
+    def apply_filter(self, name, params):
+        layer = self.model.layers.active
+        image = self.model.image.copy()
+        # Пул процесів створюється тут, у головному потоці: фонові завдання, запущені разом, не створять кожне свій
+        self.filters.pool()
+        task = self.io.submit("filter", f"Фільтр: {FilterEngine.filters[name][0]}",
+                              lambda task: self.filters.run(image, name, params, task),
+                              lambda result: self.filter_applied(layer, result, name, params))
+        self.view.show_progress(task.title, 0)
+
+    # Метод для застосування результату фільтра; викликається у головному потоці.
+    # Якщо шар уже видалено, результат відкидається
+    def filter_applied(self, layer, image, name, params):
+        if layer in self.model.layers.layers:
+            self.model.select_layer(self.model.layers.layers.index(layer))
+            self.model.apply_filtered(image, name, params)
+
+    # Метод для зведення статистики продуктивності: обробники, елементи полотна та пам'ять документа
+    def statistics(self):
+        return {"handlers": PROFILER.summary(), "canvas_items": self.view.item_count(),
+                "memory": self.model.memory_usage()}
+
+    # Метод для збереження статистики у JSON або CSV для аналізу поза редактором
+    def dump_statistics(self):
+        file_path = filedialog.asksaveasfilename(defaultextension=".json",
+                                                 filetypes=[("JSON", "*.json"), ("CSV", "*.csv")])
+        if file_path:
+            try:
+                Profiler.dump(self.statistics(), file_path)
+            except Exception as e:
+                messagebox.showerror("Помилка", f"Не вдалось зберегти статистику: {e}")
+
+    # Метод для видалення накопиченої статистики
+    def reset_statistics(self):
+        PROFILER.reset()
+
+    # Метод для початку чи завершення запису сеансу малювання; записаний сеанс зберігається у файл
+    def toggle_recording(self):
+        if self.recorder is None:
+            self.recorder = SessionRecorder(self.view)
+            self.recorder.start()
+            return
+        events = self.recorder.stop()
+        self.recorder = None
+        file_path = filedialog.asksaveasfilename(defaultextension=".jsonl",
+                                                 filetypes=[("Сеанс редактора", "*.jsonl")])
+        if file_path:
+            try:
+                SessionRecorder.save(events, file_path)
+            except Exception as e:
+                messagebox.showerror("Помилка", f"Не вдалось зберегти сеанс: {e}")
+
+    # Метод для відтворення сеансу з файлу в реальному часі та показу вимірювань
+    def replay_session(self):
+        file_path = filedialog.askopenfilename(filetypes=[("Сеанс редактора", "*.jsonl"), ("All files", "*.*")])
+        if not file_path:
+            return
+        try:
+            events = SessionRecorder.load(file_path)
+        except Exception as e:
+            messagebox.showerror("Сталась помилка", f"Не вдалось відкрити сеанс: {e}")
+            return
+        result = SessionReplayer(self.view).play(events, realtime=True)
+        messagebox.showinfo("Відтворення сеансу", "\n".join(SessionReplayer.report(result)))
+
+    # Метод для оновлення прогресу фонового завдання
+    def task_progress(self, task, fraction):
+        self.view.show_progress(task.title, fraction)
+
+    # Метод для обробки завершення фонового завдання: status - "done", "cancelled" або "error"
+    def task_finished(self, task, status, error):
+        if status == "error":
+            if task.kind == "open":
+                messagebox.showerror("Сталась помилка", f"Не вдалось відкрити зображення: {error}")
+            elif task.kind == "filter":
+                messagebox.showerror("Сталась помилка", f"Не вдалось застосувати фільтр: {error}")
+            elif task.kind == "export":
+                # Невдалий експорт перед виходом теж скасовує вихід, щоб його можна було повторити
+                self.exit_pending = False
+                messagebox.showerror("Помилка", f"Не вдалось експортувати зображення: {error}")
+            else:
+                # Невдале збереження перед виходом скасовує вихід, щоб не втратити малюнок
+                self.exit_pending = False
+                messagebox.showerror("Помилка", f"Не вдалось зберегти зображення: {error}")
+        if self.io.tasks:
+            self.view.show_progress(self.io.tasks[0].title, 0)
+        else:
+            self.view.hide_progress("Скасовано" if status == "cancelled" else "")
+            if self.exit_pending:
+                self.quit()
+
+    # Метод для скасування всіх фонових завдань
+    def cancel_tasks(self):
+        self.io.cancel()
+
+    # Метод для відкриття проєкту
+    def open_project(self):
+        file_path = filedialog.askopenfilename(filetypes=[("Проєкт редактора", "*.rgep"), ("All files", "*.*")])
         if file_path:
             try:
-                self.root.update_idletasks()
-                self.view.save_image(file_path)
-                messagebox.showinfo("Збереження зображення", "Зображення успішно збережено.")
+                self.view.clear_screen()
+                self.model.open_project(file_path)
             except Exception as e:
-                messagebox.showerror("Помилка", f"Не вдалось зберегти зображення: {e}")
+                messagebox.showerror("Сталась помилка", f"Не вдалось відкрити проєкт: {e}")
+
+    # Метод для збереження проєкту; якщо проєкт уже має файл, у нього дописуються лише зміни
+    def save_project(self):
+        file_path = self.model.project.path if self.model.project else filedialog.asksaveasfilename(
+            defaultextension=".rgep", filetypes=[("Проєкт редактора", "*.rgep")])
+        if file_path:
+            try:
+                self.model.save_project(file_path)
+            except Exception as e:
+                messagebox.showerror("Помилка", f"Не вдалось зберегти проєкт: {e}")
 
     # Метод для очищення полотна
     def clear_screen(self):
         self.view.clear_screen()
+        self.model.clear_screen()
+
+    # Метод для скасування останньої дії
+    def undo(self):
+        operation = self.model.undo()
+        if operation:
+            self.view.undo_operation(operation)
+
+    # Метод для повторення скасованої дії; буфер вже містить її результат, тож досить сповіщення моделі
+    def redo(self):
+        self.model.redo()
+
+    # Метод для додавання шару; з появою другого шару елементи полотна поступаються композиції шарів
+    def add_layer(self):
+        if self.model.layers.single:
+            self.view.drop_items()
+        self.model.add_layer()
+
+    # Метод для видалення активного шару
+    def remove_layer(self):
+        if not self.model.remove_layer():
+            messagebox.showinfo("Шари", "Документ повинен мати хоча б один шар.")
+
+    # Метод для вибору активного шару
+    def select_layer(self, index):
+        self.model.select_layer(index)
+
+    # Метод для зміни параметрів шару
+    def configure_layer(self, index, **properties):
+        self.model.configure_layer(index, **properties)
 
     # Метод для опису виходу з програми
     def quit(self):
+        self.io.cancel("open")
+        self.io.cancel("filter")
+        self.io.shutdown(wait=True)
+        self.filters.shutdown()
+        self.exporter.shutdown()
+        # Після звичайного виходу відновлювати нічого
+        if self.model.journal is not None:
+            self.model.journal.close(discard=True)
         self.root.destroy()
 
     # Метод для виходу з програми
@@ -462,15 +4674,160 @@ class DrawPresenter:
             return
         elif user_choice:
             self.save_image()
-        self.quit()
+        # Відкриття та фільтри вже не потрібні, а незавершені збереження та експорти треба дописати до кінця
+        self.io.cancel("open")
+        self.io.cancel("filter")
+        if self.io.busy("save") or self.io.busy("export"):
+            self.exit_pending = True
+        else:
+            self.quit()
 
-    # Метод для оновлення відображення
-    def update(self):
-        self.view.canvas.update()
+    # Метод для оновлення відображення: переносяться лише змінені області буфера
+    def update(self, changes):
+        if "layers" in changes:
+            self.view.document_resized(self.model.width, self.model.height)
+            self.view.update_layers()
+        for box in changes.regions:
+            self.view.refresh_region(box)
 
 
-if __name__ == "__main__":
+# Функція для виконання операцій ops над моделлю так само, як їх малюють жести DrawView.
+# Координати задаються у пікселях документа; колір і розмір за замовчуванням - як у вікні після запуску
+def render_ops(model, ops):
+    for op in ops:
+        tool = op["tool"]
+        color = op.get("color", "black")
+        width = op.get("width", 1)
+        if tool in ("pencil", "eraser"):
+            # Кожна пара сусідніх точок - одна подія руху, перша починає штрих
+            ink = color if tool == "pencil" else model.erase_ink
+            points = op["points"]
+            for i in range(1, len(points)):
+                model.paint([*points[i - 1], *points[i]], ink, width, start=i == 1)
+        elif tool == "sprayer":
+            radius = max(15, 4 * width)
+            for x, y in op["points"]:
+                model.spray(x, y, radius, color)
+        elif tool in SHAPE_TOOLS:
+            model.draw_shape(tool, shape_points(tool, *op["from"], *op["to"]), color, width)
+        elif tool == "fill":
+            model.fill_area(*op["at"], color)
+        elif tool == "text":
+            model.draw_text(*op["at"], op["text"], color, tuple(op.get("font", ("Calibri", 11))))
+        else:
+            raise ValueError(f"Невідомий інструмент: {tool}")
+
+
+# Функція для рендерингу одного завдання пакета у файл теки output_dir.
+# Повертає назву файлу, тривалість і текст помилки (None, якщо все вдалось)
+def render_job(job, output_dir):
+    started = time.perf_counter()
+    try:
+        model = DrawModel(job.get("width", 1250), job.get("height", 600), job.get("background", "white"))
+        # Розпилювач із заданим зерном, щоб повторний рендеринг давав той самий файл
+        model.spray_engine = SprayEngine(seed=job.get("seed", 0))
+        render_ops(model, job["ops"])
+        model.save_image(os.path.join(output_dir, job["output"]))
+        return job["output"], time.perf_counter() - started, None
+    except Exception as e:
+        return job.get("output"), time.perf_counter() - started, f"{type(e).__name__}: {e}"
+
+
+# Функція для рендерингу порції завдань; виконується у процесі пулу
+def render_chunk(jobs, output_dir):
+    return [render_job(job, output_dir) for job in jobs]
+
+
+# Клас BatchRenderer рендерить сценарії операцій без вікна у пулі процесів. Завдання передаються процесам
+# порціями, щоб пересилання не переважало малювання, а результати порцій видаються по мірі готовності.
+
+
+class BatchRenderer:
+    def __init__(self, workers=None, chunk_size=8):
+        self.workers = workers or os.cpu_count() or 1
+        self.chunk_size = chunk_size
+
+    # Метод для читання завдань із файлів сценаріїв. Файл містить одне завдання або список завдань;
+    # завданню без назви файлу дається назва за сценарієм (і номером у списку) з розширенням image_format
+    @staticmethod
+    def load_jobs(paths, image_format="png"):
+        jobs = []
+        for path in paths:
+            with open(path, encoding="utf-8") as file:
+                script = json.load(file)
+            stem = os.path.splitext(os.path.basename(path))[0]
+            entries = script if isinstance(script, list) else [script]
+            for index, job in enumerate(entries):
+                if "output" not in job:
+                    name = stem if len(entries) == 1 else f"{stem}_{index:05d}"
+                    job = dict(job, output=f"{name}.{image_format}")
+                if job["output"].split(".")[-1].lower() not in SAVE_FORMATS:
+                    raise ValueError(f"Непідтримуваний формат файлу: {job['output']}")
+                jobs.append(job)
+        return jobs
+
+    # Метод для рендерингу завдань у теку output_dir; видає списки результатів render_job по порціях
+    def run(self, jobs, output_dir):
+        os.makedirs(output_dir, exist_ok=True)
+        # Порцій щонайменше вчетверо більше, ніж процесів, щоб процеси завершували роботу приблизно разом
+        size = max(1, min(self.chunk_size, len(jobs) // (self.workers * 4)))
+        chunks = [jobs[i:i + size] for i in range(0, len(jobs), size)]
+        if self.workers == 1:
+            # Одному процесу пул лише додає запуск інтерпретатора та пересилання
+            for chunk in chunks:
+                yield render_chunk(chunk, output_dir)
+            return
+        with process_pool(self.workers) as pool:
+            futures = [pool.submit(render_chunk, chunk, output_dir) for chunk in chunks]
+            try:
+                for future in concurrent.futures.as_completed(futures):
+                    yield future.result()
+            finally:
+                for future in futures:
+                    future.cancel()
+
+
+# Функція для пакетного рендерингу сценаріїв scripts; прогрес пишеться у stream (за замовчуванням stderr)
+# після кожної порції. Повертає код виходу: 1, якщо хоча б одне завдання не вдалось
+def render_batch(scripts, output_dir, workers=None, image_format="png", stream=None):
+    stream = stream or sys.stderr
+    jobs = BatchRenderer.load_jobs(scripts, image_format)
+    started = time.perf_counter()
+    done = failed = 0
+    for results in BatchRenderer(workers).run(jobs, output_dir):
+        for output, seconds, error in results:
+            done += 1
+            if error:
+                failed += 1
+                print(f"{output}: {error}", file=stream)
+        print("[%d/%d] %.1f зобр./с" % (done, len(jobs), done / (time.perf_counter() - started)), file=stream,
+              flush=True)
+    print("Готово: %d зображень за %.1f с, помилок %d" % (done - failed, time.perf_counter() - started, failed),
+          file=stream)
+    return 1 if failed else 0
+
+
+# Функція для запуску редактора; зі сценаріями в аргументах зображення рендеряться без вікна
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Растровий графічний редактор. Без сценаріїв відкривається вікно.")
+    parser.add_argument("scripts", nargs="*", help="сценарії операцій у JSON для рендерингу без вікна")
+    parser.add_argument("-o", "--output-dir", default=".", help="тека для зображень (за замовчуванням поточна)")
+    parser.add_argument("-j", "--jobs", type=int, default=None, help="кількість процесів (за замовчуванням усі ядра)")
+    parser.add_argument("-f", "--format", default="png", choices=SAVE_FORMATS,
+                        help="формат зображень, для яких сценарій не задає назву файлу")
+    args = parser.parse_args(argv)
+    if args.scripts:
+        try:
+            return render_batch(args.scripts, args.output_dir, args.jobs, args.format)
+        except (OSError, ValueError) as e:
+            parser.error(str(e))
     root = tk.Tk()
     model = DrawModel()
-    presenter = DrawPresenter(root, model)
+    presenter = DrawPresenter(root, model,
+                              autosave_dir=os.path.join(os.path.expanduser("~"), ".raster_graphics_editor"))
     root.mainloop()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
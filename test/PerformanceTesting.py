@@ -0,0 +1,924 @@
+import gc
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import tkinter as tk
+import unittest
+from types import SimpleNamespace
+from unittest.mock import MagicMock
+import numpy as np
+from PIL import Image, ImageDraw
+from app.RasterGraphicsEditor import (BatchRenderer, DrawModel, DrawPresenter, ExportPipeline, FilterEngine,
+                                     FloodFillEngine, Journal, LayerStack, MipmapCache, PROFILER, RecordingCanvas,
+                                     SessionRecorder, SessionReplayer, ShapeStore, TiledImage, encode_image, profiled)
+
+# Тести продуктивності редактора. Вони не входять до звичайного набору UnitTesting.py,
+# запускаються окремо і друкують звіт: python -m pytest test/PerformanceTesting.py -s
+
+
+# Функція для створення представлення без дисплея: справжнє полотно, якщо є дисплей, інакше RecordingCanvas
+def create_view(line_width=4):
+    try:
+        root = tk.Tk()
+        root.withdraw()
+        canvas = None
+    except tk.TclError:
+        root = MagicMock()
+        canvas = RecordingCanvas()
+    presenter = DrawPresenter(root, DrawModel())
+    view = presenter.view
+    if canvas is not None:
+        view.canvas = canvas
+        view.offset = 7
+        # Повзунок розміру без дисплея: set змінює значення, яке повертає get
+        view.line_width = MagicMock()
+        view.line_width.set.side_effect = lambda value: setattr(view.line_width.get, "return_value", float(value))
+    view.line_width.set(line_width)
+    return view
+
+
+# Функція для генерування записаного штриха: випадкове блукання з фіксованим зерном
+def recorded_stroke(count, seed=1):
+    rng = np.random.default_rng(seed)
+    steps = rng.normal(0, 3, size=(count, 2)).cumsum(axis=0)
+    points = np.clip(steps + (625, 300), 10, (1255, 605)).astype(int)
+    return [type("Event", (), {"x": int(x), "y": int(y)})() for x, y in points]
+
+
+# Функція для обчислення статистики затримок у мікросекундах
+def latency_report(samples):
+    samples = np.asarray(samples) * 1e6
+    return "середня %.1f мкс, p50 %.1f мкс, p99 %.1f мкс" % (
+        samples.mean(), np.percentile(samples, 50), np.percentile(samples, 99))
+
+
+# Функція для порівняння підсумку відтворення сеансу з базовим; повертає список погіршень.
+# Частота та p95 кожного інструмента можуть погіршитись до slowdown разів (p99 за сотнею подій - майже максимум,
+# тож він лише друкується), пам'ять документа - до growth разів,
+# а елементів полотна не може стати більше. Пік пам'яті процесу залежить від інших тестів, тож не порівнюється
+def compare_benchmark(result, baseline, slowdown, growth):
+    regressions = []
+    for tool, base in baseline["tools"].items():
+        summary = result["tools"].get(tool)
+        if summary is None:
+            regressions.append("%s: немає подій" % tool)
+            continue
+        if summary["rate"] < base["rate"] / slowdown:
+            regressions.append("%s: %.0f подій/с проти %.0f" % (tool, summary["rate"], base["rate"]))
+        if summary["p95_us"] > base["p95_us"] * slowdown:
+            regressions.append("%s: p95 %.0f мкс проти %.0f" % (tool, summary["p95_us"], base["p95_us"]))
+    if result["canvas_items"] > baseline["canvas_items"]:
+        regressions.append("елементів полотна %d проти %d" % (result["canvas_items"], baseline["canvas_items"]))
+    for key in ("layers", "composite", "history", "shapes"):
+        if result["memory"][key] > baseline["memory"][key] * growth:
+            regressions.append("пам'ять %s %d проти %d" % (key, result["memory"][key], baseline["memory"][key]))
+    return regressions
+
+
+# Функція для відтворення штриха та вимірювання затримки кожної події
+def replay_stroke(view, events, draw):
+    view.start_drawing(events[0])
+    samples = []
+    for event in events[1:]:
+        started = time.perf_counter()
+        draw(event)
+        samples.append(time.perf_counter() - started)
+    view.end_drawing(events[-1])
+    return samples
+
+
+# Набір тестів продуктивності для штрихів олівця та пензля
+
+
+class TestStrokePerformance(unittest.TestCase):
+    def setUp(self):
+        self.view = create_view()
+        self.view.set_tool("pencil")
+        self.events = recorded_stroke(10000)
+
+    # Штрих попередньої версії: окремий елемент полотна на кожну подію руху
+    def legacy_draw(self, event):
+        view = self.view
+        model = view.presenter.model
+        view.canvas.create_line(view.start_x, view.start_y, event.x, event.y, capstyle=tk.ROUND, smooth=tk.TRUE,
+                                fill=model.line_color, width=view.line_width.get())
+        model.draw_line(view.to_document(view.start_x, view.start_y, event.x, event.y),
+                        model.line_color, view.line_width.get(), round_caps=True)
+        view.start_x = event.x
+        view.start_y = event.y
+
+    # Порівняння кількості елементів та затримки події до і після переходу на растровий пензель
+    def test_brush_stroke(self):
+        before = replay_stroke(self.view, self.events, self.legacy_draw)
+        legacy_items = len(self.view.canvas.find_all())
+        self.view.canvas.delete("all")
+        after = replay_stroke(self.view, self.events, self.view.draw)
+        items = len(self.view.canvas.find_all())
+        print("\nШтрих з %d подій" % len(self.events))
+        print("  до:    %d елементів, %s" % (legacy_items, latency_report(before)))
+        print("  після: %d елементів, %s" % (items, latency_report(after)))
+        self.assertEqual(items, 0)
+        self.assertLess(np.percentile(after, 99), 1e-3)
+
+    # Перевірка, що пензель будь-якого розміру встигає за подіями з частотою 1 кГц
+    def test_brush_sizes(self):
+        print("\nПензель, %d подій" % len(self.events))
+        for width in (1, 4, 12, 36):
+            view = create_view(width)
+            view.set_tool("pencil")
+            samples = replay_stroke(view, self.events, view.draw)
+            print("  розмір %2d: %s, масок у кеші %d" % (width, latency_report(samples),
+                                                       len(view.presenter.model.brush_engine.masks)))
+            self.assertLess(np.mean(samples), 1e-3)
+
+
+# Набір тестів продуктивності на записаному сеансі малювання всіма інструментами.
+# Базові результати оновлюються запуском з UPDATE_BASELINE=1
+
+
+class TestSessionBenchmark(unittest.TestCase):
+    directory = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sessions")
+    session = os.path.join(directory, "benchmark.jsonl")
+    baseline = os.path.join(directory, "baseline.json")
+    # Допустиме погіршення відносно базових результатів: машини та їх навантаження різняться, тож межі широкі
+    slowdown = 3.0
+    growth = 1.25
+
+    # Відтворення сеансу: звіт за інструментами та порівняння з базовими результатами
+    def test_replay(self):
+        view = create_view()
+        # Перший кадр довантажує ImageTk; без прогріву ця пауза потрапила б до першого інструмента сеансу.
+        # Збирач сміття вимикається, як у timeit: одна його пауза змінює частоту інструмента з сотні подій у рази
+        view.refresh_region((0, 0, 1, 1))
+        view.present()
+        events = SessionRecorder.load(self.session)
+        gc.collect()
+        gc.disable()
+        try:
+            result = SessionReplayer(view).play(events)
+        finally:
+            gc.enable()
+        print("\nСеанс %s" % os.path.basename(self.session))
+        for line in SessionReplayer.report(result):
+            print("  " + line)
+        if os.environ.get("UPDATE_BASELINE"):
+            with open(self.baseline, "w", encoding="utf-8") as file:
+                json.dump(result, file, ensure_ascii=False, indent=2)
+            return
+        with open(self.baseline, encoding="utf-8") as file:
+            baseline = json.load(file)
+        self.assertEqual(compare_benchmark(result, baseline, self.slowdown, self.growth), [])
+
+
+# Набір тестів продуктивності для масштабування вигляду
+
+
+class TestViewportPerformance(unittest.TestCase):
+    # Великий документ у зменшеному вигляді: кадр після зсуву береться з готових рівнів кешу
+    # і коштує значно менше, ніж зменшення композиції з повної роздільності
+    def test_zoomed_out_frames(self):
+        view = create_view()
+        model = view.presenter.model = DrawModel(6000, 4000)
+        model.image.paste(Image.fromarray(np.random.default_rng(9).integers(0, 256, size=(4000, 6000, 3),
+                                                                            dtype=np.uint8)))
+        view.document_resized(model.width, model.height)
+        view.zoom_fit()
+        started = time.perf_counter()
+        view.present()
+        first = time.perf_counter() - started
+        timings = []
+        for step in range(10):
+            view.start_pan(SimpleNamespace(x=0, y=0))
+            view.zoom(1 if step % 2 else -1)
+            started = time.perf_counter()
+            view.present()
+            timings.append(time.perf_counter() - started)
+        viewport = view.viewport
+        x0, y0, x1, y1 = viewport.to_screen(viewport.visible())
+        started = time.perf_counter()
+        model.render(viewport.visible()).resize((x1 - x0, y1 - y0), Image.Resampling.BILINEAR)
+        naive = time.perf_counter() - started
+        print("\nДокумент 6000x4000 у масштабі %.0f%%: перший кадр %.0f мс, далі %.1f мс, з повної роздільності %.0f мс"
+              % (viewport.scale * 100, first * 1e3, np.median(timings) * 1e3, naive * 1e3))
+        self.assertLess(np.median(timings), naive / 4)
+
+
+# Набір тестів продуктивності для прибирання елементів полотна
+
+
+class TestCanvasCompaction(unittest.TestCase):
+    # Довгий сеанс фігур: елементи старих дій прибираються, тож кількість елементів полотна обмежена,
+    # а всі фігури лишаються в моделі
+    def test_long_session(self):
+        rng = np.random.default_rng(8)
+        events = []
+        for index in range(3000):
+            events.append({"t": 0, "type": "tool", "tool": ("line", "rectangle", "oval")[index % 3], "width": 2,
+                           "color": "black"})
+            (x0, y0), (x1, y1) = rng.integers(10, (1250, 600), (2, 2)).tolist()
+            events.append({"t": 0, "type": "press", "x": x0, "y": y0})
+            events.append({"t": 0, "type": "motion", "x": x1, "y": y1})
+            events.append({"t": 0, "type": "release", "x": x1, "y": y1})
+        view = create_view(2)
+        result = SessionReplayer(view).play(events)
+        view.present()
+        print("\nСеанс з 3000 фігур: %.1f с, елементів полотна %d (без прибирання було б %d)" % (
+            result["seconds"], view.item_count(), 3001))
+        self.assertLessEqual(view.item_count(), view.compactor.keep_operations + 1)
+        self.assertEqual(len(view.presenter.model.shapes), 3000)
+        self.assertLess(max(summary["p99_us"] for summary in result["tools"].values()), 50000)
+
+
+# Набір тестів продуктивності для журналу відновлення
+
+
+class TestJournalPerformance(unittest.TestCase):
+    # Порівняння затримки подій руху олівця без журналу та з журналом
+    def test_journal_latency(self):
+        events = recorded_stroke(10000, seed=7)
+        view = create_view()
+        view.set_tool("pencil")
+        replay_stroke(view, events[:500], view.draw)
+        without = replay_stroke(view, events, view.draw)
+        with tempfile.TemporaryDirectory() as directory:
+            journal = Journal(directory, snapshot_records=10 ** 6)
+            view.presenter.model.journal = journal
+            with_journal = replay_stroke(view, events, view.draw)
+            started = time.perf_counter()
+            journal.flush()
+            drained = time.perf_counter() - started
+            size = os.path.getsize(journal.path)
+            journal.close()
+        print("\nЖурнал, штрих з %d подій" % len(events))
+        print("  без журналу: %s" % latency_report(without))
+        print("  з журналом:  %s" % latency_report(with_journal))
+        print("  журнал %.0f КБ, дозапис після штриха %.1f мс" % (size / 1024, drained * 1e3))
+        self.assertLess(np.median(with_journal), np.median(without) * 1.25 + 10e-6)
+
+
+# Набір тестів продуктивності для розпилювача
+
+
+class TestSprayPerformance(unittest.TestCase):
+    # Перевірка, що вартість порції не зростає з тривалістю розпилення, а елементів полотна не більшає
+    def test_spray_cost_is_flat(self):
+        view = create_view()
+        view.set_tool("sprayer")
+        events = recorded_stroke(10000, seed=2)
+        items = len(view.canvas.find_all())
+        samples = replay_stroke(view, events, view.draw)
+        first, last = np.mean(samples[:1000]), np.mean(samples[-1000:])
+        print("\nРозпилювач, %d подій" % len(events))
+        print("  перші 1000: %.1f мкс, останні 1000: %.1f мкс, %s" % (first * 1e6, last * 1e6, latency_report(samples)))
+        print("  елементів полотна: %d" % len(view.canvas.find_all()))
+        self.assertEqual(len(view.canvas.find_all()), items)
+        self.assertLess(last, first * 2)
+
+
+# Набір тестів продуктивності для перенесення буфера на екран
+
+
+class TestDisplayPerformance(unittest.TestCase):
+    # Розпилення з показом кожної події; вимірюється лише перенесення змін на екран
+    def spray_and_present(self, width):
+        view = create_view(width)
+        view.set_tool("sprayer")
+        model = view.presenter.model
+        events = recorded_stroke(2000, seed=3)
+        samples = []
+
+        def draw(event):
+            view.draw(event)
+            started = time.perf_counter()
+            model.flush()
+            view.present()
+            samples.append(time.perf_counter() - started)
+
+        replay_stroke(view, events, draw)
+        return samples
+
+    # Вартість кадру залежить від площі мазка, а не від розміру полотна
+    def test_cost_follows_brush_footprint(self):
+        small = self.spray_and_present(2)
+        large = self.spray_and_present(16)
+        view = create_view()
+        model = view.presenter.model
+        full = []
+        for _ in range(50):
+            started = time.perf_counter()
+            view.refresh_region((0, 0, model.width, model.height))
+            view.present()
+            full.append(time.perf_counter() - started)
+        print("\nПоказ розпилювача, %d подій" % len(small))
+        print("  радіус 15:   %s" % latency_report(small))
+        print("  радіус 64:   %s" % latency_report(large))
+        print("  все полотно: %s" % latency_report(full))
+        self.assertLess(np.median(small), np.median(full) / 4)
+        self.assertLess(np.median(large), np.median(full) / 4)
+
+
+# Набір тестів продуктивності для композиції шарів
+
+
+class TestLayerPerformance(unittest.TestCase):
+    # Малювання на середньому з восьми шарів: кожна змінена плитка - одне накладання на кешовані композиції
+    def test_paint_costs_single_blend(self):
+        model = DrawModel()
+        rng = np.random.default_rng(0)
+        for blend in ("multiply", "screen", "normal", "multiply", "normal", "screen", "multiply"):
+            layer = model.add_layer()
+            layer.set_image(Image.fromarray(rng.integers(0, 256, (model.height, model.width, 4), dtype=np.uint8)))
+            layer.blend = blend
+            layer.opacity = 0.7
+        model.select_layer(4)
+        started = time.perf_counter()
+        model.render((0, 0, model.width, model.height))
+        rebuild = time.perf_counter() - started
+        boxes = [(x, y, x + 64, y + 64) for x, y in rng.integers(0, (model.width - 64, model.height - 64), (300, 2))]
+        cached = []
+        full = []
+        for box in boxes:
+            model.draw_line([box[0] + 5, box[1] + 5, box[2] - 5, box[3] - 5], "red", 4)
+            started = time.perf_counter()
+            model.render(box)
+            cached.append(time.perf_counter() - started)
+            started = time.perf_counter()
+            result = np.ones((64, 64, 3), dtype=np.float32)
+            for layer in model.layers:
+                result = LayerStack.blend(layer.blend, result, *LayerStack.pixels(layer, box))
+            full.append(time.perf_counter() - started)
+        print("\nКомпозиція 8 шарів, плитка 64x64, перебудова кешів %.1f мс" % (rebuild * 1000))
+        print("  з кешами:         %s" % latency_report(cached))
+        print("  накладання шарів: %s" % latency_report(full))
+        self.assertLess(np.median(cached), np.median(full) / 2)
+
+
+# Набір тестів продуктивності для фільтрів
+
+
+class TestFilterPerformance(unittest.TestCase):
+    # Розмиття зображення 8K плитками у пулі процесів: пропускна здатність росте з кількістю ядер
+    def test_blur_scales_with_cores(self):
+        image = Image.fromarray(np.random.default_rng(0).integers(0, 256, size=(4320, 7680, 3), dtype=np.uint8))
+        counts = sorted({1, min(os.cpu_count() or 1, 8)})
+        rates = {}
+        for workers in counts:
+            engine = FilterEngine(workers=workers)
+            try:
+                # Процеси пулу запускаються заздалегідь, щоб не рахувати час їх старту
+                engine.run(Image.new("RGB", (512 * workers, 512)), "blur", (2,))
+                started = time.perf_counter()
+                engine.run(image, "blur", (2,))
+                rates[workers] = image.width * image.height / (time.perf_counter() - started) / 1e6
+            finally:
+                engine.shutdown()
+        print("\nРозмиття 7680x4320, радіус 2")
+        for workers, rate in rates.items():
+            print("  процесів %d: %.1f Мпікс/с" % (workers, rate))
+        if len(counts) == 1:
+            print("  одне ядро: масштабування не перевіряється")
+        else:
+            self.assertGreater(rates[counts[-1]] / rates[1], 0.7 * counts[-1])
+
+
+# Набір тестів продуктивності для експорту
+
+
+class TestExportPerformance(unittest.TestCase):
+    # Документ з кольоровими овалами: великі однотонні області та контури, як у звичайному малюнку
+    @staticmethod
+    def drawing(width, height):
+        model = DrawModel(width, height)
+        rng = np.random.default_rng(10)
+        for _ in range(300):
+            x, y = rng.integers(0, (width, height)).tolist()
+            model.image_draw.ellipse((x, y, x + int(rng.integers(20, 400)), y + int(rng.integers(20, 300))),
+                                     fill=tuple(rng.integers(0, 256, 3).tolist()), outline="black", width=3)
+        return model
+
+    # PNG, JPEG, GIF і мініатюра: конвеєр експорту проти чинного шляху збереження, який кодує кожен формат
+    # через PIL по черзі з повної композиції
+    def test_throughput(self):
+        pipeline = ExportPipeline()
+        print("\nЕкспорт у PNG, JPEG, GIF і мініатюру, процесів %d" % pipeline.workers)
+        try:
+            with tempfile.TemporaryDirectory() as directory:
+                # Процеси пулу запускаються заздалегідь, щоб не рахувати час їх старту
+                pipeline.run(pipeline.snapshot(DrawModel(64, 64)), os.path.join(directory, "warm"), ["png"])
+                for width, height in ((1250, 600), (6000, 4000)):
+                    model = self.drawing(width, height)
+                    started = time.perf_counter()
+                    image = model.layers.flatten()
+                    for image_format in ("PNG", "JPEG", "GIF"):
+                        encode_image(image, image_format)
+                    thumbnail = image.copy()
+                    thumbnail.thumbnail((256, 256))
+                    encode_image(thumbnail, "PNG")
+                    current = time.perf_counter() - started
+                    started = time.perf_counter()
+                    paths = pipeline.run(pipeline.snapshot(model), os.path.join(directory, "picture"),
+                                         list(ExportPipeline.outputs))
+                    exported = time.perf_counter() - started
+                    print("  %dx%d: збереження по черзі %.2f Мпікс/с, конвеєр %.2f Мпікс/с" % (
+                        width, height, width * height / current / 1e6, width * height / exported / 1e6))
+                    self.assertEqual(len(paths), 4)
+        finally:
+            pipeline.shutdown()
+        self.assertLess(exported, current / 1.3)
+
+
+# Набір тестів продуктивності для пакетного рендерингу
+
+
+class TestBatchPerformance(unittest.TestCase):
+    # Метод для генерування count однакових за складністю завдань: рамка із заливкою, штрих, овал і підпис
+    @staticmethod
+    def jobs(count):
+        rng = np.random.default_rng(20)
+        jobs = []
+        for index in range(count):
+            x, y = rng.integers(20, 200, size=2).tolist()
+            jobs.append({"width": 320, "height": 240, "output": "card_%05d.png" % index, "ops": [
+                {"tool": "rectangle", "from": [x, y], "to": [x + 90, y + 60], "color": "red", "width": 3},
+                {"tool": "fill", "at": [x + 45, y + 30], "color": "#ffe082"},
+                {"tool": "pencil", "points": rng.integers(0, 240, size=(10, 2)).tolist(), "width": 4},
+                {"tool": "oval", "from": [10, 10], "to": [100, 80], "width": 2},
+                {"tool": "text", "at": [160, 220], "text": "№ %d" % index}]})
+        return jobs
+
+    # Тисяча завдань: пропускна здатність росте з кількістю процесів, а результати надходять порціями
+    def test_scales_with_cores(self):
+        jobs = self.jobs(1000)
+        counts = sorted({1, min(os.cpu_count() or 1, 8)})
+        rates = {}
+        for workers in counts:
+            with tempfile.TemporaryDirectory() as directory:
+                started = time.perf_counter()
+                chunks = [len(chunk) for chunk in BatchRenderer(workers).run(jobs, directory)]
+                rates[workers] = len(jobs) / (time.perf_counter() - started)
+                self.assertEqual(sum(chunks), len(jobs))
+                self.assertGreater(len(chunks), workers)
+                self.assertEqual(len(os.listdir(directory)), len(jobs))
+        print("\nПакетний рендеринг %d завдань 320x240" % len(jobs))
+        for workers, rate in rates.items():
+            print("  процесів %d: %.0f зобр./с" % (workers, rate))
+        if len(counts) == 1:
+            print("  одне ядро: масштабування не перевіряється")
+        else:
+            # Запуск процесів пулу входить у вимірювання, тож межа трохи нижча, ніж для фільтрів
+            self.assertGreater(rates[counts[-1]] / rates[1], 0.6 * counts[-1])
+
+
+# Набір тестів продуктивності для запуску редактора
+
+
+class TestStartupPerformance(unittest.TestCase):
+    # Межа часу від запуску інтерпретатора до полотна, готового до малювання, у секундах
+    limit = 1.5
+    # Модулі, які мають завантажуватись лише під час першого використання
+    deferred = ("tkinter.filedialog", "tkinter.colorchooser", "PIL.ImageTk", "multiprocessing",
+                "multiprocessing.shared_memory", "concurrent.futures.process")
+    # Запуск редактора в окремому процесі: без дисплея полотно не показується, тож вимірюється лише побудова
+    script = """
+import json, sys, time, types
+started = time.perf_counter()
+import tkinter as tk
+from app.RasterGraphicsEditor import DrawModel, DrawPresenter
+imported = time.perf_counter()
+try:
+    root = tk.Tk()
+except tk.TclError:
+    from unittest.mock import MagicMock
+    root = None
+presenter = DrawPresenter(root or MagicMock(), DrawModel())
+if root is not None:
+    while not presenter.view.canvas.winfo_viewable():
+        root.tk.dooneevent()
+ready = time.perf_counter()
+print(json.dumps({"import": imported - started, "ready": ready - started, "display": root is not None,
+                  "loaded": [name for name in sys.argv[1:] if type(sys.modules.get(name)) is types.ModuleType]}))
+"""
+
+    # Метод для одного запуску; повертає загальний час процесу до готовності та звіт самого процесу
+    def launch(self):
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        started = time.perf_counter()
+        output = subprocess.run([sys.executable, "-c", self.script, *self.deferred], cwd=root, check=True,
+                                capture_output=True, text=True).stdout
+        return time.perf_counter() - started, json.loads(output)
+
+    # Час до готового полотна не перевищує межу, а модулі окремих дій не завантажуються під час запуску
+    def test_time_to_interactive(self):
+        runs = [self.launch() for _ in range(3)]
+        total, report = min(runs, key=lambda run: run[0])
+        print("\nЗапуск редактора (%s)" % ("з дисплеєм" if report["display"] else "без дисплея"))
+        print("  імпорт %.0f мс, полотно готове через %.0f мс, процес загалом %.0f мс" % (
+            report["import"] * 1e3, report["ready"] * 1e3, total * 1e3))
+        self.assertEqual(report["loaded"], [])
+        self.assertLess(total, self.limit)
+
+
+# Набір тестів продуктивності для вимірювань обробників
+
+
+class TestProfilerPerformance(unittest.TestCase):
+    def tearDown(self):
+        PROFILER.set_enabled(False)
+        PROFILER.reset()
+
+    # Вартість обгортки вимірювання: на порожньому обробнику видно лише її власні накладні витрати
+    def test_overhead(self):
+        # Метод-обробник, який нічого не робить
+        def handler(event):
+            return event
+
+        wrapped = profiled("test.handler")(handler)
+        calls = 200000
+
+        # Метод для середньої вартості одного виклику у мікросекундах
+        def measure(function):
+            started = time.perf_counter()
+            for _ in range(calls):
+                function(None)
+            return (time.perf_counter() - started) / calls * 1e6
+
+        # Заміри чергуються, щоб шум машини однаково впливав на обидва варіанти
+        bare, off = zip(*((measure(handler), measure(wrapped)) for _ in range(7)))
+        bare, off = min(bare), min(off)
+        PROFILER.set_enabled(True)
+        on = min(measure(wrapped) for _ in range(3))
+        print("\nОбгортка вимірювання, %d викликів" % calls)
+        print("  без обгортки: %.2f мкс, вимірювання вимкнене: +%.2f мкс, увімкнене: +%.2f мкс" % (
+            bare, off - bare, on - bare))
+        self.assertLess(off - bare, 0.5)
+
+
+# Набір тестів продуктивності для сховища фігур
+
+
+class TestShapeStorePerformance(unittest.TestCase):
+    # Мільйон точок у 10000 штрихах: пам'ять сховища проти кортежів Python та швидкість пошуку влучань
+    def test_million_points(self):
+        rng = np.random.default_rng(5)
+        strokes = rng.normal(0, 2, size=(10000, 100, 2)).cumsum(axis=1) + rng.uniform(0, (1250, 600), (10000, 1, 2))
+        colors = ["black", "red", "green", "blue"]
+        store = ShapeStore()
+        started = time.perf_counter()
+        for index, stroke in enumerate(strokes):
+            store.add("line", stroke, colors[index % 4], 1 + index % 8)
+        added = time.perf_counter() - started
+        tuples = [[(float(x), float(y)) for x, y in stroke] for stroke in strokes[:100]]
+        tuple_bytes = sum(sys.getsizeof(points) + sum(sys.getsizeof(point) + 2 * 24 for point in points)
+                          for points in tuples) * 100
+        started = time.perf_counter()
+        for x, y in rng.uniform(0, (1250, 600), (100, 2)):
+            store.hit_test(x, y)
+        hit = (time.perf_counter() - started) / 100
+        print("\nСховище фігур: %d точок у %d штрихах" % (store.size, len(store)))
+        print("  додавання %.0f мс, пам'ять %.1f МБ (кортежі Python: %.1f МБ), пошук влучання %.2f мс" % (
+            added * 1e3, store.memory() / 2 ** 20, tuple_bytes / 2 ** 20, hit * 1e3))
+        self.assertEqual(store.size, 1000000)
+        self.assertLess(store.memory(), 16 * 2 ** 20)
+
+    # Час пошуку влучання через просторовий індекс росте значно повільніше за кількість фігур
+    def test_hit_scaling(self):
+        rng = np.random.default_rng(7)
+        points = rng.uniform(0, (1250, 600), (200, 2))
+        timings = {}
+        for count in (1000, 64000):
+            store = ShapeStore()
+            strokes = rng.normal(0, 3, size=(count, 20, 2)).cumsum(axis=1) + rng.uniform(0, (1250, 600), (count, 1, 2))
+            for stroke in strokes:
+                store.add("line", stroke, "black", 2)
+            started = time.perf_counter()
+            for x, y in points:
+                store.hit_test(x, y)
+            timings[count] = (time.perf_counter() - started) / len(points)
+            print("\nПошук влучання серед %d штрихів: %.3f мс" % (count, timings[count] * 1e3), end="")
+        print()
+        self.assertLess(timings[64000], 16 * timings[1000])
+
+
+# Набір тестів продуктивності для файлу проєкту
+
+
+class TestProjectFilePerformance(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "large.rgep")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    # Проєкт на 500 МБ: відкриття та збереження з невеликою зміною мають тривати менше секунди
+    def test_open_and_save_large_project(self):
+        model = DrawModel()
+        stroke = np.random.default_rng(6).uniform(0, (1250, 600), (1000, 2)).astype(np.float32)
+        for index in range(62500):
+            model.shapes.add("spray", stroke, "black", 1 + index % 4)
+        model.save_project(self.path)
+        size = os.path.getsize(self.path)
+        del model
+        started = time.perf_counter()
+        model = DrawModel()
+        model.open_project(self.path)
+        opened = time.perf_counter() - started
+        model.begin_operation()
+        model.draw_line([10, 10, 200, 120], "red", 3)
+        model.end_operation()
+        started = time.perf_counter()
+        written = model.save_project(self.path)
+        saved = time.perf_counter() - started
+        started = time.perf_counter()
+        reopened = DrawModel()
+        reopened.open_project(self.path)
+        reopened_time = time.perf_counter() - started
+        print("\nПроєкт: %d фігур, %d точок, файл %.0f МБ разом із запасом для дописування" % (
+            len(model.shapes), model.shapes.size, size / 2 ** 20))
+        print("  відкриття %.0f мс, збереження зміни %.0f мс (%d байтів), повторне відкриття %.0f мс" % (
+            opened * 1e3, saved * 1e3, written, reopened_time * 1e3))
+        self.assertGreater(size, 500 * 10 ** 6)
+        self.assertEqual(reopened.image.tobytes(), model.image.tobytes())
+        self.assertLess(opened, 1)
+        self.assertLess(saved, 1)
+        self.assertLess(written, 1024 * 1024)
+
+    # Проєкт, більшу частину якого займає растр шарів. Відкриття читає всі плитки, бо шари - звичайні зображення
+    # PIL, тож його час залежить від обсягу растру; збереження невеликої зміни від нього не залежить
+    def test_open_and_save_raster_project(self):
+        width, height = 9000, 7000
+        model = DrawModel()
+        model.width, model.height = width, height
+        rng = np.random.default_rng(7)
+        model.layers[0].set_image(Image.fromarray(rng.integers(0, 256, (height, width, 3), dtype=np.uint8)))
+        model.add_layer()
+        model.layers[1].set_image(Image.fromarray(rng.integers(0, 256, (height, width, 4), dtype=np.uint8)))
+        model.save_project(self.path)
+        size = os.path.getsize(self.path)
+        raster = width * height * 7
+        corner = model.layers[0].image.crop((8800, 6800, 9000, 7000)).tobytes()
+        expected = model.layers[1].image.crop((4000, 3000, 4300, 3200)).tobytes()
+        del model
+        started = time.perf_counter()
+        model = DrawModel()
+        model.open_project(self.path)
+        opened = time.perf_counter() - started
+        model.begin_operation()
+        model.draw_line([4000, 3000, 4200, 3120], "red", 3)
+        model.end_operation()
+        started = time.perf_counter()
+        written = model.save_project(self.path)
+        saved = time.perf_counter() - started
+        print("\nРастровий проєкт: 2 шари %dx%d, файл %.0f МБ, з них растр %.0f%%" % (
+            width, height, size / 2 ** 20, 100 * raster / size))
+        print("  відкриття %.0f мс (%.0f МБ/с), збереження зміни %.0f мс (%d байтів)" % (
+            opened * 1e3, raster / opened / 2 ** 20, saved * 1e3, written))
+        self.assertGreater(raster, 0.95 * size)
+        self.assertEqual(model.layers[0].image.crop((8800, 6800, 9000, 7000)).tobytes(), corner)
+        self.assertNotEqual(model.layers[1].image.crop((4000, 3000, 4300, 3200)).tobytes(), expected)
+        self.assertLess(opened, 1.5)
+        self.assertLess(saved, 0.5)
+        self.assertLess(written, 1024 * 1024)
+
+
+# Набір тестів продуктивності для історії змін
+
+
+class TestHistoryPerformance(unittest.TestCase):
+    # Перевірка, що скасування і повторення вкладаються в один кадр після тисяч операцій
+    def test_undo_redo_latency(self):
+        model = DrawModel()
+        rng = np.random.default_rng(3)
+        for index in range(3000):
+            model.begin_operation()
+            if index % 500 == 499:
+                model.clear_screen()
+            else:
+                points = (rng.normal(0, 20, size=(20, 2)).cumsum(axis=0) + rng.uniform((0, 0), (1250, 600)))
+                model.draw_line(points.ravel().tolist(), "red", rng.integers(1, 36))
+            model.end_operation()
+        undo, redo = [], []
+        for samples, step in ((undo, model.undo), (redo, model.redo)):
+            for _ in range(len(model.history.undo_stack if step == model.undo else model.history.redo_stack)):
+                started = time.perf_counter()
+                step()
+                samples.append(time.perf_counter() - started)
+        history = model.history
+        print("\nІсторія: %d операцій, %.1f МБ, стиснено %d" % (len(history.undo_stack), history.size / 2 ** 20,
+                                                           history.undo_compressed))
+        print("  скасування: %s, максимум %.1f мс" % (latency_report(undo), max(undo) * 1e3))
+        print("  повторення: %s, максимум %.1f мс" % (latency_report(redo), max(redo) * 1e3))
+        self.assertLess(np.percentile(undo, 99), 0.016)
+        self.assertLess(np.percentile(redo, 99), 0.016)
+
+
+# Набір тестів продуктивності для великих зображень
+
+
+class TestTiledImagePerformance(unittest.TestCase):
+    # Створення великого нестисненого PPM без тримання всього зображення в пам'яті
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "large.ppm")
+        self.width, self.height = 12000, 8000
+        rng = np.random.default_rng(4)
+        with open(self.path, "wb") as file:
+            file.write(b"P6 %d %d 255\n" % (self.width, self.height))
+            for _ in range(0, self.height, 500):
+                file.write(rng.integers(0, 256, size=(500, self.width, 3), dtype=np.uint8).tobytes())
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    # Відкриття документом повного розміру, огляд під розмір полотна з піраміди, збільшення, прокручування
+    # в повній роздільності та штрих пензля
+    def test_open_and_scroll(self):
+        started = time.perf_counter()
+        tiled = TiledImage(self.path)
+        opened = time.perf_counter() - started
+        started = time.perf_counter()
+        tiled.prepare()
+        prepared = time.perf_counter() - started
+        model = DrawModel()
+        model.open_tiled(tiled)
+        mipmaps = MipmapCache(model.render, source=model.source_tile)
+        mipmaps.set_document(model.width, model.height)
+        started = time.perf_counter()
+        mipmaps.render((0, 0, model.width, model.height), (1250, 833), 1250 / model.width)
+        fitted = time.perf_counter() - started
+        started = time.perf_counter()
+        detail = mipmaps.render((6000, 4000, 6625, 4300), (1250, 600), 2)
+        zoomed = time.perf_counter() - started
+        # Збільшений вигляд показує пікселі повної роздільності, а не зменшений огляд
+        self.assertEqual(detail.getpixel((3, 5)), model.render((6001, 4002, 6002, 4003)).getpixel((0, 0)))
+        scroll = []
+        for x in range(0, 6000, 250):
+            started = time.perf_counter()
+            model.render((x, 3000, x + 1250, 3600))
+            scroll.append(time.perf_counter() - started)
+        started = time.perf_counter()
+        model.paint([6000, 4000, 6400, 4100], "red", 8, start=True)
+        painted = time.perf_counter() - started
+        cached = sum(tile.width * tile.height * len(tile.mode) for tile in tiled.cache.values())
+        print("\nЗображення %dx%d (%.0f МБ пікселів)" % (self.width, self.height,
+                                                       self.width * self.height * 3 / 2 ** 20))
+        print("  відкриття %.1f мс, підготовка %.1f с, огляд %.0f мс, збільшення %.0f мс, штрих %.1f мс" % (
+            opened * 1e3, prepared, fitted * 1e3, zoomed * 1e3, painted * 1e3))
+        print("  прокручування: %s" % latency_report(scroll))
+        print("  кеш плиток: %d плиток, %.1f МБ" % (len(tiled.cache), cached / 2 ** 20))
+        self.assertLess(opened, 0.05)
+        self.assertLess(fitted, 0.5)
+        self.assertLess(cached, 64 * 256 * 256 * 3 + 1)
+        self.assertEqual(model.image.getpixel((6200, 4050)), (255, 0, 0))
+
+
+# Набір тестів продуктивності для великих стиснених зображень. Пікову пам'ять процесу (RSS) можна лише прочитати,
+# а не скинути, тому зображення відкривається в окремому процесі. Пік береться з VmHWM, а не з ru_maxrss:
+# ru_maxrss зберігається під час exec і містив би пам'ять процесу тестів
+
+
+@unittest.skipUnless(os.path.exists("/proc/self/status"), "пікова пам'ять процесу читається лише з /proc")
+class TestCompressedImagePerformance(unittest.TestCase):
+    # Сценарій процесу: відкриття документом повного розміру, огляд, прокручування і штрих; друкує пікову пам'ять
+    # до і після відкриття в байтах
+    script = """
+import json, sys, time
+from app.RasterGraphicsEditor import DrawModel, MipmapCache, TiledImage
+def peak():
+    with open("/proc/self/status") as status:
+        return next(int(line.split()[1]) * 1024 for line in status if line.startswith("VmHWM:"))
+before = peak()
+started = time.perf_counter()
+tiled = TiledImage(sys.argv[1])
+tiled.prepare()
+model = DrawModel()
+model.open_tiled(tiled)
+opened = time.perf_counter() - started
+mipmaps = MipmapCache(model.render, source=model.source_tile)
+mipmaps.set_document(model.width, model.height)
+mipmaps.render((0, 0, model.width, model.height), (1250, 833), 1250 / model.width)
+for x in range(0, 6000, 250):
+    model.render((x, 3000, x + 1250, 3600))
+model.paint([6000, 4000, 6400, 4100], "red", 8, start=True)
+print(json.dumps({"before": before, "peak": peak(), "opened": opened}))
+"""
+
+    # Створення великого PNG: пікселі генеруються смугами у тимчасовий файл і кодуються з нього
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "large.png")
+        self.width, self.height = 12000, 8000
+        pixels = np.memmap(os.path.join(self.directory.name, "pixels.raw"), dtype=np.uint8, mode="w+",
+                           shape=(self.height, self.width, 3))
+        rng = np.random.default_rng(5)
+        for y in range(0, self.height, 500):
+            ys, xs = np.mgrid[y:y + 500, 0:self.width]
+            base = np.stack(((xs + ys) % 256, (3 * xs) % 256, (2 * ys) % 256), axis=-1).astype(np.uint8)
+            pixels[y:y + 500] = base + rng.integers(0, 16, size=base.shape, dtype=np.uint8)
+        Image.fromarray(pixels).save(self.path, compress_level=1)
+        del pixels
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    # Пам'ять, потрібна для відкриття, огляду, прокручування та малювання, значно менша за розпаковане зображення
+    def test_peak_memory(self):
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        output = subprocess.run([sys.executable, "-c", self.script, self.path], cwd=root, check=True,
+                                capture_output=True, text=True).stdout
+        report = json.loads(output)
+        grown = report["peak"] - report["before"]
+        decoded = self.width * self.height * 4
+        print("\nСтиснений PNG %dx%d (%.0f МБ файл, %.0f МБ розпакованих пікселів)" % (
+            self.width, self.height, os.path.getsize(self.path) / 2 ** 20, decoded / 2 ** 20))
+        print("  відкриття за %.1f с, пікова пам'ять процесу зросла на %.0f МБ" % (report["opened"], grown / 2 ** 20))
+        self.assertLess(grown, decoded / 6)
+
+
+# Функція для створення зображення з квадратною спіраллю: коридор шириною gap - 1 пікселів
+def spiral_image(width, height, gap=3):
+    image = Image.new("RGB", (width, height), "white")
+    x0, y0, x1, y1 = 0, 0, width - 1, height - 1
+    points = []
+    while x1 - x0 > 2 * gap and y1 - y0 > 2 * gap:
+        points += [(x0, y0), (x1, y0), (x1, y1), (x0, y1), (x0, y0 + gap)]
+        x0, y0, x1, y1 = x0 + gap, y0 + gap, x1 - gap, y1 - gap
+    ImageDraw.Draw(image).line(points, fill="black")
+    return image
+
+
+# Функція для створення шахового зображення з клітинкою cell пікселів
+def checkerboard_image(width, height, cell=1):
+    y, x = np.indices((height, width))
+    board = ((x // cell + y // cell) % 2 * 255).astype(np.uint8)
+    return Image.fromarray(np.dstack([board] * 3))
+
+
+# Набір тестів продуктивності для заливки
+
+
+class TestFloodFillPerformance(unittest.TestCase):
+    # Вимірювання заливки: повертає найкращий час з кількох повторів та кількість залитих пікселів
+    def measure(self, image, engine, x, y, repeats=5):
+        timings = []
+        for _ in range(repeats):
+            target = image.copy()
+            started = time.perf_counter()
+            box = engine.fill(target, x, y, "red")
+            timings.append(time.perf_counter() - started)
+        changed = np.count_nonzero((np.asarray(target) != np.asarray(image)).any(axis=2))
+        print("  %-32s %7.1f мс, %7d пікселів, область %s" % (self.id().split(".")[-1], min(timings) * 1e3,
+                                                           changed, box))
+        return min(timings)
+
+    # Заливка порожнього полотна 1250x600
+    def test_full_canvas(self):
+        elapsed = self.measure(Image.new("RGB", (1250, 600), "white"), FloodFillEngine(), 600, 300)
+        self.assertLess(elapsed, 0.1)
+
+    # Заливка коридору спіралі, який проходить через усе полотно
+    def test_spiral(self):
+        elapsed = self.measure(spiral_image(1250, 600), FloodFillEngine(), 5, 1)
+        self.assertLess(elapsed, 1.0)
+
+    # Заливка шахівниці з 8-зв'язністю: кожен відрізок має довжину в один піксель
+    def test_checkerboard_8(self):
+        elapsed = self.measure(checkerboard_image(1250, 600), FloodFillEngine(connectivity=8), 0, 0)
+        self.assertLess(elapsed, 1.0)
+
+    # Заливка шахівниці з 4-зв'язністю: область складається з однієї клітинки
+    def test_checkerboard_4(self):
+        elapsed = self.measure(checkerboard_image(1250, 600, cell=4), FloodFillEngine(), 0, 0)
+        self.assertLess(elapsed, 0.1)
+
+    # Заливка шуму з допуском кольору
+    def test_noise_tolerance(self):
+        noise = np.random.default_rng(1).integers(200, 256, size=(600, 1250, 3), dtype=np.uint8)
+        elapsed = self.measure(Image.fromarray(noise), FloodFillEngine(tolerance=40), 600, 300)
+        self.assertLess(elapsed, 0.2)
+
+    # Заливка всередині невеликого прямокутника на шумному полотні: модель шукає область лише в межах фігури
+    def test_enclosed_shape(self):
+        model = DrawModel()
+        model.image.paste(Image.fromarray(np.random.default_rng(2).integers(0, 2, size=(600, 1250, 3),
+                                                                            dtype=np.uint8) * 255).convert("RGBA"))
+        model.draw_rectangle(600, 300, 700, 360, "black", 2)
+        model.image_draw.rectangle((602, 302, 698, 358), fill="white")
+        full = self.measure(model.image, FloodFillEngine(), 650, 330)
+        timings = []
+        for color in ("red", "blue", "red", "blue", "red"):
+            model.begin_operation()
+            started = time.perf_counter()
+            box = model.fill_area(650, 330, color)
+            timings.append(time.perf_counter() - started)
+            model.end_operation()
+        print("  %-32s %7.1f мс, область %s" % ("fill_area", min(timings) * 1e3, box))
+        self.assertEqual(box, (601, 301, 700, 360))
+        self.assertLess(min(timings), full / 5)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,6 +1,21 @@
+import concurrent.futures
+import io
+import json
+import os
+import tempfile
+import time
 import unittest
-from unittest.mock import MagicMock
-from app.RasterGraphicsEditor import DrawModel, DrawPresenter
+from contextlib import redirect_stderr
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+import numpy as np
+from PIL import Image, ImageDraw
+from app.RasterGraphicsEditor import (BatchRenderer, BrushEngine, ChangeSet, DamageTracker, DrawModel, DrawPresenter,
+                                     ExportPipeline, FilterEngine, FloodFillEngine, HandlerStats, History,
+                                     ImageIOWorker, Journal, Layer, LayerStack, MipmapCache, PROFILER, Profiler,
+                                     ProjectFile, RecordingCanvas, SessionRecorder, SessionReplayer, ShapeStore,
+                                     SprayEngine, TaskCancelled, TiledImage, Viewport, export_output, filter_pixels,
+                                     main, palette_image, render_ops, simplify_stroke, write_png)
 
 
 # Набір тестів для класу DrawModel
@@ -49,6 +64,322 @@ class TestDrawModel(unittest.TestCase):
         self.model.notify()
         observer.update.assert_called_once()
 
+    # Перевірка малювання у растровому буфері
+    def test_draw_line(self):
+        self.model.draw_line([10, 10, 100, 10], "red", 3)
+        self.assertEqual(self.model.image.getpixel((50, 10)), (255, 0, 0))
+        self.assertEqual(self.model.image.getpixel((50, 50)), (255, 255, 255))
+
+    # Перевірка очищення растрового буфера
+    def test_clear_screen_resets_image(self):
+        self.model.draw_rectangle(10, 10, 50, 50, "blue", 2)
+        self.model.clear_screen()
+        self.assertEqual(self.model.image.getbbox(), (0, 0, self.model.width, self.model.height))
+        self.assertEqual(self.model.image.getcolors(), [(self.model.width * self.model.height, (255, 255, 255))])
+
+    # Перевірка збереження буфера у файл без захоплення екрану
+    def test_save_image(self):
+        self.model.draw_oval(100, 100, 200, 150, "green", 4)
+        with tempfile.TemporaryDirectory() as directory:
+            file_path = os.path.join(directory, "image.png")
+            self.model.save_image(file_path)
+            with Image.open(file_path) as saved:
+                self.assertEqual(saved.size, (1250, 600))
+                self.assertEqual(saved.tobytes(), self.model.image.tobytes())
+
+    # Перевірка заміни активного шару результатом фільтра та її скасування
+    def test_apply_filtered(self):
+        original = self.model.image.copy()
+        self.model.apply_filtered(Image.new("RGB", (1250, 600), "red"), "levels", (0, 128, 1.0))
+        self.assertEqual(self.model.image.getpixel((10, 10)), (255, 0, 0))
+        self.assertEqual(self.model.shapes.records[-1].extra, ("levels", 0, 128, 1.0))
+        self.model.undo()
+        self.assertEqual(self.model.image.tobytes(), original.tobytes())
+
+    # Перевірка розміщення відкритого зображення по центру буфера
+    def test_open_image(self):
+        self.model.open_image(Image.new("RGB", (50, 40), "red"))
+        self.assertEqual(self.model.image.getpixel((625, 300)), (255, 0, 0))
+        self.assertEqual(self.model.image.getpixel((10, 10)), (255, 255, 255))
+
+    # Перевірка відкриття великого зображення документом його розміру: зменшені плитки беруться з піраміди,
+    # доки їх область не змінено
+    def test_open_tiled(self):
+        with tempfile.TemporaryDirectory() as directory:
+            file_path = os.path.join(directory, "large.png")
+            original = Image.fromarray(np.random.default_rng(1).integers(0, 256, size=(700, 1500, 3), dtype=np.uint8))
+            original.save(file_path)
+            tiled = TiledImage(file_path)
+            tiled.prepare()
+            self.model.draw_line([10, 10, 100, 10], "red", 3)
+            self.model.open_tiled(tiled)
+            self.assertEqual((self.model.width, self.model.height, len(self.model.shapes)), (1500, 700, 0))
+            self.assertIsNone(self.model.undo())
+            box = (1000, 500, 1500, 700)
+            self.assertEqual(self.model.render(box).tobytes(), original.crop(box).tobytes())
+            self.assertEqual(self.model.source_tile(1, 0, 0, 256).tobytes(), tiled.tile(1, 0, 0).tobytes())
+            self.model.draw_line([10, 10, 100, 10], "red", 3)
+            self.assertIsNone(self.model.source_tile(1, 0, 0, 256))
+            self.assertIsNone(self.model.source_tile(1, 0, 0, 64))
+            self.assertIsNotNone(self.model.source_tile(1, 1, 0, 256))
+            self.assertEqual(self.model.image.getpixel((50, 10)), (255, 0, 0))
+
+    # Перевірка піпетки: на краю штриха береться колір фігури, а поза фігурами - колір композиції
+    def test_pick_color(self):
+        self.model.paint([20, 20, 120, 20], "#ff8000", 9, start=True)
+        self.model.fill_area(300, 300, "blue")
+        self.model.set_color("black")
+        self.assertEqual(self.model.pick_color(60, 24.5), "#ff8000")
+        self.assertEqual(self.model.line_color, "#ff8000")
+        self.assertEqual(self.model.pick_color(300, 300), "#0000ff")
+        self.model.paint([20, 20, 120, 20], self.model.erase_ink, 20, start=True)
+        self.assertEqual(self.model.pick_color(60, 20), "white")
+        # Гумка на прозорому шарі не має власного кольору, тож видно колір композиції під нею
+        self.model.add_layer()
+        self.model.paint([300, 300, 320, 300], self.model.erase_ink, 20, start=True)
+        self.assertEqual(self.model.pick_color(310, 300), "#0000ff")
+        self.assertIsNone(self.model.pick_color(-1, 20))
+
+
+# Набір тестів для шарів документа
+
+
+class TestLayers(unittest.TestCase):
+    def setUp(self):
+        self.model = DrawModel()
+
+    # Створення стеку з фоном кольору background та шаром кольору color у режимі blend
+    @staticmethod
+    def stack(background, color, blend="normal", opacity=1.0):
+        layers = LayerStack(Layer(0, "Фон", Image.new("RGB", (4, 4), background)))
+        layers.add().image.paste(color + (255,), (0, 0, 4, 4))
+        layers.active.blend = blend
+        layers.active.opacity = opacity
+        return layers
+
+    # Перевірка формул режимів накладання
+    def test_blend_modes(self):
+        expected = {"normal": (100, 200, 255), "multiply": (78, 78, 50), "screen": (222, 222, 255),
+                    "overlay": (188, 157, 100)}
+        for blend, color in expected.items():
+            layers = self.stack((200, 100, 50), (100, 200, 255), blend)
+            self.assertEqual(layers.render((0, 0, 4, 4)).getpixel((1, 1)), color, blend)
+        layers = self.stack((200, 100, 50), (100, 200, 250), opacity=0.5)
+        self.assertEqual(layers.render((0, 0, 4, 4)).getpixel((1, 1)), (150, 150, 150))
+
+    # Перевірка, що композиція з кешами збігається з накладанням усіх шарів по черзі
+    def test_cached_composite(self):
+        rng = np.random.default_rng(0)
+        for blends in (["multiply", "screen", "normal", "multiply"], ["screen", "normal", "overlay", "multiply"]):
+            layers = LayerStack(Layer(0, "Фон", Image.fromarray(rng.integers(0, 256, (60, 80, 3), dtype=np.uint8))))
+            for blend in blends:
+                layer = layers.add()
+                layer.set_image(Image.fromarray(rng.integers(0, 256, (60, 80, 4), dtype=np.uint8)))
+                layer.blend = blend
+                layer.opacity = 0.8
+            layers.select(2)
+            layers.render((0, 0, 80, 60))
+            # Малювання на активному шарі не перебудовує кешів
+            layers.active.draw.rectangle((10, 10, 30, 30), fill="red")
+            expected = np.ones((60, 80, 3), dtype=np.float32)
+            for layer in layers:
+                expected = LayerStack.blend(layer.blend, expected, *LayerStack.pixels(layer, (0, 0, 80, 60)))
+            expected = np.rint(expected * 255)
+            for box in ((0, 0, 80, 60), (5, 5, 40, 33)):
+                result = np.asarray(layers.render(box), dtype=np.float32)
+                self.assertLessEqual(np.abs(result - expected[box[1]:box[3], box[0]:box[2]]).max(), 1)
+
+    # Перевірка малювання та гумки на шарі малювання: фон лишається незмінним
+    def test_paint_layer(self):
+        self.model.add_layer()
+        self.model.draw_line([10, 10, 100, 10], "red", 3)
+        self.assertEqual(self.model.image.getpixel((50, 10)), (255, 0, 0, 255))
+        self.assertEqual(self.model.layers[0].image.getpixel((50, 10)), (255, 255, 255))
+        self.assertEqual(self.model.render((0, 0, 200, 50)).getpixel((50, 10)), (255, 0, 0))
+        self.model.draw_line([40, 10, 60, 10], self.model.erase_ink, 5)
+        self.assertEqual(self.model.image.getpixel((50, 10)), (0, 0, 0, 0))
+        self.assertEqual(self.model.render((0, 0, 200, 50)).getpixel((50, 10)), (255, 255, 255))
+        self.model.configure_layer(1, visible=False)
+        self.assertEqual(self.model.render((0, 0, 200, 50)).getpixel((20, 10)), (255, 255, 255))
+
+    # Перевірка, що скасування повертає активним шар, який змінила операція
+    def test_undo_selects_layer(self):
+        self.model.add_layer()
+        self.model.begin_operation()
+        self.model.draw_rectangle(10, 10, 50, 50, "blue", 2)
+        self.model.end_operation()
+        self.model.select_layer(0)
+        self.model.undo()
+        self.assertEqual(self.model.layers.active_index, 1)
+        self.assertIsNone(self.model.image.getbbox())
+
+    # Перевірка, що відкрите зображення потрапляє у фон, а шари малювання лишаються
+    def test_open_image_background(self):
+        self.model.add_layer()
+        self.model.draw_line([10, 10, 100, 10], "red", 3)
+        self.model.open_image(Image.new("RGB", (50, 40), "blue"))
+        self.assertEqual(self.model.layers.active_index, 1)
+        self.assertEqual(self.model.layers[0].image.getpixel((625, 300)), (0, 0, 255))
+        self.assertEqual(self.model.image.getpixel((50, 10)), (255, 0, 0, 255))
+        self.assertEqual(self.model.render((0, 0, 1250, 600)).getpixel((625, 300)), (0, 0, 255))
+
+
+# Набір тестів для відкладених сповіщень моделі
+
+
+class TestChangeNotifications(unittest.TestCase):
+    def setUp(self):
+        self.model = DrawModel()
+        self.scheduled = []
+        self.model.set_scheduler(self.scheduled.append)
+        self.calls = []
+        self.first = MagicMock()
+        self.first.update.side_effect = lambda changes: self.calls.append(("first", changes))
+        self.second = MagicMock()
+        self.second.update.side_effect = lambda changes: self.calls.append(("second", changes))
+        self.model.subscribe(self.second)
+        self.model.subscribe(self.first)
+
+    # Перевірка, що серія змін дає одне відкладене сповіщення з об'єднаною областю
+    def test_coalescing(self):
+        self.model.set_color("red")
+        self.model.draw_line([10, 10, 20, 10], "red", 1)
+        self.model.fill_area(600, 300, "blue")
+        self.model.draw_line([100, 50, 120, 60], "red", 1)
+        self.assertEqual(len(self.scheduled), 1)
+        self.assertEqual(self.calls, [])
+        self.scheduled.pop()()
+        self.assertEqual(len(self.calls), 2)
+        changes = self.calls[0][1]
+        self.assertEqual(changes.kinds, ["color", "image"])
+        self.assertEqual(changes.box, (0, 0, self.model.width, self.model.height))
+        self.model.flush()
+        self.assertEqual(len(self.calls), 2)
+
+    # Перевірка порядку: обсервери у порядку підписки, зміни під час надсилання - у наступному сповіщенні
+    def test_ordering(self):
+        self.second.update.side_effect = lambda changes: (self.calls.append(("second", changes)),
+                                                   changes.box and self.model.set_color("green"))
+        self.model.draw_line([10, 10, 20, 10], "red", 1)
+        self.scheduled.pop()()
+        self.assertEqual([name for name, _ in self.calls], ["second", "first"])
+        self.assertEqual(self.calls[0][1].box, (9, 9, 22, 12))
+        self.assertEqual(len(self.scheduled), 1)
+        self.scheduled.pop()()
+        self.assertEqual([name for name, _ in self.calls], ["second", "first", "second", "first"])
+        self.assertEqual(self.calls[2][1].kinds, ["color"])
+        self.assertIsNone(self.calls[2][1].box)
+
+
+# Набір тестів для класу Viewport
+
+
+class TestViewport(unittest.TestCase):
+    def setUp(self):
+        self.viewport = Viewport(100, 50)
+        self.viewport.set_document(400, 200)
+
+    # Перевірка, що точка під курсором лишається на місці, а масштаб повертається точно до 1
+    def test_zoom(self):
+        self.viewport.zoom(4, 20, 10)
+        self.assertEqual(self.viewport.scale, 2)
+        self.assertEqual(self.viewport.to_document([20, 10]), [20, 10])
+        self.viewport.pan(-20, -10)
+        self.assertEqual((self.viewport.x, self.viewport.y), (20, 10))
+        self.viewport.zoom(-4, 0, 0)
+        self.assertEqual((self.viewport.scale, self.viewport.x, self.viewport.y), (1, 20, 10))
+        self.viewport.pan(100, 100)
+        self.assertTrue(self.viewport.identity())
+        self.viewport.zoom(-100, 0, 0)
+        self.assertEqual(self.viewport.scale, 1 / 32)
+        self.viewport.fit()
+        self.assertEqual(self.viewport.scale, 0.25)
+        self.assertEqual(self.viewport.visible(), (0, 0, 400, 200))
+
+    # Перевірка переведення прямокутника документа на екран з відсіканням невидимої частини
+    def test_to_screen(self):
+        self.assertEqual(self.viewport.to_screen((10, 10, 20, 20)), (10, 10, 20, 20))
+        self.assertIsNone(self.viewport.to_screen((150, 10, 160, 20)))
+        self.viewport.zoom(4, 0, 0)
+        self.viewport.pan(-20, 0)
+        self.assertEqual(self.viewport.to_screen((0, 0, 30, 400)), (0, 0, 40, 50))
+        self.assertEqual(self.viewport.to_document([0, 0, 40, 50]), [10, 0, 30, 25])
+
+
+# Набір тестів для класу MipmapCache
+
+
+class TestMipmapCache(unittest.TestCase):
+    def setUp(self):
+        pixels = np.random.default_rng(3).integers(0, 256, size=(300, 500, 3), dtype=np.uint8)
+        self.image = Image.fromarray(pixels)
+        self.cache = MipmapCache(self.image.crop, tile_size=64)
+        self.cache.set_document(*self.image.size)
+
+    # Перевірка, що рівень будується з плиток попереднього і збігається зі зменшенням усього документа
+    def test_levels(self):
+        expected = self.image.reduce(4)
+        rendered = self.cache.render((0, 0, 500, 300), expected.size, 0.25)
+        # Два зменшення вдвічі округлюються інакше, ніж одне вчетверо
+        self.assertLessEqual(np.abs(np.asarray(rendered, dtype=int) - np.asarray(expected, dtype=int)).max(), 1)
+        self.assertEqual(len(self.cache.cache[2]), 4)
+        self.assertEqual(self.cache.render((10, 20, 30, 25), (40, 10), 2).getpixel((3, 3)),
+                         self.image.getpixel((11, 21)))
+
+    # Перевірка, що зменшені плитки беруться з готової піраміди, а без неї будуються з композиції
+    def test_source(self):
+        render = MagicMock(side_effect=self.image.crop)
+        source = MagicMock(side_effect=lambda level, tx, ty, size: self.image.reduce(2).crop(
+            (tx * size, ty * size, min(250, (tx + 1) * size), min(150, (ty + 1) * size))) if level == 1 else None)
+        cache = MipmapCache(render, tile_size=64, source=source)
+        cache.set_document(*self.image.size)
+        self.assertEqual(cache.render((0, 0, 500, 300), (250, 150), 0.5).tobytes(), self.image.reduce(2).tobytes())
+        render.assert_not_called()
+        cache.render((0, 0, 500, 300), (125, 75), 0.25)
+        render.assert_not_called()
+        source.assert_any_call(2, 0, 0, 64)
+        cache.render((0, 0, 100, 100), (100, 100), 1)
+        render.assert_called()
+
+    # Перевірка, що змінена область скидає плитки всіх рівнів над нею, і лише їх
+    def test_invalidate(self):
+        self.cache.render((0, 0, 500, 300), (125, 75), 0.25)
+        self.image.paste((255, 0, 0), (0, 0, 10, 10))
+        self.cache.invalidate((0, 0, 10, 10))
+        self.assertEqual({level: len(tiles) for level, tiles in self.cache.cache.items()}, {0: 39, 1: 11, 2: 3})
+        self.assertEqual(self.cache.render((0, 0, 500, 300), (125, 75), 0.25).getpixel((1, 1)), (255, 0, 0))
+
+
+# Набір тестів для класу DamageTracker
+
+
+class TestDamageTracker(unittest.TestCase):
+    # Перевірка злиття областей, що перекриваються чи торкаються
+    def test_merge(self):
+        damage = DamageTracker()
+        damage.add((0, 0, 10, 10))
+        damage.add((10, 5, 20, 15))
+        damage.add((50, 50, 60, 60))
+        damage.add((5, 5, 55, 52))
+        self.assertEqual(damage.take(), [(0, 0, 60, 60)])
+        self.assertFalse(damage)
+
+    # Перевірка, що далекі області лишаються окремими, а порожні ігноруються
+    def test_separate_regions(self):
+        damage = DamageTracker()
+        damage.add((0, 0, 10, 10))
+        damage.add((30, 30, 30, 40))
+        damage.add((100, 0, 110, 10))
+        self.assertEqual(damage.regions, [(0, 0, 10, 10), (100, 0, 110, 10)])
+        self.assertEqual(damage.bounds(), (0, 0, 110, 10))
+
+    # Перевірка обмеження кількості областей
+    def test_max_regions(self):
+        damage = DamageTracker(max_regions=3)
+        for x in range(0, 100, 20):
+            damage.add((x, 0, x + 5, 5))
+        self.assertEqual(damage.regions, [(0, 0, 65, 5), (80, 0, 85, 5)])
+
 
 # Набір тестів для класу DrawView
 
@@ -77,14 +408,35 @@ class TestDrawView(unittest.TestCase):
     def test_create_width_selector(self):
         self.assertIsNotNone(self.view.width_frame)
 
-    # Перевірка методу для створення палітри кольорів
+    # Перевірка, що палітра кольорів та меню будуються після першого показу полотна
     def test_create_color_palette(self):
+        self.assertFalse(hasattr(self.view, "color_frame"))
+        self.view.canvas_exposed(None)
+        self.root.after_idle.assert_called_with(self.view.setup_deferred_ui)
+        self.view.setup_deferred_ui()
         self.assertIsNotNone(self.view.color_frame)
 
     # Перевірка методу для створення полотна
     def test_create_draw_area(self):
         self.assertIsNotNone(self.view.canvas)
 
+    # Перевірка, що зміни буфера переносяться на екран раз на кадр і лише зміненими областями
+    def test_refresh_region_throttled(self):
+        self.view.raster_photo = MagicMock()
+        self.model.render.side_effect = Image.new("RGB", (200, 200), "white").crop
+        self.view.refresh_region((0, 0, 10, 10))
+        self.view.refresh_region((5, 5, 20, 20))
+        self.view.refresh_region((100, 100, 110, 120))
+        self.root.after.assert_called_once_with(0, self.view.present)
+        self.view.present()
+        targets = [call.args[3:] for call in self.view.raster_photo.tk.call.call_args_list]
+        self.assertEqual(targets, [("-to", 0, 0), ("-to", 100, 100)])
+        # Наступний кадр чекає на решту інтервалу після попереднього; час зафіксовано, щоб пауза збирача сміття
+        # між викликами не впливала на перевірку
+        with patch("app.RasterGraphicsEditor.time.perf_counter", return_value=self.view.last_frame + 0.005):
+            self.view.refresh_region((0, 0, 10, 10))
+        self.assertEqual(self.root.after.call_args[0][0], 11)
+
     # Перевірка методу для координат початку малювання
     def test_start_drawing(self):
         event = type('', (), {})()
@@ -94,6 +446,123 @@ class TestDrawView(unittest.TestCase):
         self.assertIsNotNone(self.view.start_x)
         self.assertIsNotNone(self.view.start_y)
 
+    # Перевірка піпетки: клік полотна переводиться в координати документа і передається моделі
+    def test_picker(self):
+        self.view.canvas = MagicMock()
+        self.view.set_tool("picker")
+        self.view.canvas.bind.assert_called_once_with("<Button-1>", self.view.pick_color)
+        offset = self.view.offset
+        self.view.pick_color(SimpleNamespace(x=offset + 30, y=offset + 40))
+        self.model.pick_color.assert_called_once_with(30, 40)
+
+    # Перевірка, що штрих олівця малюється лише у растровому буфері, без елементів полотна
+    def test_pencil_stroke_raster_only(self):
+        self.view.canvas = MagicMock()
+        self.view.line_width = MagicMock()
+        self.view.line_width.get.return_value = 2
+        self.view.presenter.model = DrawModel()
+        self.view.set_tool("pencil")
+        event = type('', (), {})()
+        event.x, event.y = 10, 10
+        self.view.start_drawing(event)
+        for i in range(200):
+            event.x, event.y = 10 + i, 10 + (i % 7)
+            self.view.draw(event)
+        self.view.end_drawing(event)
+        self.view.canvas.create_line.assert_not_called()
+        self.assertEqual(self.view.presenter.model.image.getpixel((100 - self.view.offset, 13 - self.view.offset)),
+                         (0, 0, 0))
+
+    # Перевірка, що тимчасова фігура створюється один раз і стає остаточною
+    def test_shape_preview_reused(self):
+        self.view.canvas = MagicMock()
+        self.view.canvas.create_rectangle.return_value = 7
+        self.view.line_width = MagicMock()
+        self.view.set_tool("rectangle")
+        event = type('', (), {})()
+        event.x, event.y = 10, 10
+        self.view.start_drawing(event)
+        for i in range(10):
+            event.x, event.y = 20 + i, 30 + i
+            self.view.draw(event)
+        self.view.end_drawing(event)
+        self.view.canvas.create_rectangle.assert_called_once()
+        self.assertEqual(self.view.canvas.coords.call_count, 10)
+        self.view.canvas.dtag.assert_called_once_with(7, "temp")
+        self.view.canvas.delete.assert_not_called()
+
+    # Перевірка, що у збільшеному вигляді жести малюють у координатах документа, а кадр береться з рівня кешу
+    def test_zoomed_drawing(self):
+        self.view.canvas = RecordingCanvas()
+        self.view.raster_photo = MagicMock()
+        self.view.line_width = MagicMock()
+        self.view.line_width.get.return_value = 2
+        self.view.presenter.model = model = DrawModel()
+        offset = self.view.offset
+        self.view.zoom(4, SimpleNamespace(x=offset, y=offset))
+        self.view.pan(SimpleNamespace(x=0, y=0))
+        self.view.start_pan(SimpleNamespace(x=0, y=0))
+        self.view.pan(SimpleNamespace(x=-200, y=-100))
+        self.assertEqual((self.view.viewport.x, self.view.viewport.y), (100, 50))
+        self.view.set_tool("rectangle")
+        self.view.start_drawing(SimpleNamespace(x=offset + 20, y=offset + 20))
+        self.view.end_drawing(SimpleNamespace(x=offset + 60, y=offset + 40))
+        self.assertEqual(model.shapes.xy(model.shapes.records[0]).tolist(), [[110, 60], [130, 70]])
+        self.assertEqual(model.image.getpixel((110, 65)), (0, 0, 0))
+        self.view.set_tool("fill")
+        self.view.fill_canvas(SimpleNamespace(x=offset + 41, y=offset + 31))
+        self.assertEqual(model.image.getpixel((120, 65)), (0, 0, 0))
+        self.view.damage.take()
+        self.view.refresh_region((100, 50, 140, 80))
+        self.view.present()
+        self.assertEqual(self.view.raster_photo.tk.call.call_args[0][3:], ("-to", 0, 0))
+        self.assertIn(0, self.view.mipmaps.cache)
+
+    # Перевірка, що елементи старих дій прибираються з полотна після кадру, а дії лишаються в моделі
+    def test_compaction(self):
+        self.view.canvas = RecordingCanvas()
+        self.view.create_raster_item()
+        self.view.line_width = MagicMock()
+        self.view.line_width.get.return_value = 2
+        self.view.presenter.model = model = DrawModel()
+        self.view.compactor.keep_operations = 3
+        self.view.set_tool("rectangle")
+        for i in range(5):
+            self.view.start_drawing(SimpleNamespace(x=10 + 20 * i, y=10))
+            self.view.draw(SimpleNamespace(x=25 + 20 * i, y=40))
+            self.view.end_drawing(SimpleNamespace(x=25 + 20 * i, y=40))
+        self.assertEqual(self.view.item_count(), 6)
+        self.view.present()
+        self.assertEqual(self.view.canvas.find_withtag("raster"), (1,))
+        self.assertEqual(self.view.item_count(), 4)
+        self.assertEqual(len(model.shapes), 5)
+        self.assertEqual(model.image.getpixel((10 - self.view.offset, 20 - self.view.offset)), (0, 0, 0))
+        self.view.presenter.undo()
+        self.assertEqual(self.view.item_count(), 3)
+        self.assertEqual(self.view.compactor.count, 2)
+        self.view.clear_screen()
+        self.assertEqual(self.view.compactor.count, 0)
+
+
+# Набір тестів для проріджування штрихів
+
+
+class TestSimplifyStroke(unittest.TestCase):
+    # Перевірка, що точки на прямій відкидаються, а кінці зберігаються
+    def test_collinear_points(self):
+        points = [0, 0, 1, 1, 2, 2, 3, 3, 4, 4]
+        self.assertEqual(simplify_stroke(points, 0.5), [0, 0, 4, 4])
+
+    # Перевірка, що вершини, які відхиляються більше за допуск, залишаються
+    def test_keeps_corners(self):
+        points = [0, 0, 5, 0, 10, 0, 10, 5, 10, 10]
+        self.assertEqual(simplify_stroke(points, 0.5), [0, 0, 10, 0, 10, 10])
+
+    # Перевірка, що нульовий допуск вимикає проріджування
+    def test_zero_tolerance(self):
+        points = [0, 0, 1, 1, 2, 2]
+        self.assertEqual(simplify_stroke(points, 0), points)
+
 
 # Набір тестів для класу DrawPresenter
 
@@ -117,15 +586,1129 @@ class TestDrawPresenter(unittest.TestCase):
         self.presenter.clear_screen()
         self.view.clear_screen.assert_called_once()
 
+    # Перевірка скасування дії
+    def test_undo(self):
+        self.presenter.undo()
+        self.model.undo.assert_called_once()
+        self.view.undo_operation.assert_called_once_with(self.model.undo.return_value)
+
+    # Перевірка повторення дії
+    def test_redo(self):
+        self.presenter.redo()
+        self.model.redo.assert_called_once()
+
     # Перевірка методу опису виходу з програми
     def test_quit(self):
         self.presenter.quit()
         self.root.destroy.assert_called_once()
 
+    # Перевірка виходу, який чекає на незавершене збереження
+    def test_exit_waits_for_save(self):
+        self.presenter.io = MagicMock()
+        self.presenter.io.busy.return_value = True
+        self.presenter.io.tasks = []
+        with patch("app.RasterGraphicsEditor.messagebox.askyesnocancel", return_value=False):
+            self.presenter.exit_application()
+        self.root.destroy.assert_not_called()
+        self.presenter.task_finished(MagicMock(kind="save"), "done", None)
+        self.root.destroy.assert_called_once()
+
+    # Перевірка, що велике зображення відкривається документом свого розміру і показується цілим
+    def test_large_image_opened(self):
+        tiled = MagicMock(spec=TiledImage)
+        self.presenter.image_opened(tiled)
+        self.model.open_tiled.assert_called_once_with(tiled)
+        self.model.open_image.assert_not_called()
+        self.view.document_resized.assert_called_once_with(self.model.width, self.model.height)
+        self.view.zoom_fit.assert_called_once()
+
+    # Перевірка, що невдалий експорт повідомляє саме про експорт і скасовує вихід, який на нього чекав
+    def test_export_failed(self):
+        self.presenter.io = MagicMock()
+        self.presenter.io.tasks = []
+        self.presenter.exit_pending = True
+        with patch("app.RasterGraphicsEditor.messagebox.showerror") as showerror:
+            self.presenter.task_finished(MagicMock(kind="export"), "error", OSError("disk full"))
+        self.assertEqual(showerror.call_args[0][1], "Не вдалось експортувати зображення: disk full")
+        self.assertFalse(self.presenter.exit_pending)
+        self.root.destroy.assert_not_called()
+
+    # Перевірка, що з появою другого шару елементи полотна прибираються
+    def test_add_layer(self):
+        self.model.layers.single = True
+        self.presenter.add_layer()
+        self.view.drop_items.assert_called_once()
+        self.model.add_layer.assert_called_once()
+        changes = ChangeSet()
+        changes.add("layers")
+        self.presenter.update(changes)
+        self.view.update_layers.assert_called_once()
+
+    # Перевірка фонового застосування фільтра до активного шару
+    def test_apply_filter(self):
+        self.presenter.io = MagicMock()
+        self.model.layers.layers = [self.model.layers.active]
+        self.presenter.apply_filter("blur", (2,))
+        kind, title, job, on_done = self.presenter.io.submit.call_args[0]
+        self.assertEqual(kind, "filter")
+        on_done("result")
+        self.model.apply_filtered.assert_called_once_with("result", "blur", (2,))
+
     # Перевірка методу для оновлення
     def test_update(self):
-        self.presenter.update()
-        self.view.canvas.update.assert_called_once()
+        changes = ChangeSet()
+        changes.add("image", (10, 20, 30, 40))
+        changes.add("image", (500, 300, 520, 310))
+        self.presenter.update(changes)
+        self.assertEqual(self.view.refresh_region.call_count, 2)
+        self.view.refresh_region.assert_called_with((500, 300, 520, 310))
+        self.view.canvas.update.assert_not_called()
+
+
+# Набір тестів для класу FloodFillEngine
+
+
+class TestFloodFillEngine(unittest.TestCase):
+    def setUp(self):
+        self.image = Image.new("RGB", (40, 30), "white")
+
+    # Перевірка, що заливка не виходить за межі замкненого контуру
+    def test_fill_enclosed_region(self):
+        ImageDraw.Draw(self.image).rectangle((10, 10, 20, 20), outline="black")
+        box = FloodFillEngine().fill(self.image, 15, 15, "red")
+        self.assertEqual(box, (11, 11, 20, 20))
+        self.assertEqual(self.image.getpixel((15, 15)), (255, 0, 0))
+        self.assertEqual(self.image.getpixel((5, 5)), (255, 255, 255))
+
+    # Перевірка, що повторна заливка тим самим кольором нічого не змінює
+    def test_fill_same_color(self):
+        self.assertIsNone(FloodFillEngine().fill(self.image, 5, 5, "white"))
+
+    # Перевірка допуску кольору
+    def test_tolerance(self):
+        self.image.putpixel((5, 5), (250, 250, 250))
+        exact = self.image.copy()
+        FloodFillEngine(tolerance=0).fill(exact, 0, 0, "red")
+        self.assertEqual(exact.getpixel((5, 5)), (250, 250, 250))
+        FloodFillEngine(tolerance=10).fill(self.image, 0, 0, "red")
+        self.assertEqual(self.image.getpixel((5, 5)), (255, 0, 0))
+
+    # Перевірка 4- та 8-зв'язності на діагональних пікселях
+    def test_connectivity(self):
+        self.image.putpixel((1, 1), (0, 0, 0))
+        self.image.putpixel((2, 2), (0, 0, 0))
+        four = self.image.copy()
+        FloodFillEngine(connectivity=4).fill(four, 1, 1, "red")
+        self.assertEqual(four.getpixel((2, 2)), (0, 0, 0))
+        FloodFillEngine(connectivity=8).fill(self.image, 1, 1, "red")
+        self.assertEqual(self.image.getpixel((2, 2)), (255, 0, 0))
+
+    # Перевірка, що заливка у вікні збігається із заливкою всього зображення, а область, яка виходить за вікно,
+    # шукається далі на всьому зображенні
+    def test_windows(self):
+        ImageDraw.Draw(self.image).rectangle((10, 10, 20, 20), outline="black")
+        expected = self.image.copy()
+        FloodFillEngine().fill(expected, 15, 15, "red")
+        self.assertEqual(FloodFillEngine().fill(self.image, 15, 15, "red", windows=[(9, 9, 21, 21)]),
+                         (11, 11, 20, 20))
+        self.assertEqual(self.image.tobytes(), expected.tobytes())
+        self.image.putpixel((20, 15), (255, 0, 0))
+        ImageDraw.Draw(self.image).rectangle((21, 0, 39, 29), fill="red")
+        box = FloodFillEngine().fill(self.image, 15, 15, "blue", windows=[(9, 9, 21, 21), (5, 5, 25, 25)])
+        self.assertEqual(box, (11, 0, 40, 30))
+        self.assertEqual(self.image.getpixel((35, 25)), (0, 0, 255))
+        self.assertEqual(self.image.getpixel((5, 5)), (255, 255, 255))
+        box = FloodFillEngine().fill(self.image, 5, 5, "blue", windows=[(9, 9, 21, 21)])
+        self.assertEqual(box, (0, 0, 21, 30))
+
+
+# Набір тестів для класу SprayEngine
+
+
+class TestSprayEngine(unittest.TestCase):
+    # Перевірка, що порція містить задану кількість крапель у межах радіуса
+    def test_burst(self):
+        points = SprayEngine(density=50, seed=1).burst(100, 100, 10)
+        self.assertEqual(points.shape, (50, 2))
+        self.assertTrue((abs(points - 100) <= 10).all())
+
+    # Перевірка нормального розподілу крапель
+    def test_gaussian_burst(self):
+        points = SprayEngine(density=1000, gaussian=True, seed=1).burst(0, 0, 10)
+        self.assertAlmostEqual(points.mean(), 0, delta=1)
+        self.assertAlmostEqual(points.std(), 5, delta=1)
+
+    # Перевірка, що розпилення змінює лише пікселі всередині повернутого прямокутника
+    def test_model_spray(self):
+        model = DrawModel()
+        box = model.spray(5, 5, 15, "red")
+        self.assertIsNotNone(box)
+        self.assertIn((255, 0, 0), [color for _, color in model.image.crop(box).getcolors()])
+        outside = model.image.copy()
+        outside.paste("white", box)
+        self.assertEqual(outside.getcolors(), [(model.width * model.height, (255, 255, 255))])
+
+
+# Набір тестів для класу BrushEngine
+
+
+class TestBrushEngine(unittest.TestCase):
+    # Перевірка, що маски кешуються за розміром, жорсткістю та зсувом, а кеш обмежений
+    def test_mask_cache(self):
+        engine = BrushEngine(cache_size=4)
+        self.assertIs(engine.masks_for(5, 1.0), engine.masks_for(5, 1.0))
+        coverage = engine.masks_for(5, 1.0)[0]
+        mask = coverage[0, 0]
+        self.assertEqual(mask[engine.half(5), engine.half(5)], 1)
+        self.assertTrue(0 < mask[engine.half(5) + 2, engine.half(5) + 2] < 1)
+        self.assertTrue((coverage[0, 2] != mask).any())
+        self.assertLess(engine.masks_for(5, 0.0)[0][0, 0].sum(), mask.sum())
+        for size in range(10):
+            engine.masks_for(size + 1, 1.0)
+        self.assertEqual(len(engine.masks), 4)
+
+    # Перевірка кроку відбитків і його продовження між відрізками одного штриха
+    def test_dabs(self):
+        engine = BrushEngine(spacing=0.25)
+        self.assertEqual([x for x, _ in engine.dabs([0, 0, 10, 0], 8, start=True)], [0, 2, 4, 6, 8, 10])
+        self.assertEqual(engine.dabs([10, 0, 13, 0], 8), [(12, 0)])
+        self.assertEqual(engine.dabs([13, 0, 14, 0], 8), [(14, 0)])
+        self.assertEqual(engine.dabs([50, 0, 51, 0], 8), [(50, 0)])
+
+    # Перевірка, що змішування відбитків по одному та одним проходом NumPy дає ті самі пікселі, зокрема біля краю
+    def test_vector_dabs(self):
+        images = []
+        for vector_dabs in (10 ** 9, 0):
+            engine = BrushEngine(hardness=0.3)
+            engine.vector_dabs = vector_dabs
+            image = Image.new("RGB", (120, 80), "white")
+            box = engine.stroke(image, [-5, 10, 60, 40, 118, 75], (0, 0, 255, 255), 12, start=True)
+            images.append(np.asarray(image, dtype=int))
+        self.assertEqual(box, (0, 2, 120, 80))
+        self.assertLessEqual(np.abs(images[0] - images[1]).max(), 1)
+
+    # Перевірка, що штрих змінює лише свою область і має згладжений край
+    def test_stroke(self):
+        image = Image.new("RGB", (100, 100), "white")
+        box = BrushEngine().stroke(image, [20, 50, 80, 50], (255, 0, 0, 255), 9, start=True)
+        self.assertEqual(box, (14, 44, 85, 57))
+        self.assertEqual(image.getpixel((50, 50)), (255, 0, 0))
+        self.assertEqual(image.getpixel((50, 40)), (255, 255, 255))
+        edge = image.getpixel((16, 48))
+        self.assertTrue(255 > edge[1] > 0)
+        outside = image.copy()
+        outside.paste("white", box)
+        self.assertEqual(outside.getcolors(), [(100 * 100, (255, 255, 255))])
+
+    # Перевірка пензля на прозорому шарі: колір накладається поверх, а прозорий колір стирає
+    def test_transparent_layer(self):
+        image = Image.new("RGBA", (50, 50), (0, 0, 0, 0))
+        engine = BrushEngine()
+        engine.stroke(image, [10, 25, 40, 25], (0, 0, 255, 255), 6, start=True)
+        self.assertEqual(image.getpixel((25, 25)), (0, 0, 255, 255))
+        engine.stroke(image, [25, 10, 25, 40], (0, 0, 0, 0), 4, start=True)
+        self.assertEqual(image.getpixel((25, 25))[3], 0)
+        self.assertEqual(image.getpixel((15, 25)), (0, 0, 255, 255))
+
+    # Перевірка, що штрих пензля моделі скасовується та відтворюється з журналу
+    def test_model_paint(self):
+        with tempfile.TemporaryDirectory() as directory:
+            model = DrawModel()
+            model.journal = Journal(directory)
+            model.begin_operation()
+            model.paint([10, 10, 50, 50], "red", 5, start=True)
+            model.paint([50, 50, 90, 20], "red", 5)
+            model.end_operation()
+            self.assertEqual([shape.kind for shape in model.shapes], ["line"])
+            model.journal.close()
+            restored = DrawModel()
+            Journal.recover(directory, restored)
+            self.assertEqual(restored.image.tobytes(), model.image.tobytes())
+            model.undo()
+            self.assertEqual(model.image.getcolors(), [(model.width * model.height, (255, 255, 255))])
+
+# Набір тестів для класу History
+
+
+class TestHistory(unittest.TestCase):
+    def setUp(self):
+        self.model = DrawModel()
+
+    # Малювання лінії як окремої операції
+    def draw(self, y, color="red"):
+        self.model.begin_operation()
+        self.model.draw_line([10, y, 300, y], color, 3)
+        return self.model.end_operation()
+
+    # Перевірка скасування та повторення операції
+    def test_undo_redo(self):
+        self.draw(20)
+        original = self.model.image.copy()
+        self.draw(40, "blue")
+        changed = self.model.image.copy()
+        self.assertIsNotNone(self.model.undo())
+        self.assertEqual(self.model.image.tobytes(), original.tobytes())
+        self.assertIsNotNone(self.model.redo())
+        self.assertEqual(self.model.image.tobytes(), changed.tobytes())
+
+    # Перевірка, що операція зберігає лише змінені плитки
+    def test_copy_on_write_tiles(self):
+        operation = self.draw(20)
+        self.assertEqual(set(operation.tiles), {(0, 0), (1, 0), (2, 0), (3, 0), (4, 0)})
+        self.assertEqual(operation.box(self.model.width, self.model.height), (0, 0, 320, 64))
+
+    # Перевірка, що нова операція очищає стек повторення
+    def test_new_operation_clears_redo(self):
+        self.draw(20)
+        self.model.undo()
+        self.draw(40)
+        self.assertIsNone(self.model.redo())
+
+    # Перевірка, що очищення екрану можна скасувати
+    def test_undo_clear_screen(self):
+        self.draw(20)
+        drawn = self.model.image.copy()
+        self.model.clear_screen()
+        self.model.undo()
+        self.assertEqual(self.model.image.tobytes(), drawn.tobytes())
+
+    # Перевірка межі пам'яті: старі операції стискаються, а потім витісняються
+    def test_memory_limit(self):
+        self.model.history = History(memory_limit=100 * 1024)
+        for y in range(10, 590, 20):
+            self.draw(y)
+        history = self.model.history
+        self.assertLessEqual(history.size, history.memory_limit)
+        self.assertGreater(history.undo_compressed, 0)
+        self.model.history = History(memory_limit=100 * 1024, compress=False)
+        for y in range(10, 590, 20):
+            self.draw(y)
+        self.assertLess(len(self.model.history.undo_stack), 29)
+        self.assertLessEqual(self.model.history.size, 100 * 1024)
+
+    # Перевірка скасування стисненої операції
+    def test_undo_compressed(self):
+        self.draw(20)
+        original = self.model.image.copy()
+        self.draw(40, "blue")
+        self.model.history.undo_stack[-1].compress()
+        self.model.undo()
+        self.assertEqual(self.model.image.tobytes(), original.tobytes())
+
+
+# Набір тестів для класу ShapeStore
+
+
+class TestShapeStore(unittest.TestCase):
+    def setUp(self):
+        self.model = DrawModel()
+
+    # Малювання штриха олівця відрізками в межах однієї операції
+    def stroke(self, points, color="black", width=3):
+        self.model.begin_operation()
+        for i in range(0, len(points) - 2, 2):
+            self.model.draw_line(points[i:i + 4], color, width, round_caps=True)
+        self.model.end_operation()
+
+    # Перевірка, що відрізки одного штриха зберігаються однією фігурою, а кольори - один раз
+    def test_stroke_coalescing(self):
+        self.stroke([10, 10, 20, 15, 30, 10, 40, 20])
+        self.stroke([50, 50, 60, 60], "red")
+        self.stroke([60, 60, 70, 70], "red")
+        store = self.model.shapes
+        self.assertEqual(len(store), 3)
+        self.assertEqual(store.xy(store.records[0]).tolist(), [[10, 10], [20, 15], [30, 10], [40, 20]])
+        self.assertEqual(store.colors, ["black", "red"])
+        self.assertEqual(store.style(store.records[2]), ("red", 3.0))
+        self.assertEqual(store.bounds[0].tolist(), [10, 10, 40, 20])
+
+    # Перевірка, що завершений штрих пензля зберігається проріджений, а наступна фігура йде одразу за ним
+    def test_stroke_simplified(self):
+        self.model.begin_operation()
+        for x in range(0, 200, 4):
+            self.model.paint([x, 50 + (x >= 100) * (x - 100), x + 4, 50 + (x + 4 >= 100) * (x - 96)], "black", 3)
+        self.model.end_operation()
+        self.stroke([300, 300, 310, 310], "red")
+        store = self.model.shapes
+        self.assertEqual(store.xy(store.records[0]).tolist(), [[0, 50], [100, 50], [200, 150]])
+        self.assertEqual(store.bounds[0].tolist(), [0, 50, 200, 150])
+        self.assertEqual(store.xy(store.records[1]).tolist(), [[300, 300], [310, 310]])
+        self.assertEqual(store.hit_test(150, 100), 0)
+        self.assertIsNone(store.hit_test(150, 60))
+
+    # Перевірка, що скасування та повторення прибирають і повертають фігури операції
+    def test_undo_redo(self):
+        self.stroke([10, 10, 20, 20])
+        self.model.begin_operation()
+        self.model.draw_rectangle(100, 100, 200, 150, "blue", 2)
+        self.model.draw_oval(300, 100, 400, 150, "blue", 2)
+        self.model.end_operation()
+        self.model.undo()
+        self.assertEqual([shape.kind for shape in self.model.shapes], ["line"])
+        self.model.redo()
+        self.assertEqual([shape.kind for shape in self.model.shapes], ["line", "rectangle", "oval"])
+        self.assertEqual(self.model.shapes.xy(self.model.shapes.records[2]).tolist(), [[300, 100], [400, 150]])
+
+    # Перевірка пошуку фігури під точкою
+    def test_hit_test(self):
+        self.stroke([10, 10, 100, 10], width=4)
+        self.model.draw_rectangle(200, 100, 300, 200, "blue", 2)
+        self.model.draw_oval(400, 100, 500, 200, "blue", 2)
+        store = self.model.shapes
+        self.assertEqual(store.hit_test(50, 12), 0)
+        self.assertIsNone(store.hit_test(50, 20))
+        self.assertEqual(store.hit_test(300, 150), 1)
+        self.assertIsNone(store.hit_test(250, 150))
+        self.assertEqual(store.hit_test(450, 100), 2)
+        self.assertIsNone(store.hit_test(450, 150))
+
+    # Перевірка, що просторовий індекс стежить за додаванням, скасуванням та очищенням полотна
+    def test_spatial_index(self):
+        self.stroke([10, 10, 100, 10, 400, 300])
+        store = self.model.shapes
+        self.assertEqual(store.hit_test(250, 155), 0)
+        self.model.begin_operation()
+        self.model.draw_rectangle(200, 100, 300, 200, "blue", 2)
+        self.model.draw_polygon([500, 100, 600, 100, 550, 200], "blue", 2)
+        self.model.end_operation()
+        self.assertEqual(list(store.enclosing(250, 150)), [(198, 98, 302, 202)])
+        self.assertEqual(len(list(store.enclosing(550, 120))), 1)
+        self.assertEqual(list(store.enclosing(510, 190)), [])
+        self.model.undo()
+        self.assertIsNone(store.hit_test(300, 150))
+        self.model.redo()
+        self.assertEqual(store.hit_test(300, 150), 1)
+        self.model.clear_screen()
+        self.assertIsNone(store.hit_test(300, 150))
+        self.assertEqual(list(store.enclosing(250, 150)), [])
+        self.model.undo()
+        self.assertEqual(store.hit_test(300, 150), 1)
+        unpacked = ShapeStore.unpack(store.pack())
+        self.assertEqual(unpacked.hit_test(250, 155), 0)
+        self.assertEqual(list(unpacked.enclosing(250, 150)), [(198, 98, 302, 202)])
+
+    # Перевірка пакування та відновлення сховища
+    def test_pack_unpack(self):
+        self.stroke([10, 10, 20, 15, 30, 10])
+        self.model.spray(600, 300, 20, "green")
+        self.model.draw_text(200, 200, "Текст", "red", ("Arial", 11))
+        store = ShapeStore.unpack(self.model.shapes.pack())
+        self.assertEqual([shape.kind for shape in store], ["line", "spray", "text"])
+        self.assertEqual(store.records[2].extra, ("Текст", "Arial", 11))
+        self.assertEqual(store.xy(store.records[1]).tolist(),
+                         self.model.shapes.xy(self.model.shapes.records[1]).tolist())
+        self.assertEqual(store.hit_test(10, 10), 0)
+
+
+# Набір тестів для класу ProjectFile
+
+
+class TestProjectFile(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "project.rgep")
+        self.model = DrawModel()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    # Малювання штриха в межах однієї операції
+    def stroke(self, model, points, color="black"):
+        model.begin_operation()
+        model.draw_line(points, color, 3, round_caps=True)
+        model.end_operation()
+
+    # Відкриття збереженого проєкту в новій моделі
+    def reopen(self):
+        model = DrawModel()
+        model.open_project(self.path)
+        return model
+
+    # Перевірка, що буфер, фігури та їх параметри відновлюються без змін
+    def test_round_trip(self):
+        self.stroke(self.model, [10, 10, 50, 50, 90, 20], "red")
+        self.model.draw_line([100, 100, 200, 100], "blue", 2, dash=(5, 5))
+        self.model.draw_text(300, 300, "Текст", "green", ("Arial", 11))
+        self.model.save_project(self.path)
+        model = self.reopen()
+        self.assertEqual(model.image.tobytes(), self.model.image.tobytes())
+        self.assertEqual([shape.kind for shape in model.shapes], ["line", "line", "text"])
+        self.assertEqual([shape.extra for shape in model.shapes], [None, (5, 5), ("Текст", "Arial", 11)])
+        self.assertEqual(model.shapes.xy(model.shapes.records[0]).tolist(), [[10, 10], [50, 50], [90, 20]])
+        self.assertEqual(model.shapes.style(model.shapes.records[2]), ("green", 0.0))
+
+    # Перевірка, що повторне збереження пише лише змінені плитки та нові точки
+    def test_incremental_save(self):
+        self.stroke(self.model, [10, 10, 50, 50])
+        full = self.model.save_project(self.path)
+        self.assertEqual(self.model.save_project(self.path), 0)
+        self.stroke(self.model, [600, 300, 610, 310], "red")
+        written = self.model.save_project(self.path)
+        self.assertLess(written, full / 10)
+        model = self.reopen()
+        self.assertEqual(model.image.tobytes(), self.model.image.tobytes())
+        self.assertEqual(len(model.shapes), 2)
+
+    # Перевірка збереження після скасування вже збережених змін та подальшого малювання
+    def test_save_after_undo(self):
+        model = self.model
+        for x in range(0, 500, 100):
+            self.stroke(model, [x, 10, x + 50, 60])
+        model.save_project(self.path)
+        model.undo()
+        model.undo()
+        self.stroke(model, [20, 400, 80, 450], "blue")
+        model.save_project(self.path)
+        reopened = self.reopen()
+        self.assertEqual(reopened.image.tobytes(), model.image.tobytes())
+        self.assertEqual([reopened.shapes.style(shape)[0] for shape in reopened.shapes], ["black"] * 3 + ["blue"])
+        self.assertEqual(reopened.shapes.xy(reopened.shapes.records[3]).tolist(), [[20, 400], [80, 450]])
+
+    # Перевірка збереження шарів, їх параметрів та видалення шару
+    def test_layers(self):
+        self.stroke(self.model, [10, 10, 50, 50])
+        self.model.add_layer()
+        self.model.configure_layer(1, opacity=0.5, blend="multiply")
+        self.stroke(self.model, [30, 10, 30, 90], "red")
+        self.model.save_project(self.path)
+        model = self.reopen()
+        self.assertEqual(model.layers.describe(), self.model.layers.describe())
+        self.assertEqual(model.render((0, 0, 100, 100)).tobytes(), self.model.render((0, 0, 100, 100)).tobytes())
+        self.model.remove_layer()
+        self.model.save_project(self.path)
+        model = self.reopen()
+        self.assertEqual(len(model.layers), 1)
+        self.assertEqual(model.image.tobytes(), self.model.image.tobytes())
+
+    # Перевірка відмови відкривати файл іншого формату
+    def test_wrong_format(self):
+        Image.new("RGB", (10, 10)).save(self.path, "PNG")
+        with self.assertRaises(ValueError):
+            ProjectFile(self.path).load()
+
+
+# Набір тестів для класу Journal
+
+
+class TestJournal(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.model = DrawModel()
+        self.model.journal = Journal(self.directory.name)
+
+    def tearDown(self):
+        if self.model.journal.writer.is_alive():
+            self.model.journal.close()
+        self.directory.cleanup()
+
+    # Малювання кількох дій різними інструментами
+    def draw(self, model):
+        model.begin_operation()
+        model.draw_line([10, 10, 50, 50], "red", 3, round_caps=True)
+        model.draw_line([50, 50, 90, 20], "red", 3, round_caps=True)
+        model.end_operation()
+        model.begin_operation()
+        model.spray(300, 300, 20, "blue")
+        model.end_operation()
+        model.begin_operation()
+        model.draw_rectangle(400, 100, 500, 200, "green", 2)
+        model.end_operation()
+        model.begin_operation()
+        model.fill_area(450, 150, "yellow")
+        model.end_operation()
+
+    # Відновлення у новій моделі
+    def recover(self):
+        model = DrawModel()
+        count = Journal.recover(self.directory.name, model)
+        return model, count
+
+    # Перевірка відновлення дій, скасування та повторення з журналу
+    def test_recover(self):
+        self.draw(self.model)
+        self.model.undo()
+        self.model.undo()
+        self.model.redo()
+        self.model.journal.flush()
+        self.assertTrue(Journal.exists(self.directory.name))
+        model, count = self.recover()
+        self.assertEqual(count, 8)
+        self.assertEqual(model.image.tobytes(), self.model.image.tobytes())
+        self.assertEqual([shape.kind for shape in model.shapes], ["line", "spray", "rectangle"])
+        self.assertEqual(model.shapes.xy(model.shapes.records[1]).tolist(),
+                         self.model.shapes.xy(self.model.shapes.records[1]).tolist())
+
+    # Перевірка відновлення зі знімка та записів, зроблених після нього
+    def test_snapshot(self):
+        self.draw(self.model)
+        self.model.journal.snapshot(self.model)
+        self.model.draw_oval(100, 300, 200, 350, "black", 2)
+        self.model.journal.flush()
+        model, count = self.recover()
+        self.assertEqual(count, 1)
+        self.assertEqual(model.image.tobytes(), self.model.image.tobytes())
+        self.assertEqual(len(model.shapes), len(self.model.shapes))
+
+    # Перевірка, що обірваний останній запис ігнорується
+    def test_torn_record(self):
+        self.draw(self.model)
+        self.model.journal.flush()
+        self.model.draw_oval(100, 300, 200, 350, "black", 2)
+        self.model.journal.close()
+        with open(self.model.journal.path, "r+b") as file:
+            file.truncate(os.path.getsize(self.model.journal.path) - 3)
+        model, count = self.recover()
+        self.assertEqual(count, 5)
+        self.assertEqual([shape.kind for shape in model.shapes], ["line", "spray", "rectangle", "fill"])
+
+    # Перевірка відновлення дій із шарами
+    def test_layers(self):
+        self.model.add_layer()
+        self.draw(self.model)
+        self.model.configure_layer(1, blend="screen")
+        self.model.select_layer(0)
+        self.model.draw_oval(100, 300, 200, 350, "black", 2)
+        self.model.journal.flush()
+        model, count = self.recover()
+        self.assertEqual(model.layers.describe(), self.model.layers.describe())
+        self.assertEqual(model.layers.flatten().tobytes(), self.model.layers.flatten().tobytes())
+
+    # Перевірка, що звичайне завершення роботи видаляє журнал
+    def test_close_discard(self):
+        self.draw(self.model)
+        self.model.journal.close(discard=True)
+        self.assertFalse(Journal.exists(self.directory.name))
+        self.assertEqual(os.listdir(self.directory.name), [])
+
+
+# Набір тестів для класу TiledImage
+
+
+class TestTiledImage(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        pixels = np.random.default_rng(0).integers(0, 256, size=(300, 500, 3), dtype=np.uint8)
+        self.image = Image.fromarray(pixels)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    # Збереження тестового зображення у файл заданого формату
+    def save(self, extension):
+        file_path = os.path.join(self.directory.name, "image." + extension)
+        self.image.save(file_path)
+        return file_path
+
+    # Перевірка читання області з нестисненого файлу без декодування
+    def test_read_region_mapped(self):
+        for extension in ("ppm", "bmp", "tiff"):
+            tiled = TiledImage(self.save(extension), tile_size=64)
+            self.assertIsNotNone(tiled.chunks)
+            box = (30, 40, 250, 170)
+            self.assertEqual(tiled.read_region(box).tobytes(), self.image.crop(box).tobytes())
+
+    # Перевірка читання області зі стисненого файлу через тимчасовий файл
+    def test_read_region_spooled(self):
+        tiled = TiledImage(self.save("png"), tile_size=64)
+        self.assertIsNone(tiled.chunks)
+        box = (100, 0, 500, 64)
+        self.assertEqual(tiled.read_region(box).tobytes(), self.image.crop(box).tobytes())
+
+    # Перевірка, що зображення з палітрою та стиснений TIFF розпаковуються у рідному режимі й перетворюються по областях
+    def test_spooled_modes(self):
+        box = (30, 40, 250, 170)
+        for image, options in ((self.image.convert("P"), {"transparency": 7}), (self.image.convert("L"), {})):
+            for extension, extra in (("png", {}), ("tiff", {"compression": "tiff_deflate"})):
+                file_path = os.path.join(self.directory.name, "modes." + extension)
+                image.save(file_path, **options, **extra)
+                tiled = TiledImage(file_path, tile_size=64)
+                self.assertIsNone(tiled.chunks)
+                with Image.open(file_path) as expected:
+                    expected = expected.convert(tiled.mode).crop(box)
+                self.assertEqual(tiled.read_region(box).tobytes(), expected.tobytes())
+
+    # Перевірка плиток піраміди та обмеженого кешу
+    def test_pyramid_tiles(self):
+        tiled = TiledImage(self.save("ppm"), tile_size=64, cache_size=4, overview_size=128)
+        self.assertEqual(tiled.overview_level, 2)
+        self.assertEqual(tiled.tile(1, 1, 0).tobytes(), self.image.crop((128, 0, 256, 128)).reduce(2).tobytes())
+        self.assertEqual(tiled.tile(2, 0, 0).size, (64, 64))
+        for tx in range(6):
+            tiled.tile(0, tx, 0)
+        self.assertEqual(len(tiled.cache), 4)
+
+    # Перевірка підготовки до редагування: розпаковане RGB-зображення змінюється на місці, сирі дані
+    # та прозорі зображення переводяться в RGB на білому папері, огляд будується заздалегідь
+    def test_prepare(self):
+        tiled = TiledImage(self.save("png"), tile_size=64, overview_size=128)
+        image = tiled.prepare()
+        self.assertIsNotNone(tiled.overview)
+        self.assertEqual((image.mode, image.tobytes()), ("RGB", self.image.tobytes()))
+        ImageDraw.Draw(image).point((5, 7), fill=(1, 2, 3))
+        self.assertEqual(tiled.decoded.getpixel((5, 7)), (1, 2, 3))
+        tiled = TiledImage(self.save("ppm"), tile_size=64)
+        self.assertEqual(tiled.prepare().tobytes(), self.image.tobytes())
+        transparent = self.image.convert("RGBA")
+        transparent.putpixel((9, 9), (0, 0, 0, 0))
+        file_path = os.path.join(self.directory.name, "transparent.png")
+        transparent.save(file_path)
+        image = TiledImage(file_path, tile_size=64).prepare(strip_height=32)
+        self.assertEqual(image.getpixel((9, 9)), (255, 255, 255))
+        self.assertEqual(image.getpixel((100, 200)), self.image.getpixel((100, 200)))
+
+
+# Набір тестів для класу FilterEngine
+
+
+class TestFilterEngine(unittest.TestCase):
+    # Перевірка, що обробка плитками з перекриттям у кількох процесах дає той самий результат, що й без плиток
+    def test_tiles_match_whole_image(self):
+        pixels = np.random.default_rng(0).integers(0, 256, size=(150, 230, 4), dtype=np.uint8)
+        engine = FilterEngine(workers=2, tile_size=64)
+        try:
+            filters = (("blur", (3,)), ("sharpen", (1.5, 1.0)), ("grayscale", ()), ("levels", (20, 230, 1.5)))
+            for name, params in filters:
+                result = engine.run(Image.fromarray(pixels), name, params)
+                self.assertEqual(result.mode, "RGBA")
+                self.assertTrue((np.asarray(result) == filter_pixels(name, params, pixels)).all(), name)
+        finally:
+            engine.shutdown()
+
+    # Перевірка, що після скасування спільна пам'ять звільняється лише тоді, коли плитки, які вже обробляються,
+    # завершаться: інакше їхні процеси не знайдуть її
+    def test_cancel_waits_for_running_tiles(self):
+        class CancellingTask:
+            def wait(self, future):
+                raise TaskCancelled()
+
+        engine = FilterEngine(workers=2, tile_size=256)
+        try:
+            engine.run(Image.new("RGB", (8, 8)), "grayscale", ())
+            submit = engine.processes.submit
+            futures = []
+            engine.processes.submit = lambda *args: futures.append(submit(*args)) or futures[-1]
+            image = Image.fromarray(np.random.default_rng(0).integers(0, 256, size=(1024, 1024, 3), dtype=np.uint8))
+            with self.assertRaises(TaskCancelled):
+                engine.run(image, "blur", (12,), CancellingTask())
+            concurrent.futures.wait(futures)
+            started = [future for future in futures if not future.cancelled()]
+            self.assertTrue(started)
+            self.assertEqual([future.exception() for future in started], [None] * len(started))
+        finally:
+            engine.shutdown()
+
+    # Перевірка самих фільтрів
+    def test_filters(self):
+        pixels = np.zeros((20, 20, 3), dtype=np.uint8)
+        pixels[:, 10:] = (50, 120, 200)
+        gray = filter_pixels("grayscale", (), pixels)
+        self.assertTrue((gray[..., 0] == gray[..., 2]).all())
+        self.assertEqual(gray[0, 15].tolist(), [108] * 3)
+        self.assertEqual(filter_pixels("levels", (50, 200, 1.0), pixels)[0, 15].tolist(), [0, 119, 255])
+        blurred = filter_pixels("blur", (2,), pixels)
+        self.assertTrue((blurred[:, :4] == 0).all())
+        self.assertTrue(0 < blurred[0, 10, 2] < 200)
+        sharpened = filter_pixels("sharpen", (1, 1.0), pixels)
+        self.assertGreater(int(sharpened[0, 10, 1]), 120)
+        self.assertEqual(sharpened[0, 9, 1], 0)
+
+    # Перевірка попереднього перегляду на зменшеній копії
+    def test_preview(self):
+        image = Image.new("RGBA", (1250, 600), (0, 0, 0, 0))
+        proxy, factor = FilterEngine.proxy(image)
+        self.assertEqual(proxy.size, (400, 192))
+        preview = FilterEngine.preview(proxy, factor, "blur", (5,))
+        self.assertEqual(preview.mode, "RGB")
+        self.assertEqual(preview.getpixel((10, 10)), (255, 255, 255))
+
+
+# Набір тестів для класу Profiler
+
+
+class TestProfiler(unittest.TestCase):
+    def tearDown(self):
+        PROFILER.set_enabled(False)
+        PROFILER.reset()
+
+    # Перевірка перцентилів гістограми: похибка не більша за ширину кошика
+    def test_percentiles(self):
+        stats = HandlerStats()
+        for micros in range(1, 1001):
+            stats.record(micros / 1e6)
+        self.assertEqual(stats.count, 1000)
+        self.assertAlmostEqual(stats.percentile(50) * 1e6, 500, delta=500 * 0.1)
+        self.assertAlmostEqual(stats.percentile(99) * 1e6, 990, delta=990 * 0.1)
+        self.assertEqual(stats.percentile(100), stats.max)
+        self.assertEqual(sum(count for _, count in stats.summary(0)["histogram"]), 1000)
+
+    # Перевірка, що обробники вимірюються лише тоді, коли збирання увімкнене
+    def test_profiled_handlers(self):
+        model = DrawModel()
+        model.notify("image", (0, 0, 10, 10))
+        self.assertEqual(PROFILER.handlers, {})
+        PROFILER.set_enabled(True)
+        model.notify("image", (0, 0, 10, 10))
+        model.fill_area(5, 5, "red")
+        summary = PROFILER.summary()
+        self.assertEqual(summary["model.notify"]["count"], 2)
+        self.assertGreater(summary["model.notify"]["rate"], 0)
+
+    # Перевірка запису статистики у JSON та CSV
+    def test_dump(self):
+        PROFILER.set_enabled(True)
+        PROFILER.record("view.draw", 250e-6)
+        statistics = {"handlers": PROFILER.summary(), "canvas_items": 3, "memory": DrawModel().memory_usage()}
+        with tempfile.TemporaryDirectory() as directory:
+            Profiler.dump(statistics, os.path.join(directory, "stats.json"))
+            Profiler.dump(statistics, os.path.join(directory, "stats.csv"))
+            with open(os.path.join(directory, "stats.json"), encoding="utf-8") as file:
+                self.assertEqual(json.load(file)["handlers"]["view.draw"]["count"], 1)
+            with open(os.path.join(directory, "stats.csv"), encoding="utf-8") as file:
+                rows = dict(line.strip().split(",") for line in file)
+        self.assertEqual(rows["view.draw.count"], "1")
+        self.assertEqual(rows["canvas_items"], "3")
+        self.assertEqual(rows["memory.layers"], str(1250 * 600 * 3))
+
+    # Перевірка накладки: вона вмикає вимірювання, оновлюється за таймером і зникає разом з ним
+    def test_overlay(self):
+        root = MagicMock()
+        view = DrawPresenter(root, DrawModel()).view
+        view.canvas = MagicMock()
+        view.canvas.bbox.return_value = (10, 10, 200, 60)
+        view.toggle_overlay()
+        self.assertTrue(PROFILER.enabled)
+        root.after.assert_called_with(view.overlay_interval, view.update_overlay)
+        self.assertIn("Елементів полотна", view.canvas.create_text.call_args[1]["text"])
+        view.toggle_overlay()
+        self.assertFalse(PROFILER.enabled)
+        view.canvas.delete.assert_called_with("overlay")
+
+
+# Набір тестів для запису та відтворення сеансів малювання
+
+
+class TestSession(unittest.TestCase):
+    # Метод для створення представлення з RecordingCanvas замість полотна
+    @staticmethod
+    def create_view():
+        view = DrawPresenter(MagicMock(), DrawModel()).view
+        view.canvas = RecordingCanvas()
+        view.line_width = MagicMock()
+        view.line_width.get.return_value = 4.0
+        return view
+
+    # Метод для подій жесту: натискання, рух через points і відпускання
+    @staticmethod
+    def gesture(points):
+        events = [SimpleNamespace(x=x, y=y) for x, y in points]
+        return [("press", events[0])] + [("motion", event) for event in events[1:]] + [("release", events[-1])]
+
+    # Перевірка запису: зміна інструмента пишеться перед натисканням і лише тоді, коли стан змінився
+    def test_record(self):
+        view = self.create_view()
+        recorder = SessionRecorder(view)
+        recorder.start()
+        self.assertEqual(view.canvas.bindtags(), (SessionRecorder.bindtag, "Canvas"))
+        handlers = {"press": view.start_drawing, "motion": view.draw, "release": view.end_drawing}
+        for kind, event in self.gesture([(50, 50), (60, 55), (70, 65)]) * 2:
+            recorder.record(kind, event)
+            handlers[kind](event)
+        view.set_tool("rectangle")
+        for kind, event in self.gesture([(100, 100), (150, 140)]):
+            recorder.record(kind, event)
+        events = recorder.stop()
+        self.assertEqual(view.canvas.bindtags(), ("Canvas",))
+        self.assertEqual([event["type"] for event in events],
+                         ["tool"] + ["press", "motion", "motion", "release"] * 2
+                         + ["tool", "press", "motion", "release"])
+        self.assertEqual(events[0], {"t": events[0]["t"], "type": "tool", "tool": "pencil", "width": 4.0,
+                                     "color": "black"})
+        self.assertEqual(events[-4]["tool"], "rectangle")
+        self.assertEqual([event["t"] for event in events], sorted(event["t"] for event in events))
+        with tempfile.TemporaryDirectory() as directory:
+            file_path = os.path.join(directory, "session.jsonl")
+            SessionRecorder.save(events, file_path)
+            self.assertEqual(SessionRecorder.load(file_path), events)
+            with open(file_path, "w", encoding="utf-8") as file:
+                file.write(json.dumps({"version": 99}) + "\n")
+            with self.assertRaises(ValueError):
+                SessionRecorder.load(file_path)
+
+    # Перевірка відтворення: записаний сеанс дає той самий растр, а підсумок розбитий за інструментами
+    def test_replay(self):
+        view = self.create_view()
+        recorder = SessionRecorder(view)
+        recorder.start()
+        handlers = {"press": view.start_drawing, "motion": view.draw, "release": view.end_drawing}
+        for tool, points in (("pencil", [(50, 50), (80, 60), (120, 90)]), ("oval", [(200, 200), (260, 240)]),
+                             ("eraser", [(60, 40), (70, 80)])):
+            view.set_tool(tool)
+            for kind, event in self.gesture(points):
+                recorder.record(kind, event)
+                handlers[kind](event)
+        view.presenter.model.flush()
+        replayed = self.create_view()
+        result = SessionReplayer(replayed).play(recorder.stop())
+        self.assertEqual(replayed.presenter.model.image.tobytes(), view.presenter.model.image.tobytes())
+        self.assertEqual(replayed.current_tool, "eraser")
+        self.assertEqual({tool: summary["count"] for tool, summary in result["tools"].items()},
+                         {"pencil": 4, "oval": 3, "eraser": 3})
+        self.assertEqual(result["canvas_items"], view.item_count())
+        self.assertIn("Елементів полотна: %d" % result["canvas_items"], "\n".join(SessionReplayer.report(result)))
+
+
+# Набір тестів для пакетного рендерингу сценаріїв без вікна
+
+
+class TestBatchRenderer(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    # Метод для запису сценарію у тимчасову теку; повертає шлях до файлу
+    def write_script(self, name, script):
+        file_path = os.path.join(self.directory.name, name)
+        with open(file_path, "w", encoding="utf-8") as file:
+            json.dump(script, file)
+        return file_path
+
+    # Перевірка, що сценарій дає той самий растр, що й жести мишею у вікні
+    def test_matches_view_gestures(self):
+        view = DrawPresenter(MagicMock(), DrawModel()).view
+        view.canvas = RecordingCanvas()
+        view.offset = 0
+        view.line_width = MagicMock()
+        view.line_width.get.return_value = 3.0
+        for tool, points in (("triangle", [(30, 40), (80, 90), (120, 100)]), ("pencil", [(200, 50), (240, 70),
+                                                                                          (260, 120)]),
+                             ("dashed_line", [(20, 300), (400, 320)]), ("oval", [(300, 200), (380, 260)])):
+            view.set_tool(tool)
+            events = [SimpleNamespace(x=x, y=y) for x, y in points]
+            view.start_drawing(events[0])
+            for event in events[1:]:
+                view.draw(event)
+            view.end_drawing(events[-1])
+        view.set_tool("fill")
+        view.fill_canvas(SimpleNamespace(x=75, y=85))
+        model = DrawModel()
+        render_ops(model, [{"tool": "triangle", "from": [30, 40], "to": [120, 100], "width": 3},
+                           {"tool": "pencil", "points": [[200, 50], [240, 70], [260, 120]], "width": 3},
+                           {"tool": "dashed_line", "from": [20, 300], "to": [400, 320], "width": 3},
+                           {"tool": "oval", "from": [300, 200], "to": [380, 260], "width": 3},
+                           {"tool": "fill", "at": [75, 85]}])
+        self.assertEqual(model.image.tobytes(), view.presenter.model.image.tobytes())
+        with self.assertRaises(ValueError):
+            render_ops(model, [{"tool": "brush"}])
+
+    # Перевірка назв файлів завдань і рендерингу: невдале завдання не зупиняє решту
+    def test_run(self):
+        jobs = BatchRenderer.load_jobs([
+            self.write_script("cards.json", [{"width": 64, "height": 32, "ops": []},
+                                             {"width": 64, "height": 32, "background": "black",
+                                              "ops": [{"tool": "fill", "at": [5, 5], "color": "red"}]}]),
+            self.write_script("single.json", {"width": 40, "height": 40, "output": "logo.jpg",
+                                              "ops": [{"tool": "text", "at": [20, 20], "text": "A"}]}),
+            self.write_script("broken.json", {"ops": [{"tool": "rectangle", "from": [0, 0]}]}),
+        ], image_format="gif")
+        self.assertEqual([job["output"] for job in jobs], ["cards_00000.gif", "cards_00001.gif", "logo.jpg",
+                                                           "broken.gif"])
+        output_dir = os.path.join(self.directory.name, "out")
+        results = [result for chunk in BatchRenderer(workers=1, chunk_size=2).run(jobs, output_dir)
+                   for result in chunk]
+        self.assertEqual([error is None for _, _, error in results], [True, True, True, False])
+        self.assertIn("KeyError", results[-1][2])
+        with Image.open(os.path.join(output_dir, "cards_00001.gif")) as image:
+            self.assertEqual(image.size, (64, 32))
+            self.assertEqual(image.convert("RGB").getpixel((5, 5)), (255, 0, 0))
+        self.assertFalse(os.path.exists(os.path.join(output_dir, "broken.gif")))
+        with self.assertRaises(ValueError):
+            BatchRenderer.load_jobs([self.write_script("bad.json", {"output": "bad.bmp", "ops": []})])
+
+    # Перевірка командного рядка: прогрес пишеться у stderr, а код виходу повідомляє про помилки
+    def test_main(self):
+        script = self.write_script("scene.json", {"width": 50, "height": 50, "ops": [
+            {"tool": "sprayer", "points": [[25, 25]], "color": "blue", "width": 2}]})
+        output_dir = os.path.join(self.directory.name, "out")
+        stderr = io.StringIO()
+        with redirect_stderr(stderr):
+            self.assertEqual(main([script, "-o", output_dir, "-j", "1"]), 0)
+            self.assertEqual(main([self.write_script("broken.json", {"ops": [{"tool": "brush"}]}),
+                                   "-o", output_dir, "-j", "1"]), 1)
+        self.assertIn("[1/1]", stderr.getvalue())
+        self.assertIn("broken.png: ValueError", stderr.getvalue())
+        # Розпилювач має стале зерно, тож повторний рендеринг дає той самий файл
+        with redirect_stderr(io.StringIO()):
+            main([script, "-o", self.directory.name, "-j", "1"])
+        with Image.open(os.path.join(output_dir, "scene.png")) as first, \
+                Image.open(os.path.join(self.directory.name, "scene.png")) as second:
+            self.assertEqual(first.size, (50, 50))
+            self.assertEqual(first.tobytes(), second.tobytes())
+
+
+# Набір тестів для класу ExportPipeline
+
+
+class TestExportPipeline(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    # Перевірка потокового PNG: смуги будь-якої висоти дають ті самі пікселі для всіх кількостей каналів
+    def test_write_png(self):
+        rng = np.random.default_rng(4)
+        for shape in ((37, 53), (37, 53, 2), (37, 53, 3), (37, 53, 4)):
+            pixels = rng.integers(0, 256, size=shape, dtype=np.uint8)
+            buffer = io.BytesIO()
+            write_png(buffer, pixels.reshape(37, 53, -1), strip_height=10)
+            self.assertTrue((np.asarray(Image.open(buffer)) == pixels).all(), shape)
+
+    # Перевірка палітри для GIF: палітра будується з вибірки, пікселі переводяться смугами, а похибка кольорів
+    # не більша, ніж у квантувача на всьому зображенні
+    def test_palette_image(self):
+        rng = np.random.default_rng(6)
+        colors = rng.integers(0, 256, size=(40, 3), dtype=np.uint8)
+        pixels = np.zeros((90, 70, 4), dtype=np.uint8)
+        pixels[..., :3] = colors[rng.integers(0, len(colors), size=(90, 70))]
+        image = palette_image(pixels, strip_height=16, sample=500)
+        self.assertEqual((image.mode, image.size), ("P", (70, 90)))
+        whole = Image.fromarray(pixels[..., :3].copy()).quantize(256, method=Image.Quantize.FASTOCTREE)
+        error = np.abs(np.asarray(image.convert("RGB"), dtype=int) - pixels[..., :3]).max()
+        self.assertLessEqual(error, np.abs(np.asarray(whole.convert("RGB"), dtype=int) - pixels[..., :3]).max())
+
+    # Перевірка невдалого експорту: назовні виходить справжня помилка запису чи кодування, а не BufferError
+    # закриття спільної пам'яті, і тимчасовий файл не лишається
+    def test_output_failure(self):
+        from multiprocessing import shared_memory
+        shape = (40, 60, 4)
+        memory = shared_memory.SharedMemory(create=True, size=40 * 60 * 4)
+        try:
+            options = {"strip_height": 16, "jpeg_quality": 90, "thumbnail_size": 16}
+            for kind in ExportPipeline.outputs:
+                with self.assertRaises(FileNotFoundError):
+                    export_output(memory.name, shape, kind, "/nonexistent_dir/picture", options)
+            # Неправильна якість ламає кодування JPEG, коли знімок уже переданий кодувальнику PIL
+            path = os.path.join(self.directory.name, "picture.jpg")
+            with self.assertRaises(ValueError):
+                export_output(memory.name, shape, "jpeg", path, dict(options, jpeg_quality="unknown"))
+            self.assertEqual(os.listdir(self.directory.name), [])
+        finally:
+            memory.close()
+            memory.unlink()
+
+    # Перевірка експорту в усі формати з одного знімка; знімок звільняється після експорту
+    def test_run(self):
+        model = DrawModel(300, 200)
+        model.draw_oval(20, 20, 200, 150, "red", 4)
+        model.fill_area(100, 80, "blue")
+        pipeline = ExportPipeline(workers=2, strip_height=64, thumbnail_size=64)
+        try:
+            snapshot = pipeline.snapshot(model)
+            model.fill_area(100, 80, "green")
+            paths = pipeline.run(snapshot, os.path.join(self.directory.name, "picture"), list(ExportPipeline.outputs))
+        finally:
+            pipeline.shutdown()
+        self.assertEqual(sorted(os.listdir(self.directory.name)),
+                         ["picture.gif", "picture.jpg", "picture.png", "picture_thumb.png"])
+        with Image.open(paths["png"]) as image:
+            self.assertEqual(image.getpixel((100, 80)), (0, 0, 255))
+            expected = np.asarray(image)
+        with Image.open(paths["jpeg"]) as image:
+            self.assertLess(np.abs(np.asarray(image, dtype=int) - expected).mean(), 3)
+        with Image.open(paths["gif"]) as image:
+            self.assertEqual(image.mode, "P")
+            self.assertEqual(image.convert("RGB").getpixel((100, 80)), (0, 0, 255))
+        with Image.open(paths["thumbnail"]) as image:
+            self.assertEqual(image.size, (64, 43))
+        self.assertFalse(pipeline.snapshots)
+
+
+# Набір тестів для класу ImageIOWorker
+
+
+class TestImageIOWorker(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.root = MagicMock()
+        self.observer = MagicMock()
+        self.worker = ImageIOWorker(self.root, self.observer)
+
+    def tearDown(self):
+        self.worker.shutdown()
+        self.directory.cleanup()
+
+    # Опитування черги результатів, доки не завершаться всі завдання
+    def drain(self, timeout=30):
+        deadline = time.monotonic() + timeout
+        while self.worker.tasks and time.monotonic() < deadline:
+            time.sleep(0.01)
+            self.worker.poll()
+        self.assertFalse(self.worker.tasks)
+
+    # Перевірка фонового збереження та відкриття зображення
+    def test_save_and_open(self):
+        file_path = os.path.join(self.directory.name, "image.png")
+        image = Image.new("RGB", (80, 60), "red")
+        saved = MagicMock()
+        self.worker.save_image(image, file_path, saved)
+        self.root.after.assert_called_once()
+        self.drain()
+        saved.assert_called_once_with(file_path)
+        self.observer.task_finished.assert_called_once()
+        self.assertEqual(os.listdir(self.directory.name), ["image.png"])
+        opened = MagicMock()
+        self.worker.open_image(file_path, 40, 40, opened)
+        self.drain()
+        # Більше за 40 x 40 зображення не зменшується, а готується до редагування в повному розмірі
+        tiled = opened.call_args[0][0]
+        self.assertIsInstance(tiled, TiledImage)
+        self.assertEqual((tiled.image.size, tiled.image.getpixel((79, 59))), ((80, 60), (255, 0, 0)))
+        self.assertEqual(self.observer.task_progress.call_args[0][1], 1)
+
+    # Перевірка, що помилка в on_done завершує завдання зі статусом "error", а решта завдань далі опитується
+    def test_on_done_error(self):
+        file_path = os.path.join(self.directory.name, "image.png")
+        Image.new("RGB", (20, 10), "red").save(file_path)
+        error = ValueError("broken")
+        failing = self.worker.open_image(file_path, 40, 40, MagicMock(side_effect=error))
+        opened = MagicMock()
+        self.worker.open_image(file_path, 40, 40, opened)
+        self.drain()
+        self.observer.task_finished.assert_any_call(failing, "error", error)
+        opened.assert_called_once()
+        self.assertEqual(self.observer.task_finished.call_count, 2)
+
+    # Перевірка, що пул процесів створює потік, який ставить збереження в чергу, і два збереження ділять один пул
+    def test_saves_share_pool(self):
+        image = Image.new("RGB", (80, 60), "red")
+        self.worker.save_image(image, os.path.join(self.directory.name, "first.png"), MagicMock())
+        pool = self.worker.processes
+        self.assertIsNotNone(pool)
+        self.worker.save_image(image, os.path.join(self.directory.name, "second.jpg"), MagicMock())
+        self.assertIs(self.worker.processes, pool)
+        self.drain()
+        self.assertEqual(sorted(os.listdir(self.directory.name)), ["first.png", "second.jpg"])
+
+    # Перевірка скасування завдання, яке ще чекає у черзі
+    def test_cancel(self):
+        started = MagicMock()
+        self.worker.threads.submit(time.sleep, 0.2)
+        self.worker.threads.submit(time.sleep, 0.2)
+        task = self.worker.submit("open", "Відкриття", lambda task: task.report(0), started)
+        self.worker.cancel("open")
+        self.drain()
+        started.assert_not_called()
+        self.observer.task_finished.assert_called_once_with(task, "cancelled", None)
+
+    # Перевірка передачі помилки у головний потік
+    def test_error(self):
+        self.worker.open_image(os.path.join(self.directory.name, "missing.png"), 40, 40, MagicMock())
+        self.drain()
+        self.assertEqual(self.observer.task_finished.call_args[0][1], "error")
+        self.assertIsInstance(self.observer.task_finished.call_args[0][2], FileNotFoundError)
 
 
 if __name__ == "__main__":